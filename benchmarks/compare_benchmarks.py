@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Compares a run of the benchmark suite against a baseline run from the benchmark history.
+
+A case counts as a regression when its throughput (triangles written per second) drops or its peak memory
+grows by more than the noise of its repeated runs allows. The noise band of a case is --sigma standard
+errors of the difference between the two medians, but never less than --min-change. Exits with 1 if any
+case regressed, so it can gate the adoption of a new release:
+    python benchmarks/compare_benchmarks.py --baseline 1a2b3c4 --current -1
+
+The runs are picked by their id, the start of their git commit or a negative index (-1 is the newest).
+By default the newest run is compared against the run before it on the same machine.
+"""
+
+import argparse
+import json
+import math
+import statistics
+import sys
+
+from history import DEFAULT_HISTORY_PATH, find_record, load_records
+
+# Compared measurements and whether bigger values are better
+METRICS = {
+    "triangles_per_s": True,
+    "peak_memory_mb": False,
+}
+
+
+def case_key(case):
+    return case["scenario"], case["format"], case["engine"]
+
+
+def standard_error(values):
+    if len(values) < 2:
+        return 0.0
+    return statistics.stdev(values) / math.sqrt(len(values))
+
+
+def compare_metric(baseline_values, current_values, higher_is_better, sigma, min_change):
+    """Returns the comparison of one measurement of a case between the two runs."""
+    baseline = statistics.median(baseline_values)
+    current = statistics.median(current_values)
+    if baseline == 0:
+        return None
+
+    change = (current - baseline) / baseline
+    noise = sigma * math.hypot(standard_error(baseline_values), standard_error(current_values)) / abs(baseline)
+    threshold = max(min_change, noise)
+
+    # Positive when the case got better
+    gain = change if higher_is_better else -change
+    if gain < -threshold:
+        verdict = "regression"
+    elif gain > threshold:
+        verdict = "improvement"
+    else:
+        verdict = "unchanged"
+
+    return {
+        "baseline": baseline,
+        "current": current,
+        "change": change,
+        "threshold": threshold,
+        "verdict": verdict,
+    }
+
+
+def compare_runs(baseline, current, sigma=3.0, min_change=0.05):
+    """Compares every case the two runs have in common. Returns the comparisons and the cases missing from either run."""
+    baseline_cases = {case_key(case): case for case in baseline["cases"] if "error" not in case}
+    current_cases = {case_key(case): case for case in current["cases"] if "error" not in case}
+
+    comparisons = []
+    for key in sorted(baseline_cases.keys() & current_cases.keys()):
+        for metric, higher_is_better in METRICS.items():
+            baseline_values = [run[metric] for run in baseline_cases[key].get("runs", []) if run.get(metric) is not None]
+            current_values = [run[metric] for run in current_cases[key].get("runs", []) if run.get(metric) is not None]
+            if not baseline_values or not current_values:
+                continue
+
+            comparison = compare_metric(baseline_values, current_values, higher_is_better, sigma, min_change)
+            if comparison is not None:
+                comparisons.append({"scenario": key[0], "format": key[1], "engine": key[2], "metric": metric,
+                                    **comparison})
+
+    missing = {
+        "baseline_only": [list(key) for key in sorted(baseline_cases.keys() - current_cases.keys())],
+        "current_only": [list(key) for key in sorted(current_cases.keys() - baseline_cases.keys())],
+    }
+    return comparisons, missing
+
+
+def default_baseline(records, current):
+    """Returns the newest run before the current one that was made on the same machine."""
+    fingerprint = current.get("machine", {}).get("fingerprint")
+    older = records[:records.index(current)]
+    for record in reversed(older):
+        if record.get("machine", {}).get("fingerprint") == fingerprint:
+            return record
+    return None
+
+
+def describe(record):
+    commit = (record.get("commit") or "unknown")[:10]
+    dirty = " (with uncommitted changes)" if record.get("dirty") else ""
+    return f"{record.get('id')} at {commit}{dirty}, engine {record.get('engine_version')}"
+
+
+def print_report(baseline, current, comparisons, missing):
+    print(f"Baseline: {describe(baseline)}")
+    print(f"Current:  {describe(current)}")
+
+    if baseline.get("machine", {}).get("fingerprint") != current.get("machine", {}).get("fingerprint"):
+        print("WARNING: the runs were made on different machines, the differences may not come from the code.")
+    if baseline.get("options") != current.get("options"):
+        print("WARNING: the runs were made with different options.")
+
+    print()
+    print(f"{'scenario':<22}{'format':<8}{'engine':<11}{'metric':<17}{'baseline':>12}{'current':>12}{'change':>9}{'noise':>8}  verdict")
+    for comparison in comparisons:
+        print(f"{comparison['scenario']:<22}{comparison['format']:<8}{comparison['engine']:<11}{comparison['metric']:<17}"
+              f"{comparison['baseline']:>12.4g}{comparison['current']:>12.4g}"
+              f"{comparison['change']:>+9.1%}{comparison['threshold']:>8.1%}  {comparison['verdict']}")
+
+    for key in missing["baseline_only"]:
+        print(f"Only in the baseline: {' '.join(key)}")
+    for key in missing["current_only"]:
+        print(f"Only in the current run: {' '.join(key)}")
+
+    regressions = [comparison for comparison in comparisons if comparison["verdict"] == "regression"]
+    print()
+    print(f"{len(regressions)} regression(s) in {len(comparisons)} comparison(s).")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--history", default=DEFAULT_HISTORY_PATH, help="JSON lines file of the benchmark runs")
+    parser.add_argument("--baseline", help="run to compare against (defaults to the previous run on the same machine)")
+    parser.add_argument("--current", default="-1", help="run to compare (defaults to the newest one)")
+    parser.add_argument("--sigma", type=float, default=3.0,
+                        help="number of standard errors a difference has to exceed to count")
+    parser.add_argument("--min-change", type=float, default=0.05,
+                        help="smallest relative difference that counts, whatever the noise")
+    parser.add_argument("--json", action="store_true", help="print the comparison as JSON")
+    args = parser.parse_args(argv)
+
+    records = load_records(args.history)
+    current = find_record(records, args.current)
+    if current is None:
+        print(f"Couldn't find the run {args.current} in {args.history}", file=sys.stderr)
+        return 2
+
+    baseline = find_record(records, args.baseline) if args.baseline else default_baseline(records, current)
+    if baseline is None:
+        print("Couldn't find a baseline run to compare against", file=sys.stderr)
+        return 2
+
+    comparisons, missing = compare_runs(baseline, current, args.sigma, args.min_change)
+
+    if args.json:
+        print(json.dumps({
+            "baseline": baseline["id"],
+            "current": current["id"],
+            "same_machine": baseline.get("machine", {}).get("fingerprint") == current.get("machine", {}).get("fingerprint"),
+            "comparisons": comparisons,
+            **missing,
+        }, indent=2))
+    else:
+        print_report(baseline, current, comparisons, missing)
+
+    return 1 if any(comparison["verdict"] == "regression" for comparison in comparisons) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+
+Local history of the benchmark results.
+Every run of the suite is appended to a JSON lines file as one record, stamped with the git commit
+of the plugin and a fingerprint of the machine, so that later runs can be compared against it.
+"""
+
+import datetime
+import hashlib
+import json
+import os
+import platform
+import subprocess
+
+DEFAULT_HISTORY_PATH = os.path.join(os.path.expanduser("~"), ".cache", "stl_generator", "benchmark_history.jsonl")
+
+
+def git_commit(folder):
+    """Returns the commit the folder is checked out at and whether it has uncommitted changes."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=folder, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=folder,
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        # Installed copies of the plugin aren't git checkouts
+        return {"commit": None, "dirty": None}
+
+    return {"commit": commit, "dirty": bool(status)}
+
+
+def total_memory_bytes():
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def machine_fingerprint():
+    """
+    Describes the hardware and system the benchmarks ran on.
+    Only results with the same fingerprint can be compared reliably.
+    """
+    machine = {
+        "system": platform.system(),
+        "release": platform.release(),
+        "machine": platform.machine(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "memory_bytes": total_memory_bytes(),
+        "python": platform.python_version(),
+    }
+    machine["fingerprint"] = hashlib.sha256(json.dumps(machine, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+    return machine
+
+
+def append_record(results, plugin_dir, path=DEFAULT_HISTORY_PATH):
+    """Appends the results of a run to the history and returns the stored record."""
+    record = {
+        "id": datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%S.%fZ"),
+        **git_commit(plugin_dir),
+        "machine": machine_fingerprint(),
+        **results,
+    }
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, sort_keys=True) + "\n")
+
+    return record
+
+
+def load_records(path=DEFAULT_HISTORY_PATH):
+    """Returns the records of the history from the oldest to the newest. Lines that can't be parsed are skipped."""
+    records = []
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+    except OSError:
+        return []
+
+    return records
+
+
+def find_record(records, reference):
+    """
+    Returns the record the reference points at, or None if there isn't one.
+    The reference is either a record id, the start of a git commit (the newest run of it is used)
+    or a negative index counting back from the newest record (-1 is the newest).
+    """
+    try:
+        index = int(reference)
+        if index < 0:
+            return records[index] if -index <= len(records) else None
+    except ValueError:
+        pass
+
+    for record in reversed(records):
+        if record.get("id") == reference:
+            return record
+    for record in reversed(records):
+        if record.get("commit") and record["commit"].startswith(reference):
+            return record
+    return None
@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+Benchmarks the mesh generator on synthetic DEMs and on the DEMs bundled with the tests.
+
+Runs without QGIS, only NumPy and the GDAL Python bindings are needed.
+Every case (a DEM, an output format and an engine) runs in a fresh worker process, so the peak memory
+of one case doesn't hide the next one's and nothing stays cached between them. Each case times
+generate_height_array() and the writing of the model, and records the peak memory of the worker
+and the number of triangles written per second.
+
+The results are printed as JSON (or written to --output), with a summary table on stderr:
+    python benchmarks/run_benchmarks.py --sizes 1024 2048 --patterns full ring --repeat 3
+
+Every run is also appended to the benchmark history (see history.py), which compare_benchmarks.py
+compares the runs from.
+"""
+
+import argparse
+import datetime
+import importlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from history import DEFAULT_HISTORY_PATH, append_record
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE = os.path.basename(PLUGIN_DIR)
+
+# Version of the layout of the results, bumped whenever a field is renamed or its meaning changes
+RESULTS_VERSION = 1
+
+DEFAULT_SIZES = [1024, 2048, 4096, 8192, 16384]
+
+# Engines every case can be generated with
+# "serial" and "pipelined" are the Python engine without and with its stages overlapped,
+# "dll" is the C++ engine of the MeshGenerator library, which only writes binary STLs
+ENGINES = ["pipelined", "serial", "dll"]
+
+# Engines run when --engines isn't given. The library isn't part of the repository and has to be built first,
+# so the dll engine is only run when it's asked for
+DEFAULT_ENGINES = ["pipelined", "serial"]
+
+# DEMs bundled with the tests, relative to the plugin folder
+BUNDLED_DEMS = [
+    os.path.join("test", "tenbytenraster.asc"),
+    os.path.join("test", "test_rasters", "north-east_africa.npy"),
+]
+
+LINE_WIDTH = 0.4
+
+# Measurements kept for every single run of a case
+SAMPLE_KEYS = ("read_s", "write_s", "total_s", "triangles_per_s", "peak_memory_mb")
+
+
+def import_engine():
+    # The plugin folder is imported as a package, the same way QGIS does it
+    sys.path.insert(0, os.path.dirname(PLUGIN_DIR))
+    return importlib.import_module(f"{PACKAGE}.mesh_generator")
+
+
+def peak_memory_mb():
+    """Returns the peak resident memory of this process in MB, or None if it can't be found out."""
+    try:
+        import resource
+    except ImportError:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports the size in kB, macOS in bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_case(case):
+    """Generates the model of a single case and returns its measurements. Runs inside of the worker process."""
+    mesh_generator_module = import_engine()
+    from osgeo import gdal
+
+    dataset = gdal.Open(case["dem"])
+    width, height = dataset.RasterXSize, dataset.RasterYSize
+    dataset = None
+
+    output_format = "stl" if case["engine"] == "dll" else case["format"]
+    output_path = os.path.join(case["output_dir"], "model" + mesh_generator_module.OUTPUT_FORMATS[output_format].extension)
+
+    # Size the print bed so the DEM is meshed at its full resolution
+    parameters = {
+        "printHeight": 20,
+        "baseHeight": 2,
+        "saveLocation": output_path,
+        "bedX": width * LINE_WIDTH,
+        "bedY": height * LINE_WIDTH,
+        "lineWidth": LINE_WIDTH,
+        "outputFormat": output_format,
+        "useCache": False,
+        "pipelined": case["engine"] == "pipelined",
+    }
+
+    baseline_memory = peak_memory_mb()
+    mesh_generator = mesh_generator_module.MeshGenerator()
+
+    start = time.perf_counter()
+    mesh_generator.generate_height_array(parameters, case["dem"])
+    read_seconds = time.perf_counter() - start
+
+    # A memory mapped grid is released once the model is written
+    grid = [int(dim) for dim in mesh_generator.array.shape]
+
+    start = time.perf_counter()
+    if case["engine"] == "dll":
+        mesh_generator.dll_write_stl()
+        with open(output_path, "rb") as f:
+            f.seek(80)
+            triangles = int.from_bytes(f.read(4), "little")
+    else:
+        mesh_generator.manually_generate_stl()
+        triangles = mesh_generator.numTriangles
+    write_seconds = time.perf_counter() - start
+
+    output_bytes = os.path.getsize(output_path)
+    os.remove(output_path)
+
+    return {
+        "grid": grid,
+        "read_s": read_seconds,
+        "write_s": write_seconds,
+        "total_s": read_seconds + write_seconds,
+        "triangles": triangles,
+        "triangles_per_s": triangles / write_seconds if write_seconds > 0 else None,
+        "output_bytes": output_bytes,
+        "baseline_memory_mb": baseline_memory,
+        "peak_memory_mb": peak_memory_mb(),
+        "stage_s": mesh_generator.stageTimings,
+        "stage_utilisation": mesh_generator.stageUtilisation,
+    }
+
+
+def worker_main(case_json):
+    try:
+        result = {"ok": True, **run_case(json.loads(case_json))}
+    except Exception as e:
+        result = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+    print(json.dumps(result))
+
+
+def spawn_case(case):
+    """Runs the case in a fresh interpreter and returns its measurements."""
+    process = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--worker", json.dumps(case)],
+        capture_output=True, text=True,
+    )
+
+    lines = process.stdout.strip().splitlines()
+    if process.returncode != 0 or not lines:
+        # The DLL engine takes the whole process down if it fails
+        return {"ok": False, "error": f"The worker exited with code {process.returncode}: {process.stderr.strip()[-500:]}"}
+
+    return json.loads(lines[-1])
+
+
+def collect_dems(args):
+    """Returns the (scenario name, path) of every DEM to benchmark, writing the synthetic ones if needed."""
+    from synthetic_dems import convert_array, write_synthetic_dem
+
+    dems = []
+    for size in args.sizes:
+        for pattern in args.patterns:
+            print(f"Preparing the {pattern} DEM of {size}x{size} pixels...", file=sys.stderr)
+            dems.append((f"{pattern}-{size}", write_synthetic_dem(args.data_dir, pattern, size)))
+
+    if not args.skip_bundled:
+        for relative_path in BUNDLED_DEMS:
+            path = os.path.join(PLUGIN_DIR, relative_path)
+            if not os.path.exists(path):
+                print(f"Skipping the bundled DEM {relative_path}, it doesn't exist.", file=sys.stderr)
+                continue
+            if path.endswith(".npy"):
+                path = convert_array(path, args.data_dir)
+            dems.append((os.path.splitext(os.path.basename(relative_path))[0], path))
+
+    return dems
+
+
+def environment():
+    import numpy as np
+    from osgeo import gdal
+
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "gdal": gdal.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor() or platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def summarize(samples):
+    """Combines the repeated samples of a case into the medians of its measurements."""
+    summary = {"samples": len(samples)}
+    for key in SAMPLE_KEYS:
+        values = [sample[key] for sample in samples if sample.get(key) is not None]
+        if values:
+            summary[key] = statistics.median(values)
+    summary["triangles"] = samples[0]["triangles"]
+    summary["output_bytes"] = samples[0]["output_bytes"]
+    summary["grid"] = samples[0]["grid"]
+    return summary
+
+
+def print_table(cases):
+    print(f"{'scenario':<22}{'format':<8}{'engine':<11}{'read s':>9}{'write s':>9}{'Mtri/s':>9}{'peak MB':>9}",
+          file=sys.stderr)
+    for case in cases:
+        if "error" in case:
+            print(f"{case['scenario']:<22}{case['format']:<8}{case['engine']:<11}  failed: {case['error']}", file=sys.stderr)
+            continue
+        rate = case.get("triangles_per_s")
+        memory = case.get("peak_memory_mb")
+        print(f"{case['scenario']:<22}{case['format']:<8}{case['engine']:<11}"
+              f"{case['read_s']:>9.2f}{case['write_s']:>9.2f}"
+              f"{rate / 1e6 if rate else float('nan'):>9.2f}{memory if memory else float('nan'):>9.0f}",
+              file=sys.stderr)
+
+
+def parse_arguments(argv=None):
+    sys.path.insert(0, os.path.dirname(PLUGIN_DIR))
+    mesh_formats = list(importlib.import_module(f"{PACKAGE}.output_formats").OUTPUT_FORMATS)
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="sides (in pixels) of the synthetic DEMs")
+    parser.add_argument("--patterns", nargs="+", default=["full", "ring", "checkerboard", "coastline"],
+                        help="no data patterns of the synthetic DEMs")
+    parser.add_argument("--formats", nargs="+", default=mesh_formats, choices=mesh_formats,
+                        help="output formats written by the pipelined engine")
+    parser.add_argument("--engines", nargs="+", default=DEFAULT_ENGINES, choices=ENGINES,
+                        help="engines the STLs are written with, dll needs the MeshGenerator library to be built")
+    parser.add_argument("--repeat", type=int, default=3, help="number of times every case is run")
+    parser.add_argument("--skip-bundled", action="store_true", help="leave out the DEMs bundled with the tests")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "stl_generator_benchmarks"),
+                        help="folder the synthetic DEMs are written to (and reused from)")
+    parser.add_argument("--output", help="file the JSON results are written to instead of stdout")
+    parser.add_argument("--history", default=DEFAULT_HISTORY_PATH, help="JSON lines file the run is appended to")
+    parser.add_argument("--no-history", action="store_true", help="don't append the run to the history")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def run_suite(args):
+    dems = collect_dems(args)
+
+    # Only STLs are written with every engine, the other formats are only written by the default one
+    combinations = [(output_format, "pipelined") for output_format in args.formats if "pipelined" in args.engines]
+    combinations += [("stl", engine) for engine in args.engines if engine != "pipelined"]
+
+    cases = []
+    with tempfile.TemporaryDirectory() as output_dir:
+        for scenario, dem in dems:
+            for output_format, engine in combinations:
+                case = {"dem": dem, "format": output_format, "engine": engine, "output_dir": output_dir}
+                print(f"Running {scenario} as {output_format} with the {engine} engine...", file=sys.stderr)
+
+                samples = [spawn_case(case) for _ in range(args.repeat)]
+                failures = [sample for sample in samples if not sample["ok"]]
+
+                result = {"scenario": scenario, "dem": dem, "format": output_format, "engine": engine}
+                if failures:
+                    result["error"] = failures[0]["error"]
+                else:
+                    result.update(summarize(samples))
+                    result["runs"] = [{key: sample[key] for key in SAMPLE_KEYS} for sample in samples]
+                cases.append(result)
+
+    return {
+        "version": RESULTS_VERSION,
+        "started": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "engine_version": import_engine().ENGINE_VERSION,
+        "environment": environment(),
+        "options": {
+            "repeat": args.repeat,
+            "line_width": LINE_WIDTH,
+            "sizes": args.sizes,
+            "patterns": args.patterns,
+            "formats": args.formats,
+            "engines": args.engines,
+        },
+        "cases": cases,
+    }
+
+
+def main(argv=None):
+    args = parse_arguments(argv)
+    if args.worker:
+        worker_main(args.worker)
+        return 0
+
+    results = run_suite(args)
+    print_table(results["cases"])
+
+    if not args.no_history:
+        record = append_record(results, PLUGIN_DIR, args.history)
+        print(f"Saved the run as {record['id']} in {args.history}", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+    return 1 if any("error" in case for case in results["cases"]) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+import math
+import os
+
+import numpy as np
+from osgeo import gdal
+
+
+NO_DATA_VALUE = -9999.0
+
+# Bumped whenever the generated DEMs change, so the DEMs written by an older version aren't reused
+VERSION = 1
+
+# Number of rows generated and written at once, which keeps even the largest DEMs out of memory
+BLOCK_ROWS = 512
+
+
+def terrain(rows, columns, size):
+    """
+    Returns the heights of the given rows and columns of a smooth, hilly terrain of size by size pixels.
+    The terrain is the same for every size, only sampled more finely.
+    """
+    y = rows[:, None] / size
+    x = columns[None, :] / size
+    return (
+        1000
+        + 400 * np.sin(2 * math.pi * 3 * x) * np.cos(2 * math.pi * 2 * y)
+        + 150 * np.sin(2 * math.pi * 11 * (x + y))
+        + 40 * np.cos(2 * math.pi * 37 * x * y)
+    ).astype(np.float32)
+
+
+def full_mask(rows, columns, size):
+    """Every pixel is valid."""
+    return np.ones((len(rows), len(columns)), dtype=bool)
+
+
+def ring_mask(rows, columns, size):
+    """Only a thick ring around the centre is valid, so the model has an outer and an inner wall."""
+    y = rows[:, None] / size - 0.5
+    x = columns[None, :] / size - 0.5
+    radius = np.sqrt(x * x + y * y)
+    return (radius > 0.2) & (radius < 0.45)
+
+
+def checkerboard_mask(rows, columns, size):
+    """Square holes on a regular grid, 32 by 32 of them whatever the size of the DEM."""
+    cell = max(2, size // 32)
+    return ((rows[:, None] // (cell // 2)) % 2 == 0) | ((columns[None, :] // (cell // 2)) % 2 == 0)
+
+
+def coastline_mask(rows, columns, size):
+    """Thin winding strips of land a few pixels wide, which makes the most walls per valid pixel."""
+    y = rows[:, None] / size
+    x = columns[None, :] / size
+    field = np.sin(2 * math.pi * (5 * x + 0.7 * np.sin(2 * math.pi * 3 * y))) * np.cos(2 * math.pi * 4 * y)
+    width = 3.0 / size
+    return np.abs(field) < width * 2 * math.pi * 5
+
+
+PATTERNS = {
+    "full": full_mask,
+    "ring": ring_mask,
+    "checkerboard": checkerboard_mask,
+    "coastline": coastline_mask,
+}
+
+
+def dem_path(folder, pattern, size):
+    return os.path.join(folder, f"synthetic_{pattern}_{size}_v{VERSION}.tif")
+
+
+def write_synthetic_dem(folder, pattern, size):
+    """
+    Writes a size by size GeoTIFF with the given no data pattern into the folder, unless it's already there.
+    Returns the path of the DEM.
+    """
+    path = dem_path(folder, pattern, size)
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(folder, exist_ok=True)
+    temp_path = path + ".part.tif"
+
+    driver = gdal.GetDriverByName("GTiff")
+    dataset = driver.Create(temp_path, size, size, 1, gdal.GDT_Float32,
+                            options=["TILED=YES", "COMPRESS=DEFLATE", "PREDICTOR=3", "BIGTIFF=IF_SAFER"])
+    dataset.SetGeoTransform((0, 30, 0, 0, 0, -30))
+    band = dataset.GetRasterBand(1)
+    band.SetNoDataValue(NO_DATA_VALUE)
+
+    columns = np.arange(size)
+    for start in range(0, size, BLOCK_ROWS):
+        rows = np.arange(start, min(start + BLOCK_ROWS, size))
+        heights = terrain(rows, columns, size)
+        heights[~PATTERNS[pattern](rows, columns, size)] = NO_DATA_VALUE
+        band.WriteArray(heights, 0, start)
+
+    band.FlushCache()
+    dataset = None
+    os.replace(temp_path, path)
+
+    return path
+
+
+def convert_array(array_path, folder, no_data_value=NO_DATA_VALUE):
+    """Writes a NumPy array saved with np.save() as a GeoTIFF so GDAL can read it. Returns the path of the DEM."""
+    path = os.path.join(folder, os.path.splitext(os.path.basename(array_path))[0] + f"_v{VERSION}.tif")
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(folder, exist_ok=True)
+    array = np.load(array_path)
+
+    dataset = gdal.GetDriverByName("GTiff").Create(path, array.shape[1], array.shape[0], 1, gdal.GDT_Float64)
+    dataset.SetGeoTransform((0, 1, 0, 0, 0, -1))
+    band = dataset.GetRasterBand(1)
+    band.SetNoDataValue(no_data_value)
+    band.WriteArray(np.nan_to_num(array, nan=no_data_value))
+    dataset = None
+
+    return path
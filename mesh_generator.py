@@ -1,5 +1,10 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import ctypes
 from enum import Enum
+import gzip
+import hashlib
+import json
 from locale import normalize
 import math
 import os
@@ -7,14 +12,35 @@ from shutil import ExecError
 import platform
 import struct
 import sys
+import tempfile
+import threading
+import time
+import queue
+import zipfile
 import logging
 import logging.handlers
 
 import numpy as np
 from osgeo import gdal, ogr
 
-from qgis.core import QgsMessageLog
-from qgis.core import Qgis
+# The engine can also run outside of QGIS (e.g. in the benchmarks), its messages then only go to the log file
+try:
+    from qgis.core import QgsMessageLog
+    from qgis.core import Qgis
+except ImportError:
+    QgsMessageLog = None
+
+from .output_formats import OUTPUT_FORMATS
+
+
+# Version of the meshing engine. Stamped into the STL headers and part of the cache keys,
+# so it has to be bumped whenever a change to the engine changes the generated meshes
+ENGINE_VERSION = "1.2.0"
+
+# Parameters that don't affect the contents of the generated STL
+NON_MESH_PARAMETERS = {"saveLocation", "cacheDir", "useCache", "cacheMaxBytes", "compressionThreads", "validateMesh",
+                       "pipelined", "meshWorkers", "readQueueDepth", "writeQueueDepth", "outOfCore", "tempDir",
+                       "maxInMemoryBytes", "lazyRead"}
 
 
 class MeshGeneratorError(Exception):
@@ -58,7 +84,1247 @@ class NoValidPixelsError (MeshGeneratorError):
         super().__init__(self.message)
 
 
+class GenerationCanceledError (MeshGeneratorError):
+    def __init__(self, message="The generation of the model was canceled"):
+        self.message = message
+        super().__init__(self.message)
+
+
+# Define the numpy data type for the STL triangles
+STL_TRIANGLE_DTYPE = np.dtype([
+    ("normal",  np.float32, (3,)),
+    ("vertices", np.float32, (3,3,)),
+    ("attr",    np.uint16),
+], align=False)
+
+# The corners of the triangles generated for each of the cell masks as (dx, dy, is_bottom)
+# where (dx, dy) is the corner's offset from the top left vertex of the cell
+# and is_bottom tells if the corner is on the floor of the model instead of its surface
+TRIANGLE_TEMPLATES = [
+    # Surface and floor triangles
+    ("top_left", ((0, 0, False), (1, 0, False), (0, 1, False))),
+    ("top_left", ((0, 0, True), (0, 1, True), (1, 0, True))),
+    ("bottom_right", ((1, 0, False), (1, 1, False), (0, 1, False))),
+    ("bottom_right", ((1, 0, True), (0, 1, True), (1, 1, True))),
+    ("bottom_left", ((0, 0, False), (1, 1, False), (0, 1, False))),
+    ("bottom_left", ((0, 0, True), (0, 1, True), (1, 1, True))),
+    ("top_right", ((1, 0, False), (1, 1, False), (0, 0, False))),
+    ("top_right", ((1, 0, True), (0, 0, True), (1, 1, True))),
+
+    # Wall triangles
+    ("left_wall", ((0, 0, False), (0, 1, True), (0, 0, True))),
+    ("left_wall", ((0, 0, False), (0, 1, False), (0, 1, True))),
+    ("right_wall", ((1, 0, False), (1, 0, True), (1, 1, True))),
+    ("right_wall", ((1, 0, False), (1, 1, True), (1, 1, False))),
+    ("top_wall", ((0, 0, False), (0, 0, True), (1, 0, True))),
+    ("top_wall", ((0, 0, False), (1, 0, True), (1, 0, False))),
+    ("bottom_wall", ((0, 1, False), (1, 1, True), (0, 1, True))),
+    ("bottom_wall", ((0, 1, False), (1, 1, False), (1, 1, True))),
+    ("up_diag_wall", ((1, 0, False), (0, 1, False), (0, 1, True))),
+    ("up_diag_wall", ((1, 0, False), (0, 1, True), (1, 0, True))),
+    ("down_diag_wall", ((0, 0, False), (0, 0, True), (1, 1, True))),
+    ("down_diag_wall", ((0, 0, False), (1, 1, True), (1, 1, False))),
+]
+
+
+# The corners of the surface triangles of each of the cell masks
+SURFACE_TRIANGLES = {name: corners for name, corners in TRIANGLE_TEMPLATES[:8] if not corners[0][2]}
+
+# The ends of the straight walls of a cell as (dx, dy) offsets from its top left vertex
+STRAIGHT_WALLS = {
+    "left_wall": ((0, 0), (0, 1)),
+    "right_wall": ((1, 0), (1, 1)),
+    "top_wall": ((0, 0), (1, 0)),
+    "bottom_wall": ((0, 1), (1, 1)),
+}
+
+
+class MeshChunk:
+    """
+    A group of triangles generated from a window of the height grid.
+    Each corner of a triangle is described by its (x, y) position in the height grid,
+    its height and whether it is on the floor of the model.
+    """
+
+    def __init__(self, x, y, z, bottom):
+        self.x = x
+        self.y = y
+        self.z = z
+        self.bottom = bottom
+
+    def __len__(self):
+        return len(self.x)
+
+    # Yields consecutive slices of at most size triangles
+    def split(self, size):
+        for start in range(0, len(self), size):
+            stop = start + size
+            yield MeshChunk(self.x[start:stop], self.y[start:stop], self.z[start:stop], self.bottom[start:stop])
+
+    # Returns the (n, 3, 3) array of the triangle vertices in grid units
+    def vertices(self, origin=(0, 0)):
+        return np.stack([(self.x - origin[0]).astype(np.float32),
+                         (self.y - origin[1]).astype(np.float32),
+                         self.z], axis=2)
+
+
+class ArrayHeightSource:
+    """
+    Reads windows of a height grid that is already loaded in memory.
+    Everything outside of the grid is filled in with the no data value.
+    """
+
+    def __init__(self, array, no_data_value):
+        self.array = array
+        self.noDataValue = no_data_value
+        self.shape = array.shape
+
+    def window(self, y_start, y_stop, x_start, x_stop):
+        height, width = self.shape
+        window = np.full((y_stop - y_start, x_stop - x_start), self.noDataValue, dtype=self.array.dtype)
+
+        # Copy over the part of the window that overlaps with the grid
+        y0, y1 = max(y_start, 0), min(y_stop, height)
+        x0, x1 = max(x_start, 0), min(x_stop, width)
+        if y0 < y1 and x0 < x1:
+            window[y0 - y_start:y1 - y_start, x0 - x_start:x1 - x_start] = self.array[y0:y1, x0:x1]
+
+        return window
+
+
+class RasterHeightSource:
+    """
+    Reads windows of the transposed height grid straight from the raster band at the target resolution,
+    so that grids that don't fit in memory can still be meshed band by band.
+    The last window of raster rows that was read is kept around since neighbouring tiles share it.
+    """
+
+    def __init__(self, band, buf_xsize, buf_ysize, no_data_value, transform, check_canceled=None):
+        self.band = band
+        self.noDataValue = no_data_value
+        self.transform = transform
+
+        # Called every few rows so that reading a large window can be interrupted
+        self.checkCanceled = check_canceled or (lambda: None)
+
+        # The grid is transposed, so its rows are the columns of the raster
+        self.shape = (buf_xsize, buf_ysize)
+        self.cachedRange = None
+        self.cachedRows = None
+
+    # Returns the raster rows in [start, stop) resampled to the target resolution
+    def read_rows(self, start, stop):
+        if self.cachedRange == (start, stop):
+            return self.cachedRows
+
+        buf_xsize, buf_ysize = self.shape
+        rows = np.empty((stop - start, buf_xsize), dtype=np.float64)
+
+        # Rows that aren't resampled vertically map one to one to the raster rows, so they're read all at once
+        if buf_ysize == self.band.YSize:
+            self.checkCanceled()
+            rows[:] = self.band.ReadAsArray(0, start, self.band.XSize, stop - start,
+                                            buf_xsize=buf_xsize, buf_ysize=stop - start,
+                                            buf_type=gdal.GDT_Float64,
+                                            resample_alg=gdal.GRIORA_NearestNeighbour)
+        else:
+            for i, row in enumerate(range(start, stop)):
+                if i % 64 == 0:
+                    self.checkCanceled()
+
+                # Uses the same nearest neighbour sampling as reading the whole raster at the target resolution
+                source_row = min(int((row + 0.5) * self.band.YSize / buf_ysize), self.band.YSize - 1)
+                rows[i] = self.band.ReadAsArray(0, source_row, self.band.XSize, 1,
+                                                buf_xsize=buf_xsize, buf_ysize=1,
+                                                buf_type=gdal.GDT_Float64,
+                                                resample_alg=gdal.GRIORA_NearestNeighbour)[0]
+
+        self.cachedRange = (start, stop)
+        self.cachedRows = self.transform(rows)
+        return self.cachedRows
+
+    def window(self, y_start, y_stop, x_start, x_stop):
+        height, width = self.shape
+        window = np.full((y_stop - y_start, x_stop - x_start), self.noDataValue, dtype=np.float64)
+
+        y0, y1 = max(y_start, 0), min(y_stop, height)
+        x0, x1 = max(x_start, 0), min(x_stop, width)
+        if y0 < y1 and x0 < x1:
+            rows = self.read_rows(x0, x1)
+            window[y0 - y_start:y1 - y_start, x0 - x_start:x1 - x_start] = rows[:, y0:y1].T
+
+        return window
+
+
+class STLWriter:
+    """
+    Streams triangles into a binary STL file.
+    The number of triangles is filled into the header once the file is closed.
+    """
+
+    # The triangles don't depend on each other, so the chunks can be written in slices
+    splittable = True
+
+    def __init__(self, path, header, line_width, origin=(0, 0)):
+        self.path = path
+        self.lineWidth = line_width
+        self.origin = origin
+        self.numTriangles = 0
+
+        # The file is written under a temporary name and then moved into place,
+        # so a failed or canceled generation never leaves a half written STL behind
+        self.tempPath = path + ".part"
+        self.file = open(self.tempPath, "wb")
+
+        # Write the header of the binary STL and leave room for the number of triangles
+        self.file.write(header)
+        self.file.write(np.uint32(0).tobytes())
+
+    def write(self, chunk):
+        self.write_prepared(self.prepare(chunk))
+
+    # Turns the chunk into the data that gets written. Doesn't touch the file, so it can run on another thread
+    def prepare(self, chunk):
+        return self.triangles(chunk)
+
+    def write_prepared(self, triangles):
+        self.file.write(triangles.tobytes())
+        self.numTriangles += len(triangles)
+
+    # Returns the STL records of the chunk's triangles
+    def triangles(self, chunk):
+        triangles = np.empty(len(chunk), dtype=STL_TRIANGLE_DTYPE)
+        triangles["vertices"] = chunk.vertices(self.origin)
+        triangles["attr"] = 0
+
+        # Calculate normals
+        v0 = triangles["vertices"][:, 0]
+        v1 = triangles["vertices"][:, 1]
+        v2 = triangles["vertices"][:, 2]
+
+        normals = np.cross(v1 - v0, v2 - v0)
+        lengths = np.linalg.norm(normals, axis=1)
+
+        valid = lengths > 0
+        normals[valid] /= lengths[valid, None]
+
+        triangles["normal"] = normals
+
+        # Scale by line width
+        triangles["vertices"][:, :, 0] *= self.lineWidth
+        triangles["vertices"][:, :, 1] *= self.lineWidth
+
+        return triangles
+
+    # Fills in the number of triangles and moves the file into place. Returns the number of triangles
+    def close(self):
+        self.file.seek(80)
+        self.file.write(np.uint32(self.numTriangles).tobytes())
+        self.file.close()
+
+        os.replace(self.tempPath, self.path)
+        return self.numTriangles
+
+    # Removes the partially written file
+    def abort(self):
+        self.file.close()
+        if os.path.exists(self.tempPath):
+            os.remove(self.tempPath)
+
+
+class GzipSTLWriter(STLWriter):
+    """
+    Streams triangles into a gzip compressed binary STL file.
+    Every chunk is compressed into its own gzip member as soon as it's written, which lets the
+    chunks be compressed by several threads at once. Decompressing the concatenated members gives
+    back the plain STL.
+    The STL header is kept in an uncompressed member at the start of the file, so it has a fixed size
+    and can be rewritten with the number of triangles once the file is closed.
+    """
+
+    compressed = True
+
+    # Maximum number of compressed chunks waiting to be written per thread
+    QUEUE_DEPTH = 2
+
+    def __init__(self, path, header, line_width, origin=(0, 0), compression_level=6, threads=1):
+        self.path = path
+        self.header = header
+        self.lineWidth = line_width
+        self.origin = origin
+        self.numTriangles = 0
+        self.compressionLevel = compression_level
+
+        self.executor = ThreadPoolExecutor(threads) if threads > 1 else None
+        self.maxPending = threads * self.QUEUE_DEPTH
+        self.pending = deque()
+
+        self.tempPath = path + ".part"
+        self.file = open(self.tempPath, "wb")
+        self.file.write(self.header_member())
+
+    def header_member(self):
+        return gzip.compress(self.header + np.uint32(self.numTriangles).tobytes(), compresslevel=0, mtime=0)
+
+    def prepare(self, chunk):
+        return len(chunk), gzip.compress(self.triangles(chunk).tobytes(), compresslevel=self.compressionLevel, mtime=0)
+
+    def write_prepared(self, prepared):
+        num_triangles, member = prepared
+        self.file.write(member)
+        self.numTriangles += num_triangles
+
+    def write(self, chunk):
+        if self.executor is None:
+            self.write_prepared(self.prepare(chunk))
+            return
+
+        triangles = self.triangles(chunk).tobytes()
+        self.numTriangles += len(chunk)
+
+        # Keep the members in order and only a bounded number of chunks in memory
+        self.pending.append(self.executor.submit(
+            gzip.compress, triangles, compresslevel=self.compressionLevel, mtime=0))
+        while len(self.pending) > self.maxPending:
+            self.file.write(self.pending.popleft().result())
+
+    def close(self):
+        while self.pending:
+            self.file.write(self.pending.popleft().result())
+        if self.executor is not None:
+            self.executor.shutdown()
+
+        self.file.seek(0)
+        self.file.write(self.header_member())
+        self.file.close()
+
+        os.replace(self.tempPath, self.path)
+        return self.numTriangles
+
+    def abort(self):
+        if self.executor is not None:
+            for future in self.pending:
+                future.cancel()
+            self.executor.shutdown()
+        super().abort()
+
+
+class GridVertexIndexer:
+    """
+    Assigns compact ids to the vertices of the mesh chunks in the order they're first used.
+    A vertex is identified by its position in the height grid and whether it's on the floor of the model,
+    so the shared vertices are found without having to hash or sort any coordinates.
+    Chunks have to be added band by band, since only the ids of the last column of a chunk are kept for the next one.
+    """
+
+    def __init__(self):
+        self.numVertices = 0
+        self.lastColumn = None
+
+    # Returns the new vertices used by the chunk as (x, y, z) in grid units and the vertex ids of each of its triangles
+    def add(self, chunk):
+        if len(chunk) == 0:
+            return np.empty((0, 3), dtype=np.float32), np.empty((0, 3), dtype=np.int64)
+
+        x_start, y_start = chunk.x.min(), chunk.y.min()
+        shape = (chunk.x.max() - x_start + 1, chunk.y.max() - y_start + 1, 2)
+
+        # -1 marks the vertices without an id
+        ids = np.full(shape, -1, dtype=np.int64)
+        heights = np.empty(shape, dtype=np.float32)
+
+        # Reuse the ids of the column shared with the previous chunk
+        if self.lastColumn is not None:
+            column_x, column_y, column_ids = self.lastColumn
+            if x_start <= column_x < x_start + shape[0]:
+                y0 = max(column_y, y_start)
+                y1 = min(column_y + len(column_ids), y_start + shape[1])
+                if y0 < y1:
+                    ids[column_x - x_start, y0 - y_start:y1 - y_start] = column_ids[y0 - column_y:y1 - column_y]
+
+        x = chunk.x - x_start
+        y = chunk.y - y_start
+        level = chunk.bottom.astype(np.int64)
+
+        # Number the vertices that haven't been used yet in grid order
+        ids[x, y, level] = np.where(ids[x, y, level] < 0, -2, ids[x, y, level])
+        heights[x, y, level] = chunk.z
+
+        new_x, new_y, new_level = np.nonzero(ids == -2)
+        ids[new_x, new_y, new_level] = self.numVertices + np.arange(len(new_x))
+        self.numVertices += len(new_x)
+
+        vertices = np.column_stack([(new_x + x_start).astype(np.float32),
+                                    (new_y + y_start).astype(np.float32),
+                                    heights[new_x, new_y, new_level]])
+
+        self.lastColumn = (x_start + shape[0] - 1, y_start, ids[-1].copy())
+
+        return vertices, ids[x, y, level]
+
+
+def find_runs(mergeable, keys=None):
+    """
+    Returns the runs of consecutive mergeable cells with the same key down each column of the (rows, columns) grid
+    as arrays of their column, their first row and the row after their last one.
+    """
+    mergeable = np.ascontiguousarray(mergeable.T)
+    continues = mergeable[:, 1:] & mergeable[:, :-1]
+    if keys is not None:
+        keys = keys.T
+        continues &= keys[:, 1:] == keys[:, :-1]
+
+    starts = mergeable.copy()
+    starts[:, 1:] &= ~continues
+    ends = mergeable.copy()
+    ends[:, :-1] &= ~continues
+
+    columns, first_rows = np.nonzero(starts)
+    _, last_rows = np.nonzero(ends)
+    return columns, first_rows, last_rows + 1
+
+
+def merge_runs(columns, starts, stops, keys=None):
+    """
+    Merges the runs of neighbouring columns that cover the same rows (and have the same key) into rectangles.
+    Returns the first column, the column after the last one, the first row and the row after the last one of each.
+    """
+    keys = np.zeros(len(columns)) if keys is None else keys
+    order = np.lexsort((columns, keys, stops, starts))
+    columns, starts, stops, keys = columns[order], starts[order], stops[order], keys[order]
+
+    new_rectangle = np.ones(len(columns), dtype=bool)
+    new_rectangle[1:] = ((columns[1:] != columns[:-1] + 1) | (starts[1:] != starts[:-1])
+                         | (stops[1:] != stops[:-1]) | (keys[1:] != keys[:-1]))
+
+    first = np.flatnonzero(new_rectangle)
+    last = np.r_[first[1:], len(columns)] - 1
+    return columns[first], columns[last] + 1, starts[first], stops[first]
+
+
+def value_ranges(starts, stops):
+    """Returns the values in [start, stop) of every pair of bounds, along with the index of the pair they're from."""
+    lengths = np.maximum(stops - starts, 0)
+    owners = np.repeat(np.arange(len(starts)), lengths)
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return owners, starts[owners] + offsets
+
+
+def triangulate_rectangles(x_start, x_stop, y_start, y_stop, needed):
+    """
+    Triangulates the rectangles with corners (x_start, y_start) and (x_stop, y_stop) on the vertex grid.
+    Besides their corners, the rectangles keep the vertices on their sides that are marked in the needed grid
+    (the ones used by the neighbouring triangles), so there are no T-junctions along their sides.
+    The boundary of each rectangle is split into two chains from its top left to its bottom right corner,
+    one along its top and right sides and one along its left and bottom sides, which are zipped together
+    into a strip. Two consecutive points of a chain are never on the same line as a point of the other chain,
+    so none of the triangles are degenerate, and a rectangle without any extra vertices gets two triangles.
+    Returns the (n, 3) x and y corners of the triangles, wound like the surface triangles.
+    """
+    rectangles = np.arange(len(x_start))
+
+    # Points on the sides of the rectangles as (rectangle, x, y, chain), the corners are always kept
+    top_owners, top_x = value_ranges(x_start + 1, x_stop)
+    right_owners, right_y = value_ranges(y_start + 1, y_stop)
+    left_owners, left_y = value_ranges(y_start + 1, y_stop)
+    bottom_owners, bottom_x = value_ranges(x_start + 1, x_stop)
+    sides = [
+        (top_owners, top_x, y_start[top_owners], 0),
+        (rectangles, x_stop, y_start, 0),
+        (right_owners, x_stop[right_owners], right_y, 0),
+        (left_owners, x_start[left_owners], left_y, 1),
+        (rectangles, x_start, y_stop, 1),
+        (bottom_owners, bottom_x, y_stop[bottom_owners], 1),
+    ]
+
+    owners, xs, ys, chains = [], [], [], []
+    for i, (owner, x, y, chain) in enumerate(sides):
+        if i not in (1, 4):
+            keep = needed[y, x]
+            owner, x, y = owner[keep], x[keep], y[keep]
+        owners.append(owner)
+        xs.append(x)
+        ys.append(y)
+        chains.append(np.full(len(owner), chain, dtype=np.int8))
+
+    owners, xs, ys, chains = (np.concatenate(a) for a in (owners, xs, ys, chains))
+
+    # Both chains move one step further from the top left corner with every point, so ordering the points
+    # by x + y zips them together
+    order = np.lexsort((chains, xs + ys, owners))
+    owners, xs, ys, chains = owners[order], xs[order], ys[order], chains[order]
+
+    index = np.arange(len(owners))
+    is_first_chain = chains == 0
+    group_starts = np.searchsorted(owners, rectangles)
+
+    first_a = np.minimum.reduceat(np.where(is_first_chain, index, len(index)), group_starts)
+    first_b = np.minimum.reduceat(np.where(is_first_chain, len(index), index), group_starts)
+    last_a = np.maximum.reduceat(np.where(is_first_chain, index, -1), group_starts)
+    last_b = np.maximum.reduceat(np.where(is_first_chain, -1, index), group_starts)
+
+    # The last point of each chain before every point, falling back to the first point of the chain
+    previous_a = np.r_[-1, np.maximum.accumulate(np.where(is_first_chain, index, -1))[:-1]]
+    previous_b = np.r_[-1, np.maximum.accumulate(np.where(is_first_chain, -1, index))[:-1]]
+    group_start = group_starts[owners]
+    previous_a = np.where(previous_a >= group_start, previous_a, first_a[owners])
+    previous_b = np.where(previous_b >= group_start, previous_b, first_b[owners])
+
+    # The strip starts with the top left corner and the first point of each chain, adds a triangle for every
+    # further point and ends with the bottom right corner and the last point of each chain
+    middle = (index != first_a[owners]) & (index != first_b[owners])
+    x = np.concatenate([
+        np.column_stack([x_start, xs[first_a], xs[first_b]]),
+        np.column_stack([xs[previous_a[middle]], xs[previous_b[middle]], xs[middle]]),
+        np.column_stack([xs[last_a], xs[last_b], x_stop]),
+    ])
+    y = np.concatenate([
+        np.column_stack([y_start, ys[first_a], ys[first_b]]),
+        np.column_stack([ys[previous_a[middle]], ys[previous_b[middle]], ys[middle]]),
+        np.column_stack([ys[last_a], ys[last_b], y_stop]),
+    ])
+
+    # Give every triangle the winding of the surface triangles
+    flipped = (x[:, 1] - x[:, 0]) * (y[:, 2] - y[:, 0]) - (y[:, 1] - y[:, 0]) * (x[:, 2] - x[:, 0]) < 0
+    x[flipped, 1:] = x[flipped, 2:0:-1]
+    y[flipped, 1:] = y[flipped, 2:0:-1]
+    return x, y
+
+
+def zip_walls(owners, top, bottom):
+    """
+    Zips the points kept along the top and the bottom of each wall into a strip.
+    The points of a wall are consecutive and its first and last points are kept on both edges.
+    Returns the (n, 3) points of the triangles and whether each of their corners is on the bottom edge.
+    The triangles turn clockwise when the points go from left to right with the top edge above the bottom one.
+    """
+    top_points = np.flatnonzero(top)
+    bottom_points = np.flatnonzero(bottom)
+    points = np.r_[top_points, bottom_points]
+    chains = np.r_[np.zeros(len(top_points), dtype=bool), np.ones(len(bottom_points), dtype=bool)]
+
+    # At the same point the top edge comes first
+    order = np.lexsort((chains, points))
+    points, chains = points[order], chains[order]
+
+    # Every point adds a triangle with the previous point of its own edge and the last point of the other edge,
+    # except for the first point of each edge
+    index = np.arange(len(points))
+    previous_top = np.r_[-1, np.maximum.accumulate(np.where(chains, -1, index))[:-1]]
+    previous_bottom = np.r_[-1, np.maximum.accumulate(np.where(chains, index, -1))[:-1]]
+    same = np.where(chains, previous_bottom, previous_top)
+    other = np.where(chains, previous_top, previous_bottom)
+    added = (same >= 0) & (owners[points[np.maximum(same, 0)]] == owners[points])
+
+    same, other, index, on_bottom = same[added], other[added], index[added], chains[added, None]
+    corners = np.where(on_bottom, np.column_stack([same, other, index]), np.column_stack([other, same, index]))
+    return points[corners], chains[corners]
+
+
+def triangulate_walls(owners, heights, top, bottom, bottom_level, max_passes=64):
+    """
+    Triangulates the straight walls made of consecutive points along a line, owners giving the wall of each point.
+    The top edge of a wall keeps the points in the top mask, since the surface needs them. The bottom edge starts with
+    the points in the bottom mask and the triangles along the top are fanned out from them until the fan would fold
+    over, at which point a new fan is started from the floor under the last top point it reached.
+    Returns the points and the bottom flags of the triangles (see zip_walls()) and the final bottom mask.
+    """
+    heights = heights.astype(np.float64) - bottom_level
+    bottom = bottom.copy()
+
+    for _ in range(max_passes):
+        points, on_bottom = zip_walls(owners, top, bottom)
+
+        # Only the triangles along the top edge can fold, the others have their top corner above their bottom edge
+        base, first, last = points[~on_bottom[:, 2]].T
+        folded = (first - base) * heights[last] - heights[first] * (last - base) >= 0
+        if not folded.any():
+            return points, on_bottom, bottom
+
+        # Split every fan at its first folded triangle, the later ones may not fold from the new fan
+        base, first = base[folded], first[folded]
+        first = first[np.r_[True, base[1:] != base[:-1]]]
+        if bottom[first].all():
+            break
+        bottom[first] = True
+
+    # Put a bottom point under every top point of the walls from their first folded fan on,
+    # which gives each of the remaining triangles its own part of the floor
+    start = np.full(owners[-1] + 1, len(owners))
+    np.minimum.at(start, owners[base], base)
+    bottom |= top & (np.arange(len(owners)) >= start[owners])
+    points, on_bottom = zip_walls(owners, top, bottom)
+    return points, on_bottom, bottom
+
+
+# Returns the SHA-256 digest of the file's contents
+def file_digest(path, block_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Returns the 80 byte header of the binary STLs generated from the inputs with the given fingerprint
+# The prefix is kept short so the whole 64 character fingerprint fits into the header
+def stl_header(fingerprint):
+    header = f"STLGen {ENGINE_VERSION} {fingerprint or ''}".encode("ascii")
+    assert len(header) <= 80, "The fingerprint doesn't fit into the STL header"
+    return header.ljust(80, b"\0")
+
+
+def write_formatted(stream, row_format, array, block_size=65536):
+    """
+    Writes every row of the array into the text stream using the printf style format.
+    The rows are formatted in blocks so the text is never held in memory all at once.
+    """
+    for start in range(0, len(array), block_size):
+        block = array[start:start + block_size]
+        stream.write((row_format * len(block) % tuple(block.ravel().tolist())).encode("ascii"))
+
+
+class IndexedMeshWriter:
+    """
+    Base class of the writers of indexed mesh formats.
+    The chunks have to be written whole, since the welding only carries the last column of a chunk over to the next.
+    The chunks are welded by a GridVertexIndexer and handed over to the subclass as the new vertices
+    (already scaled into millimetres) and the zero based vertex ids of the triangles.
+    Subclasses write into self.tempPath, which is moved into place once the writer is closed.
+    """
+
+    splittable = False
+
+    def __init__(self, path, header, line_width, origin=(0, 0)):
+        self.path = path
+        self.lineWidth = line_width
+        self.origin = origin
+        self.numTriangles = 0
+        self.indexer = GridVertexIndexer()
+
+        # Called with the fraction of the file that was finished while closing it
+        self.progressCallback = None
+        self.tempPath = path + ".part"
+
+    @property
+    def numVertices(self):
+        return self.indexer.numVertices
+
+    # The chunks have to be welded in order, so there's nothing to prepare ahead of time
+    def prepare(self, chunk):
+        return chunk
+
+    def write_prepared(self, chunk):
+        self.write(chunk)
+
+    def write(self, chunk):
+        vertices, faces = self.indexer.add(chunk)
+
+        vertices[:, 0] = (vertices[:, 0] - self.origin[0]) * self.lineWidth
+        vertices[:, 1] = (vertices[:, 1] - self.origin[1]) * self.lineWidth
+
+        self.write_vertices(vertices)
+        self.write_faces(faces)
+        self.numTriangles += len(faces)
+
+    def write_vertices(self, vertices):
+        raise NotImplementedError
+
+    def write_faces(self, faces):
+        raise NotImplementedError
+
+    # Finishes the file. Returns the number of triangles
+    def close(self):
+        self.finish()
+        os.replace(self.tempPath, self.path)
+        return self.numTriangles
+
+    def finish(self):
+        raise NotImplementedError
+
+    # Releases the open files and removes the partially written file
+    def abort(self):
+        self.release()
+        if os.path.exists(self.tempPath):
+            os.remove(self.tempPath)
+
+    def release(self):
+        raise NotImplementedError
+
+
+def copy_spooled_faces(spool, write_block, block_size=65536, progress=None):
+    """
+    Reads back the uint32 vertex ids spooled into the temporary file and hands them over in blocks of triangles.
+    Reports the fraction of the file that was copied to progress (if given). Closes the temporary file afterwards.
+    """
+    total = spool.seek(0, os.SEEK_END)
+    spool.seek(0)
+    while True:
+        block = spool.read(12 * block_size)
+        if not block:
+            break
+        write_block(np.frombuffer(block, dtype=np.uint32).reshape(-1, 3))
+        if progress is not None:
+            progress(spool.tell() / total)
+    spool.close()
+
+
+class ThreeMFWriter(IndexedMeshWriter):
+    """
+    Streams an indexed mesh into the 3D model part of a 3MF package (a deflate compressed zip file).
+    The vertices are written as soon as they're first used, while the triangles are spooled into a
+    temporary file since the 3MF format only allows them after the full list of vertices.
+    """
+
+    CONTENT_TYPES = (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="model" ContentType="application/vnd.ms-package.3dmanufacturing-3dmodel+xml"/>'
+        '</Types>\n'
+    )
+    RELATIONSHIPS = (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Target="/3D/3dmodel.model" Id="rel0" '
+        'Type="http://schemas.microsoft.com/3dmanufacturing/2013/01/3dmodel"/>'
+        '</Relationships>\n'
+    )
+
+    def __init__(self, path, header, line_width, origin=(0, 0)):
+        super().__init__(path, header, line_width, origin)
+
+        self.archive = zipfile.ZipFile(self.tempPath, "w", compression=zipfile.ZIP_DEFLATED)
+        self.archive.writestr("[Content_Types].xml", self.CONTENT_TYPES)
+        self.archive.writestr("_rels/.rels", self.RELATIONSHIPS)
+
+        # The header of the STL (engine version and fingerprint) is kept as the application metadata
+        application = header.rstrip(b"\0").decode("ascii")
+
+        self.model = self.archive.open("3D/3dmodel.model", "w", force_zip64=True)
+        self.model.write((
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<model unit="millimeter" xml:lang="en-US" '
+            'xmlns="http://schemas.microsoft.com/3dmanufacturing/core/2015/02">\n'
+            f' <metadata name="Application">{application}</metadata>\n'
+            ' <resources>\n'
+            '  <object id="1" type="model">\n'
+            '   <mesh>\n'
+            '    <vertices>\n'
+        ).encode("ascii"))
+
+        self.triangles = tempfile.TemporaryFile()
+
+    def write_vertices(self, vertices):
+        write_formatted(self.model, '     <vertex x="%.4f" y="%.4f" z="%.4f"/>\n', vertices)
+
+    def write_faces(self, faces):
+        self.triangles.write(faces.astype(np.uint32).tobytes())
+
+    def finish(self):
+        self.model.write(b'    </vertices>\n    <triangles>\n')
+
+        copy_spooled_faces(self.triangles, lambda faces: write_formatted(
+            self.model, '     <triangle v1="%d" v2="%d" v3="%d"/>\n', faces), progress=self.progressCallback)
+
+        self.model.write((
+            '    </triangles>\n'
+            '   </mesh>\n'
+            '  </object>\n'
+            ' </resources>\n'
+            ' <build>\n'
+            '  <item objectid="1"/>\n'
+            ' </build>\n'
+            '</model>\n'
+        ).encode("ascii"))
+        self.model.close()
+        self.archive.close()
+
+    def release(self):
+        self.triangles.close()
+        self.model.close()
+        self.archive.close()
+
+
+class PLYWriter(IndexedMeshWriter):
+    """
+    Streams an indexed mesh into a binary little endian PLY file.
+    The vertices are written straight after a header of a fixed size, while the faces are spooled
+    into a temporary file since they have to follow the full list of vertices. Once the counts are
+    known, the header is rewritten in place and padded with a comment to keep its size.
+    """
+
+    HEADER_SIZE = 512
+
+    FACE_DTYPE = np.dtype([
+        ("count", "u1"),
+        ("ids", "<i4", (3,)),
+    ])
+
+    def __init__(self, path, header, line_width, origin=(0, 0)):
+        super().__init__(path, header, line_width, origin)
+
+        self.comment = header.rstrip(b"\0").decode("ascii")
+
+        self.file = open(self.tempPath, "wb")
+        self.file.write(self.ply_header())
+        self.faces = tempfile.TemporaryFile()
+
+    def ply_header(self):
+        lines = (
+            "ply\n"
+            "format binary_little_endian 1.0\n"
+            f"comment {self.comment}\n"
+            f"element vertex {self.numVertices}\n"
+            "property float x\n"
+            "property float y\n"
+            "property float z\n"
+            f"element face {self.numTriangles}\n"
+            "property list uchar int vertex_indices\n"
+        )
+        # Pad the header with a comment so it always takes up the same number of bytes
+        padding = self.HEADER_SIZE - len(lines) - len("comment \nend_header\n")
+        return (lines + "comment " + " " * padding + "\nend_header\n").encode("ascii")
+
+    def write_vertices(self, vertices):
+        self.file.write(vertices.astype("<f4").tobytes())
+
+    def write_faces(self, faces):
+        self.faces.write(faces.astype(np.uint32).tobytes())
+
+    def finish(self):
+        def write_block(faces):
+            records = np.empty(len(faces), dtype=self.FACE_DTYPE)
+            records["count"] = 3
+            records["ids"] = faces
+            self.file.write(records.tobytes())
+
+        copy_spooled_faces(self.faces, write_block, progress=self.progressCallback)
+
+        self.file.seek(0)
+        self.file.write(self.ply_header())
+        self.file.close()
+
+    def release(self):
+        self.faces.close()
+        self.file.close()
+
+
+class OBJWriter(IndexedMeshWriter):
+    """
+    Streams an indexed mesh into a Wavefront OBJ file.
+    OBJ allows the vertices and faces to be interleaved, so every chunk is written as soon as it's welded.
+    """
+
+    def __init__(self, path, header, line_width, origin=(0, 0)):
+        super().__init__(path, header, line_width, origin)
+
+        # Buffer the text so it reaches the disk in large blocks
+        self.file = open(self.tempPath, "wb", buffering=1024 * 1024)
+        self.file.write(b"# " + header.rstrip(b"\0") + b"\n")
+
+    def write_vertices(self, vertices):
+        write_formatted(self.file, "v %.4f %.4f %.4f\n", vertices)
+
+    def write_faces(self, faces):
+        # OBJ vertex ids start at 1
+        write_formatted(self.file, "f %d %d %d\n", faces + 1)
+
+    def finish(self):
+        self.file.close()
+
+    def release(self):
+        self.file.close()
+
+
+class GLBWriter(IndexedMeshWriter):
+    """
+    Streams an indexed mesh into a binary glTF (GLB) file with quantized positions (KHR_mesh_quantization).
+    The positions are stored as uint16 steps of the line width along x and y and of the elevation range
+    along z, and the node's transform turns them back into the model's coordinates. The normals are left
+    out, so viewers shade the triangles flat.
+    Both the vertices and the triangles are spooled into temporary files, since the quantization and the
+    buffer sizes are only known once every vertex has been seen.
+    """
+
+    QUANTIZED_MAX = 65535
+
+    def __init__(self, path, header, line_width, origin=(0, 0)):
+        super().__init__(path, header, line_width, origin)
+
+        self.generator = header.rstrip(b"\0").decode("ascii")
+        self.minimum = np.full(3, np.inf)
+        self.maximum = np.full(3, -np.inf)
+
+        self.vertices = tempfile.TemporaryFile()
+        self.faces = tempfile.TemporaryFile()
+
+    def write_vertices(self, vertices):
+        if len(vertices):
+            self.minimum = np.minimum(self.minimum, vertices.min(axis=0))
+            self.maximum = np.maximum(self.maximum, vertices.max(axis=0))
+        self.vertices.write(vertices.astype(np.float32).tobytes())
+
+    def write_faces(self, faces):
+        self.faces.write(faces.astype(np.uint32).tobytes())
+
+    # Returns the size of the quantization steps along each axis
+    def quantization_steps(self):
+        extent = self.maximum - self.minimum
+        steps = extent / self.QUANTIZED_MAX
+
+        # Keep whole grid cells along x and y whenever they fit, so the grid is stored losslessly
+        for axis in (0, 1):
+            if steps[axis] <= self.lineWidth:
+                steps[axis] = self.lineWidth
+        steps[steps <= 0] = 1
+        return steps
+
+    def finish(self):
+        num_vertices = self.numVertices
+        num_indices = self.numTriangles * 3
+
+        # Small meshes can use 16 bit indices
+        index_type = np.dtype("<u2") if num_vertices <= self.QUANTIZED_MAX else np.dtype("<u4")
+
+        # The positions are padded to 4 components, since vertex attributes have to be 4 byte aligned
+        positions_length = num_vertices * 8
+        indices_length = num_indices * index_type.itemsize
+        indices_padding = -indices_length % 4
+        binary_length = positions_length + indices_length + indices_padding
+
+        gltf = {
+            "asset": {"version": "2.0", "generator": self.generator},
+            "scene": 0,
+            "scenes": [{"nodes": [0]}],
+            "nodes": [{}],
+        }
+
+        if self.numTriangles:
+            steps = self.quantization_steps()
+            quantized_max = np.rint((self.maximum - self.minimum) / steps).astype(int)
+
+            # glTF is y up and in metres, so the node also rotates the z up model and scales it down from millimetres
+            minimum = self.minimum * 0.001
+            gltf["nodes"][0] = {
+                "mesh": 0,
+                "translation": [minimum[0], minimum[2], -minimum[1]],
+                "rotation": [-math.sqrt(0.5), 0, 0, math.sqrt(0.5)],
+                "scale": (steps * 0.001).tolist(),
+            }
+            gltf["extensionsUsed"] = ["KHR_mesh_quantization"]
+            gltf["extensionsRequired"] = ["KHR_mesh_quantization"]
+            gltf["meshes"] = [{"primitives": [{"attributes": {"POSITION": 0}, "indices": 1, "mode": 4}]}]
+            gltf["buffers"] = [{"byteLength": binary_length}]
+            gltf["bufferViews"] = [
+                {"buffer": 0, "byteOffset": 0, "byteLength": positions_length, "byteStride": 8, "target": 34962},
+                {"buffer": 0, "byteOffset": positions_length, "byteLength": indices_length, "target": 34963},
+            ]
+            gltf["accessors"] = [
+                {"bufferView": 0, "componentType": 5123, "count": num_vertices, "type": "VEC3",
+                 "min": [0, 0, 0], "max": quantized_max.tolist()},
+                {"bufferView": 1, "componentType": 5123 if index_type.itemsize == 2 else 5125,
+                 "count": num_indices, "type": "SCALAR"},
+            ]
+        else:
+            binary_length = 0
+
+        json_chunk = json.dumps(gltf, separators=(",", ":")).encode("utf-8")
+        json_chunk += b" " * (-len(json_chunk) % 4)
+
+        total_length = 12 + 8 + len(json_chunk) + (8 + binary_length if binary_length else 0)
+
+        with open(self.tempPath, "wb") as f:
+            f.write(struct.pack("<4sII", b"glTF", 2, total_length))
+            f.write(struct.pack("<I4s", len(json_chunk), b"JSON"))
+            f.write(json_chunk)
+
+            if binary_length:
+                f.write(struct.pack("<I4s", binary_length, b"BIN\0"))
+
+                # Quantize the spooled vertices in blocks
+                self.vertices.seek(0)
+                while True:
+                    block = self.vertices.read(12 * 65536)
+                    if not block:
+                        break
+                    vertices = np.frombuffer(block, dtype=np.float32).reshape(-1, 3)
+                    positions = np.zeros((len(vertices), 4), dtype="<u2")
+                    positions[:, :3] = np.rint((vertices - self.minimum) / steps)
+                    f.write(positions.tobytes())
+
+                copy_spooled_faces(self.faces, lambda faces: f.write(faces.astype(index_type).tobytes()),
+                                   progress=self.progressCallback)
+                f.write(b"\0" * indices_padding)
+
+        self.vertices.close()
+        self.faces.close()
+
+    def release(self):
+        self.vertices.close()
+        self.faces.close()
+
+
+class MeshPipeline:
+    """
+    Overlaps the reading, meshing and writing of the bands of a model.
+    A reader thread pulls the windows of the height grid into a bounded queue, a pool of meshing threads
+    turns them into mesh chunks and the calling thread writes the chunks in their original order.
+    GDAL, most of NumPy and the file writes release the GIL, so the stages really run side by side.
+    run_serial() runs the same stages one after the other, so both modes can be timed and compared.
+    The time every stage spent working is kept to show which one is the bottleneck.
+    """
+
+    # Marks the end of a queue
+    DONE = object()
+
+    def __init__(self, mesh_workers=1, read_queue_depth=2, write_queue_depth=2):
+        self.meshWorkers = max(1, mesh_workers)
+        self.readQueueDepth = max(1, read_queue_depth)
+        self.writeQueueDepth = max(1, write_queue_depth)
+
+        self.busy = {"read": 0.0, "mesh": 0.0, "write": 0.0}
+        self.elapsed = 0.0
+        self.lock = threading.Lock()
+
+    # Returns the share of the elapsed time every stage spent working (above 1 when several meshing threads overlap)
+    def utilisation(self):
+        if self.elapsed <= 0:
+            return {stage: 0.0 for stage in self.busy}
+        return {stage: busy / self.elapsed for stage, busy in self.busy.items()}
+
+    # Returns the seconds every stage spent working and the elapsed seconds
+    def timings(self):
+        return dict(self.busy, elapsed=self.elapsed)
+
+    def add_busy(self, stage, start):
+        with self.lock:
+            self.busy[stage] += time.perf_counter() - start
+
+    # Does the same as run() in the calling thread, one item and one stage after the other
+    def run_serial(self, items, mesh, write):
+        started = time.perf_counter()
+        try:
+            iterator = iter(items)
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+                self.add_busy("read", start)
+
+                start = time.perf_counter()
+                result = mesh(item)
+                self.add_busy("mesh", start)
+
+                start = time.perf_counter()
+                write(result)
+                self.add_busy("write", start)
+        finally:
+            self.elapsed += time.perf_counter() - started
+
+    # Reads every item of items, turns it into a result with mesh() and hands the results to write() in order
+    def run(self, items, mesh, write):
+        read_queue = queue.Queue(self.readQueueDepth)
+        write_queue = queue.Queue(self.writeQueueDepth)
+        stop = threading.Event()
+        errors = []
+
+        # Bounds the number of items in flight, including those waiting to be put back in order
+        slots = threading.Semaphore(self.readQueueDepth + self.writeQueueDepth + self.meshWorkers)
+
+        def put(target, item):
+            while not stop.is_set():
+                try:
+                    target.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def get(source):
+            while not stop.is_set():
+                try:
+                    return source.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            return self.DONE
+
+        def fail(error):
+            errors.append(error)
+            stop.set()
+
+        def read():
+            try:
+                iterator = iter(items)
+                index = 0
+                while not stop.is_set():
+                    if not slots.acquire(timeout=0.1):
+                        continue
+
+                    start = time.perf_counter()
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        break
+                    self.add_busy("read", start)
+
+                    if not put(read_queue, (index, item)):
+                        break
+                    index += 1
+            except BaseException as e:
+                fail(e)
+            finally:
+                for _ in range(self.meshWorkers):
+                    put(read_queue, self.DONE)
+
+        def mesh_items():
+            try:
+                while True:
+                    item = get(read_queue)
+                    if item is self.DONE:
+                        break
+
+                    index, value = item
+                    start = time.perf_counter()
+                    result = mesh(value)
+                    self.add_busy("mesh", start)
+
+                    if not put(write_queue, (index, result)):
+                        break
+            except BaseException as e:
+                fail(e)
+            finally:
+                put(write_queue, self.DONE)
+
+        threads = [threading.Thread(target=read, name="mesh-pipeline-read", daemon=True)]
+        threads += [threading.Thread(target=mesh_items, name=f"mesh-pipeline-mesh-{i}", daemon=True)
+                    for i in range(self.meshWorkers)]
+
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+
+        try:
+            pending = {}
+            next_index = 0
+            running_workers = self.meshWorkers
+            while running_workers:
+                item = get(write_queue)
+                if item is self.DONE:
+                    if stop.is_set():
+                        break
+                    running_workers -= 1
+                    continue
+
+                index, result = item
+                pending[index] = result
+
+                # Write the results in the order the items were read
+                while next_index in pending:
+                    start = time.perf_counter()
+                    write(pending.pop(next_index))
+                    self.add_busy("write", start)
+                    next_index += 1
+                    slots.release()
+        except BaseException as e:
+            fail(e)
+        finally:
+            # Stops the other stages if the writing failed
+            stop.set()
+            for thread in threads:
+                thread.join()
+            self.elapsed += time.perf_counter() - started
+
+        if errors:
+            raise errors[0]
+
+
+# The writer of every output format (see output_formats.py)
+WRITERS = {
+    "stl": STLWriter,
+    "3mf": ThreeMFWriter,
+    "ply": PLYWriter,
+    "obj": OBJWriter,
+    "glb": GLBWriter,
+    "stl.gz": GzipSTLWriter,
+}
+
+
+class ProgressReporter:
+    """
+    Combines the progress of the stages of a generation into one fraction between 0 and 1.
+    Every stage gets a share of the total in proportion to its weight, and the calls to the callback
+    are throttled so that a fast mesher doesn't flood the user interface with signals.
+    The time spent in every stage is measured so that the weights can follow the real costs.
+    """
+
+    # Minimum time (in seconds) and progress between two calls to the callback
+    MIN_INTERVAL = 0.1
+    MIN_STEP = 0.005
+
+    def __init__(self, callback, weights, stages):
+        self.callback = callback
+        self.stages = list(stages)
+
+        total = sum(weights[stage] for stage in self.stages) or 1
+        self.shares = {stage: weights[stage] / total for stage in self.stages}
+
+        self.stage = None
+        self.offset = 0.0
+        self.stageStart = None
+        self.durations = {}
+
+        self.lastValue = -1.0
+        self.lastTime = 0.0
+
+    def start_stage(self, stage):
+        self.end_stage()
+        if stage not in self.shares:
+            return
+
+        # Skip over the stages that were left out
+        self.offset = sum(self.shares[s] for s in self.stages[:self.stages.index(stage)])
+        self.stage = stage
+        self.stageStart = time.perf_counter()
+        self.report(self.offset)
+
+    def end_stage(self):
+        if self.stage is not None:
+            self.durations[self.stage] = time.perf_counter() - self.stageStart
+        self.stage = None
+
+    # Reports the fraction of the current stage that's done
+    def update(self, fraction):
+        if self.stage is not None:
+            self.report(self.offset + self.shares[self.stage] * min(max(fraction, 0.0), 1.0))
+
+    def finish(self):
+        self.end_stage()
+        self.report(1.0, force=True)
+
+    def report(self, value, force=False):
+        now = time.perf_counter()
+        if not force and (value - self.lastValue < self.MIN_STEP or now - self.lastTime < self.MIN_INTERVAL):
+            return
+
+        self.lastValue = value
+        self.lastTime = now
+        self.callback(value, self.stage or "done")
+
+
 class MeshGenerator:
+    # Stages of a generation in the order they run
+    # "mesh" covers finding the cells of every band, emitting their triangles and writing them
+    # "finish" covers closing the file, which can take a while for the formats that spool their triangles
+    PROGRESS_STAGES = ("stats", "read", "mesh", "finish")
+
+    # Share of the run time every stage is expected to take, refined with the measured durations
+    # of the previous generations in this session (kept per output format)
+    stageWeights = {}
+    DEFAULT_STAGE_WEIGHTS = {"stats": 0.05, "read": 0.15, "mesh": 0.75, "finish": 0.05}
+
     def __init__(self):
         # Setup the logger
         logger_filepath = os.path.join(os.path.dirname(__file__), "logging.log")
@@ -76,7 +1342,7 @@ class MeshGenerator:
         self.logger.info("Started a new logging session!")
 
         # Check if the log file was created
-        if not os.path.exists(logger_filepath):
+        if not os.path.exists(logger_filepath) and QgsMessageLog is not None:
             QgsMessageLog.logMessage(f"The log file '{logger_filepath}' could not be created!", "STL_Generator", level=Qgis.Warning)
 
         # Define initial parameter values
@@ -84,12 +1350,62 @@ class MeshGenerator:
         self.bottomLevel = -100
         self.numTriangles = 0
 
+        # Fingerprint of the inputs of the current STL and the cached copy of it (if there is one)
+        self.fingerprint = None
+        self.cachedPath = None
+
+        # Number of cells that are meshed at once
+        # Kept small enough for every band to be written well within a second, so cancelling is quick
+        self.bandSize = 256 * 1024
+
+        # Number of rows of cells in the blocks of a band that are told apart as empty, full or mixed
+        # The empty blocks are skipped and the full ones are meshed straight from the templates
+        self.blockSize = 64
+
+        # Height grids bigger than maxInMemoryBytes are kept in a memory mapped temporary file instead of in memory
+        # outOfCore forces it on (True) or off (False), None picks it by the size of the grid
+        self.outOfCore = None
+        self.maxInMemoryBytes = 2 * 1024 ** 3
+        # Directory of the temporary height file, the system's temporary directory if None
+        self.tempDir = None
+        self.heightFile = None
+
+        # Number of triangles prepared at once by the writers whose chunks can be split
+        self.sliceSize = 65536
+        self.outputFormat = "stl"
+        self.compressionLevel = 6
+        self.compressionThreads = 1
+        self.pipelined = False
+        self.meshWorkers = 1
+        self.readQueueDepth = 2
+        self.writeQueueDepth = 2
+        # Seconds the read, mesh and write stages of the last model spent working, the elapsed seconds
+        # and the share of the elapsed time of every stage
+        self.stageTimings = {}
+        self.stageUtilisation = {}
+
+        # Mesh the flat parts of the surface and the floor as rectangles instead of two triangles per cell,
+        # and the straight walls as strips along their lines
+        self.mergeCoplanar = False
+
+        # Check that the written meshes are watertight (see mesh_validator.py)
+        self.validateMesh = False
+        self.validators = {}
+        self.validationResults = []
+
+        # Returns True once the caller wants the generation to stop (e.g. QgsTask.isCanceled)
+        self.isCanceled = lambda: False
+
+        # Called with the overall progress (between 0 and 1) and the current stage
+        self.progressCallback = None
+        self.progress = None
+        self.tileMode = False
+        self.tileLocations = []
+        self.shard = None
+        self.lazyRead = False
+
         # Define the numpy data type for the STL triangles
-        self.triangle_dtype = np.dtype([
-            ("normal",  np.float32, (3,)),
-            ("vertices", np.float32, (3,3,)),
-            ("attr",    np.uint16),
-        ], align=False)
+        self.triangle_dtype = STL_TRIANGLE_DTYPE
 
         # Get the DLL path(s)
         if platform.system() == "Windows":
@@ -99,13 +1415,73 @@ class MeshGenerator:
             self.dll_path = os.path.join(os.path.dirname(
                 __file__), 'backend', 'MeshGenerator', 'lib', 'libMeshGenerator.so')
 
-        # Load the necessary DLL file(s)
-        try:
-            self.lib = ctypes.CDLL(self.dll_path)
-        except Exception as e:
-            raise MissingDLLError(self.dll_path)
+        # The DLL is only loaded by dll_write_stl(), the Python engine doesn't need it
+        self.lib = None
+
+    # Loads the DLL of the C++ meshing engine the first time it's needed
+    def load_library(self):
+        if self.lib is None:
+            try:
+                self.lib = ctypes.CDLL(self.dll_path)
+            except Exception as e:
+                raise MissingDLLError(self.dll_path)
+        return self.lib
+
+    # Sets the function that's polled between the steps of the generation to find out if it should stop
+    def set_cancel_callback(self, callback):
+        self.isCanceled = callback or (lambda: False)
+
+    # Raises a GenerationCanceledError if the caller asked for the generation to stop
+    def check_canceled(self):
+        if self.isCanceled():
+            self.logger.info("The generation was canceled.")
+            raise GenerationCanceledError()
+
+    # Sets the function that's called with the overall progress (between 0 and 1) and the name of the current stage
+    def set_progress_callback(self, callback):
+        self.progressCallback = callback
+
+    # Starts reporting the progress of a new generation
+    def start_progress(self):
+        weights = self.stageWeights.get(self.outputFormat, self.DEFAULT_STAGE_WEIGHTS)
+
+        # Lazily read models are read while they're being meshed
+        stages = [stage for stage in self.PROGRESS_STAGES if not (self.lazyRead and stage == "read")]
+
+        self.progress = ProgressReporter(self.progressCallback or (lambda value, stage: None), weights, stages)
+
+    def progress_stage(self, stage):
+        if self.progress is not None:
+            self.progress.start_stage(stage)
+
+    def progress_update(self, fraction):
+        if self.progress is not None:
+            self.progress.update(fraction)
+
+    # Reports the end of the generation and folds the measured stage durations into the weights of the next runs
+    def finish_progress(self):
+        if self.progress is None:
+            return
+
+        self.progress.finish()
+
+        durations = self.progress.durations
+        total = sum(durations.values())
+        if total > 0 and set(durations) == set(self.progress.stages):
+            weights = dict(self.stageWeights.get(self.outputFormat, self.DEFAULT_STAGE_WEIGHTS))
+            for stage, duration in durations.items():
+                weights[stage] = 0.5 * weights[stage] + 0.5 * duration / total
+            MeshGenerator.stageWeights[self.outputFormat] = weights
+
+        self.progress = None
+
+    # Progress callback of the GDAL functions. Returning 0 makes GDAL stop
+    def gdal_callback(self, complete, message, data):
+        self.progress_update(complete)
+        return 0 if self.isCanceled() else 1
 
     def generate_height_array(self, parameters, source_dem):
+        self.check_canceled()
         self.logger.info(
             f"******************************************************")
         self.logger.info(f"Starting to process the {source_dem} raster!")
@@ -124,6 +1500,58 @@ class MeshGenerator:
 
         self.name = os.path.basename(self.saveLocation)
 
+        # Total size of the model (in mm) when it is split into tiles that each fit on the print bed
+        self.tileMode = parameters.get("totalX") is not None and parameters.get("totalY") is not None
+
+        # Range of the model's cell columns to generate on their own, see mesh_shards.py
+        self.shard = parameters.get("shard")
+
+        # Read the DEM band by band while it's being meshed instead of all at once up front
+        self.lazyRead = parameters.get("lazyRead", False) or self.tileMode or self.shard is not None
+        self.bandSize = parameters.get("bandSize", self.bandSize)
+        self.blockSize = parameters.get("blockSize", self.blockSize)
+
+        # Settings of the height grids that don't fit in memory
+        self.outOfCore = parameters.get("outOfCore")
+        self.maxInMemoryBytes = parameters.get("maxInMemoryBytes", 2 * 1024 ** 3)
+        self.tempDir = parameters.get("tempDir")
+        self.release_height_array()
+
+        # Directory of the previously generated STLs
+        # Only used when the caller opts in, since every cached model is a copy of the output
+        self.cacheDir = parameters.get("cacheDir") or os.path.join(
+            os.path.expanduser("~"), ".cache", "stl_generator")
+        self.useCache = parameters.get("useCache", False) and not self.tileMode and self.shard is None
+        self.outputFormat = parameters.get("outputFormat", "stl")
+        self.cacheMaxBytes = parameters.get("cacheMaxBytes", 1024 ** 3)
+
+        # Settings of the compressed output formats
+        self.compressionLevel = parameters.get("compressionLevel", 6)
+        self.compressionThreads = parameters.get("compressionThreads", min(4, os.cpu_count() or 1))
+
+        # Overlap the reading, meshing and writing of the bands
+        # Off by default, it's only worth it where the benchmarks measure it as faster
+        self.pipelined = parameters.get("pipelined", False)
+        self.meshWorkers = parameters.get("meshWorkers", 1)
+        self.readQueueDepth = parameters.get("readQueueDepth", 2)
+        self.writeQueueDepth = parameters.get("writeQueueDepth", 2)
+        self.stageTimings = {}
+        self.stageUtilisation = {}
+
+        self.mergeCoplanar = parameters.get("mergeCoplanar", False)
+        # The seams of a shard would count as holes, the merged model is validated instead
+        self.validateMesh = parameters.get("validateMesh", False) and self.shard is None
+        self.validationResults = []
+
+        self.start_progress()
+
+        # Skip reading the DEM if the same STL was already generated before
+        self.fingerprint = self.compute_fingerprint(parameters, source_dem)
+        self.cachedPath = self.find_cached_stl() if self.useCache else None
+        if self.cachedPath:
+            self.logger.info(f"Found a cached STL for {self.name} at {self.cachedPath}.")
+            return
+
         gdal.DontUseExceptions()
 
         # Opens the raster file being used
@@ -142,9 +1570,16 @@ class MeshGenerator:
         else:
             self.logger.info(f"The no data value is {self.noDataValue}")
 
+        self.check_canceled()
+
         # Gets the maximum resolution of the printer on each axis
-        larger_bed_axis = max(math.ceil(self.bedX), math.ceil(self.bedY))
-        smaller_bed_axis = min(math.ceil(self.bedX), math.ceil(self.bedY))
+        # Tiled models are scaled to their total size instead
+        if self.tileMode:
+            larger_bed_axis = max(math.ceil(parameters["totalX"]), math.ceil(parameters["totalY"]))
+            smaller_bed_axis = min(math.ceil(parameters["totalX"]), math.ceil(parameters["totalY"]))
+        else:
+            larger_bed_axis = max(math.ceil(self.bedX), math.ceil(self.bedY))
+            smaller_bed_axis = min(math.ceil(self.bedX), math.ceil(self.bedY))
 
         self.logger.info(f"The bed size for {self.name} is {larger_bed_axis} by {smaller_bed_axis}")
 
@@ -163,14 +1598,25 @@ class MeshGenerator:
         self.logger.info(f"The scale factor for {self.name} is {scalingFactor}")
 
         # *************************** GET VERTICAL EXAGGERATION FOR RASTER *************************** #
-        # Load stats from the raster image
-        minValue = band.GetMinimum()
-        maxValue = band.GetMaximum()
-        if not minValue or not maxValue:
-            (minValue, maxValue) = band.ComputeRasterMinMax(True)
+        self.progress_stage("stats")
+
+        # Use the elevation range given by the caller so that several models can share the same vertical scale
+        if parameters.get("minValue") is not None and parameters.get("maxValue") is not None:
+            minValue = parameters["minValue"]
+            maxValue = parameters["maxValue"]
+            self.logger.info("Using the elevation range given in the parameters.")
+        else:
+            # Load stats from the raster image
+            minValue = band.GetMinimum()
+            maxValue = band.GetMaximum()
+            if not minValue or not maxValue:
+                (minValue, maxValue) = band.ComputeRasterMinMax(True)
 
         self.logger.info(f"The minimum and maximum values of the raster are {minValue} and {maxValue} respectively.")
 
+        # Kept so that the shards of a model can all be given the same range (see mesh_shards.py)
+        self.elevationRange = (minValue, maxValue)
+
         # Calculate the vertical exaggeration
         self.verticalExaggeration = self.printHeight / (maxValue - minValue)
         self.bottomLevel = (
@@ -182,12 +1628,50 @@ class MeshGenerator:
         self.logger.info(f"The bottom level of the model is {self.bottomLevel}.")
 
         # *************************** APPLY THE SCALE FACTOR AND VERTICAL EXAGGERATION *************************** #
+        # Size of the height grid once the scale factor is applied
+        buf_xsize = math.ceil(dem.RasterXSize * scalingFactor)
+        buf_ysize = math.ceil(dem.RasterYSize * scalingFactor)
+
+        rawNoDataValue = self.noDataValue
+        if (self.verticalExaggeration == 0.0):
+            self.logger.info(
+                "The vertical exaggeration is 0 so the resulting STL will have a flat surface!")
+        else:
+            self.noDataValue *= self.verticalExaggeration
+            self.logger.info(
+                f"Applied the vertical exaggeration to the noDataValue. The new noDataValue is {self.noDataValue}")
+
+        # Tiled models and shards are read band by band while they're being meshed
+        if self.lazyRead:
+            self.dem = dem
+            self.heightSource = RasterHeightSource(
+                band, buf_xsize, buf_ysize, self.noDataValue,
+                lambda rows: self.apply_vertical_exaggeration(rows, rawNoDataValue),
+                self.check_canceled)
+            self.logger.info(f"The final raster size is {buf_ysize} by {buf_xsize}.")
+            return
+
+        self.check_canceled()
+        self.progress_stage("read")
+
+        # Grids that don't fit in memory are written to a temporary file that's mapped into memory
+        out_of_core = self.outOfCore
+        if out_of_core is None:
+            out_of_core = buf_xsize * buf_ysize * np.dtype(np.float64).itemsize > self.maxInMemoryBytes
+        if out_of_core:
+            self.read_height_file(band, buf_xsize, buf_ysize, rawNoDataValue)
+            self.logger.info(f"The final raster size is {buf_ysize} by {buf_xsize}, kept in a temporary file.")
+            return
+
         # Load the raster file as an array
-        self.array = band.ReadAsArray(buf_xsize=math.ceil(dem.RasterXSize * scalingFactor),
-                                      buf_ysize=math.ceil(
-                                          dem.RasterYSize * scalingFactor),
+        self.array = band.ReadAsArray(buf_xsize=buf_xsize,
+                                      buf_ysize=buf_ysize,
                                       buf_type=gdal.GDT_Float64,
-                                      resample_alg=gdal.GRIORA_NearestNeighbour)
+                                      resample_alg=gdal.GRIORA_NearestNeighbour,
+                                      callback=self.gdal_callback)
+        if self.array is None:
+            self.check_canceled()
+            raise InaccessibleDEMError(source_dem, "Couldn't read the DEM")
 
         self.logger.info(
             f"The target raster size is {self.bedX / self.lineWidth} by {self.bedY / self.lineWidth}.")
@@ -195,19 +1679,211 @@ class MeshGenerator:
             f"The final raster size is {self.array.shape[0]} by {self.array.shape[1]}.")
 
         # Apply the vertical exaggeration
+        self.array = self.apply_vertical_exaggeration(self.array, rawNoDataValue)
+
+    # Reads the height grid into a temporary file band by band and maps it into memory, so only the pages of the
+    # bands being meshed are ever loaded. The file is deleted by release_height_array()
+    def read_height_file(self, band, buf_xsize, buf_ysize, raw_no_data_value):
+        source = RasterHeightSource(
+            band, buf_xsize, buf_ysize, self.noDataValue,
+            lambda rows: self.apply_vertical_exaggeration(rows, raw_no_data_value),
+            self.check_canceled)
+
+        # The rows are written instead of filling in a writable map, so running out of disk space raises an OSError
+        rows_per_band = max(1, self.bandSize // buf_xsize)
+        try:
+            self.heightFile = tempfile.TemporaryFile(prefix="stl_generator_", suffix=".heights", dir=self.tempDir)
+            for start in range(0, buf_ysize, rows_per_band):
+                stop = min(start + rows_per_band, buf_ysize)
+                self.heightFile.write(np.ascontiguousarray(source.read_rows(start, stop), dtype=np.float64).tobytes())
+                self.progress_update(stop / buf_ysize)
+
+            self.heightFile.flush()
+            self.array = np.memmap(self.heightFile, dtype=np.float64, mode="r", shape=(buf_ysize, buf_xsize))
+
+        except OSError as e:
+            self.release_height_array()
+            raise MeshGeneratorError(
+                f"Couldn't write the height grid to a temporary file in {self.tempDir or tempfile.gettempdir()}: {e}")
+        except BaseException:
+            self.release_height_array()
+            raise
+
+    # Deletes the temporary file of a memory mapped height grid, the grid can't be meshed anymore afterwards
+    def release_height_array(self):
+        if self.heightFile is None:
+            return
+
+        self.array = None
+        self.heightFile.close()
+        self.heightFile = None
+
+    # Scales the heights by the vertical exaggeration, leaving the no data pixels as the (scaled) no data value
+    def apply_vertical_exaggeration(self, array, no_data_value):
         if (self.verticalExaggeration == 0.0):
-            self.array = np.where(
-                self.array != self.noDataValue, 0, self.array)
-            self.logger.info(
-                "The vertical exaggeration is 0 so the resulting STL will have a flat surface!")
-        else:
-            self.array *= self.verticalExaggeration
-            self.noDataValue *= self.verticalExaggeration
-            self.logger.info(
-                f"Applied the vertical exaggeration to the noDataValue. The new noDataValue is {self.noDataValue}")
+            return np.where(array != no_data_value, 0, array)
+
+        array *= self.verticalExaggeration
+        return array
+
+    # Returns a hash that identifies the DEM and all of the parameters the STL is generated from
+    def compute_fingerprint(self, parameters, source_dem):
+        try:
+            stat = os.stat(source_dem)
+            dem_identity = [os.path.abspath(source_dem), stat.st_size, stat.st_mtime_ns]
+        except OSError:
+            # Sources that aren't plain files (e.g. web services) can only be identified by their URI
+            dem_identity = [source_dem, None, None]
+
+        mesh_parameters = {key: value for key, value in parameters.items() if key not in NON_MESH_PARAMETERS}
+
+        description = json.dumps(
+            {"engine": ENGINE_VERSION, "dem": dem_identity, "parameters": mesh_parameters},
+            sort_keys=True, default=str)
+
+        return hashlib.sha256(description.encode("utf-8")).hexdigest()
+
+    # Returns the 80 byte header of the binary STL
+    def stl_header(self):
+        return stl_header(self.fingerprint)
+
+    def cache_path(self):
+        return os.path.join(self.cacheDir, self.fingerprint + OUTPUT_FORMATS[self.outputFormat].extension)
+
+    # Returns the path of the cached STL with the same fingerprint or None if there isn't one
+    def find_cached_stl(self):
+        path = self.cache_path()
+        try:
+            with open(path + ".json", "r", encoding="utf-8") as f:
+                recorded = json.load(f)
+
+            # Make sure the cached file is still the complete file that was stored
+            if os.path.getsize(path) != recorded["size"] or file_digest(path) != recorded["sha256"]:
+                self.logger.warning(f"The cached STL {path} was modified, so it isn't reused.")
+                return None
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+        return path
+
+    # Copies the file to its new location and returns its size and SHA-256 digest
+    # The copy is written under a temporary name first, so it's never seen half written
+    def copy_file(self, source, destination):
+        digest = hashlib.sha256()
+        temp_path = destination + ".part"
+        try:
+            with open(source, "rb") as src, open(temp_path, "wb") as dst:
+                for block in iter(lambda: src.read(1024 * 1024), b""):
+                    digest.update(block)
+                    dst.write(block)
+            os.replace(temp_path, destination)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        return os.path.getsize(destination), digest.hexdigest()
+
+    # Copies the generated STL into the cache and removes the least recently used cached STLs if the cache got too big
+    # The cache keeps its own copy, so later changes to the output file can't change the cached one
+    def store_in_cache(self):
+        try:
+            os.makedirs(self.cacheDir, exist_ok=True)
+            path = self.cache_path()
+            size, digest = self.copy_file(self.saveLocation, path)
+            with open(path + ".json.part", "w", encoding="utf-8") as f:
+                json.dump({"size": size, "sha256": digest}, f)
+            os.replace(path + ".json.part", path + ".json")
+
+            # Every cached STL is listed with its record, which is removed along with it
+            cached_files = [os.path.join(self.cacheDir, filename) for filename in os.listdir(self.cacheDir)
+                            if not filename.endswith((".json", ".part"))]
+            cached_files = sorted((f for f in cached_files if os.path.isfile(f)), key=os.path.getmtime)
+
+            total_size = sum(os.path.getsize(f) for f in cached_files)
+            while cached_files and total_size > self.cacheMaxBytes:
+                oldest = cached_files.pop(0)
+                total_size -= os.path.getsize(oldest)
+                os.remove(oldest)
+                if os.path.exists(oldest + ".json"):
+                    os.remove(oldest + ".json")
+
+        except OSError as e:
+            # The cache is only an optimization so failing to update it shouldn't fail the generation
+            self.logger.warning(f"Couldn't add {self.saveLocation} to the STL cache: {e}")
+
+    # Generates a coarse version of the model in memory without writing anything to the disk
+    # The model keeps its size, only its cells are made bigger so there are at most max_cells of them along the
+    # longer side of the print bed. GDAL reads such a downsampled grid from the raster's overviews when it has any
+    # Returns the vertices (in mm) and the vertex ids of the triangles of the mesh
+    def generate_preview(self, parameters, source_dem, max_cells=96):
+        preview_parameters = dict(parameters)
+        preview_parameters.pop("totalX", None)
+        preview_parameters.pop("totalY", None)
+        preview_parameters["useCache"] = False
+        preview_parameters.pop("shard", None)
+        preview_parameters["outOfCore"] = False
+        preview_parameters["lazyRead"] = False
+        preview_parameters["lineWidth"] = max(
+            parameters["lineWidth"], max(parameters["bedX"], parameters["bedY"]) / max_cells)
+
+        self.generate_height_array(preview_parameters, source_dem)
+
+        source = ArrayHeightSource(self.array.T, self.noDataValue)
+        indexer = GridVertexIndexer()
+        vertices, faces = [np.empty((0, 3), dtype=np.float32)], [np.empty((0, 3), dtype=np.int64)]
+        for chunk in self.iter_mesh_chunks(source, self.valid_bounds(source.array)):
+            chunk_vertices, chunk_faces = indexer.add(chunk)
+            vertices.append(chunk_vertices)
+            faces.append(chunk_faces)
+
+        vertices = np.concatenate(vertices)
+        vertices[:, :2] *= self.lineWidth
+        self.finish_progress()
+
+        return vertices, np.concatenate(faces)
 
     # Function for manually generating STL
+    # Writes the model and returns the seconds its stages spent working (see stageTimings)
     def manually_generate_stl(self):
+        if self.cachedPath:
+            self.copy_file(self.cachedPath, self.saveLocation)
+            # Mark the cached STL as recently used, so it's the last one to be evicted
+            os.utime(self.cachedPath)
+            self.logger.info(
+                "Reused the cached STL file for %s.", self.saveLocation)
+            if self.validateMesh:
+                self.validate_file(self.saveLocation)
+            self.finish_progress()
+            return self.stageTimings
+
+        self.logger.info("Creating the STL file...")
+
+        if self.tileMode:
+            self.write_tiles()
+            self.finish_progress()
+            return self.stageTimings
+
+        try:
+            self.python_write_stl()
+        finally:
+            # The temporary file of a memory mapped height grid is only needed for a single generation
+            self.release_height_array()
+
+        if self.useCache:
+            self.store_in_cache()
+
+        self.finish_progress()
+
+        self.logger.info(
+            "Successfully created the STL file at %s.", self.saveLocation)
+        return self.stageTimings
+
+    # Writes the STL with the meshing engine of the DLL instead of the Python one
+    # Only supports binary STLs and doesn't report its progress or check for cancellation
+    def dll_write_stl(self):
+        self.load_library()
+
         np_float_pointer = np.ctypeslib.ndpointer(
             dtype=np.float32, ndim=2, flags="C_CONTIGUOUS")
 
@@ -216,38 +1892,59 @@ class MeshGenerator:
                                          ctypes.c_char_p]
         self.lib.generateSTL.restype = None
 
-        self.logger.info("Creating the STL file...")
-
-        self.python_write_stl()
+        # The library needs the whole grid in memory, even a memory mapped one is copied
+        if self.heightFile is not None:
+            self.logger.warning("The height grid is kept in a temporary file but the library loads all of it into memory.")
 
-        # try:
-        #     self.logger.info(
-        #         "Sending the raster data and parameters to the meshgenerator library...")
-        #     self.lib.generateSTL(self.array.astype(np.float32), self.array.shape[0], self.array.shape[1], self.noDataValue,
-        #                          self.lineWidth, self.bottomLevel, bytes(self.saveLocation, 'utf-8'))
-
-        # except Exception as e:
-        #     self.logger.error("Library function call failed!")
-        #     raise DLLFunctionFailedError("generateSTL")
-
-        self.logger.info(
-            "Successfully created the STL file at %s.", self.saveLocation)
+        try:
+            self.logger.info(
+                "Sending the raster data and parameters to the meshgenerator library...")
+            self.lib.generateSTL(np.ascontiguousarray(self.array, dtype=np.float32), self.array.shape[0], self.array.shape[1], self.noDataValue,
+                                 self.lineWidth, self.bottomLevel, bytes(self.saveLocation, 'utf-8'))
 
-    def make_triangles(self, vertices):
-        triangles = np.empty(len(vertices), dtype=self.triangle_dtype)
-        triangles["vertices"] = vertices
-        triangles["attr"] = 0
-        return triangles
+        except Exception as e:
+            self.logger.error("Library function call failed!")
+            raise DLLFunctionFailedError("generateSTL")
 
-    def python_write_stl(self):
-        # Transpose the array to flip it along its diagonal
-        # Needed b/c the generated STL will be flipped along its down diagonal otherwise
-        # NOTE: This is a temporary solution. Should look into a way of avoiding having to do this
-        self.array = self.array.T
+    # Returns the masks of the triangles and walls of every cell in the window,
+    # leaving out the outermost ring of cells which is only there to look up the neighbours
+    def cell_masks(self, valid_vertices):
+        top_left_triangles, bottom_right_triangles, bottom_left_triangles, top_right_triangles = \
+            self.triangle_masks(valid_vertices)
 
-        # A vertex in the array is valid if it's not equal to the noDataValue
-        valid_vertices = self.array != self.noDataValue
+        # Get all of the triangle edges in the array
+        has_left_edge = (top_left_triangles | bottom_left_triangles)
+        has_right_edge = (top_right_triangles | bottom_right_triangles)
+        has_top_edge = (top_left_triangles | top_right_triangles)
+        has_bottom_edge = (bottom_left_triangles | bottom_right_triangles)
 
+        # Determine if one of the edges of a triangle is also a wall
+        # A wall only occurs if there is only valid triangle on one side of the edge
+        inner = (slice(1, -1), slice(1, -1))
+
+        has_left_wall = has_left_edge[1:-1, 1:-1] & (~has_right_edge[1:-1, :-2])
+        has_right_wall = has_right_edge[1:-1, 1:-1] & (~has_left_edge[1:-1, 2:])
+        has_top_wall = has_top_edge[1:-1, 1:-1] & (~has_bottom_edge[:-2, 1:-1])
+        has_bottom_wall = has_bottom_edge[1:-1, 1:-1] & (~has_top_edge[2:, 1:-1])
+
+        has_up_diag_wall = top_left_triangles[inner] ^ bottom_right_triangles[inner]
+        has_down_diag_wall = bottom_left_triangles[inner] ^ top_right_triangles[inner]
+
+        return {
+            "top_left": top_left_triangles[inner],
+            "bottom_right": bottom_right_triangles[inner],
+            "bottom_left": bottom_left_triangles[inner],
+            "top_right": top_right_triangles[inner],
+            "left_wall": has_left_wall,
+            "right_wall": has_right_wall,
+            "top_wall": has_top_wall,
+            "bottom_wall": has_bottom_wall,
+            "up_diag_wall": has_up_diag_wall,
+            "down_diag_wall": has_down_diag_wall,
+        }
+
+    # Returns the masks of the cells with each of the surface/floor triangles, including the outermost ring of cells
+    def triangle_masks(self, valid_vertices):
         # Make 4 vertex arrays which tell whether the vertex for that cell is valid or not
         top_left_vertices = valid_vertices[:-1, :-1]
         bottom_left_vertices = valid_vertices[1:, :-1]
@@ -257,252 +1954,564 @@ class MeshGenerator:
         # Get all of the surface/floor triangles in the array
         top_left_triangles = top_left_vertices & bottom_left_vertices & top_right_vertices
         bottom_right_triangles = bottom_left_vertices & top_right_vertices & bottom_right_vertices
-        
+
         is_orientation_2 = ~(top_left_triangles & bottom_right_triangles)
 
         bottom_left_triangles = is_orientation_2 & (top_left_vertices & bottom_right_vertices & bottom_left_vertices)
         top_right_triangles = is_orientation_2 & (top_left_vertices & bottom_right_vertices & top_right_vertices)
 
-        # Get all of the triangle edges in the array
-        has_left_edge = (top_left_triangles | bottom_left_triangles)
-        has_right_edge = (top_right_triangles | bottom_right_triangles)
-        has_top_edge = (top_left_triangles | top_right_triangles)
-        has_bottom_edge = (bottom_left_triangles | bottom_right_triangles)
+        return top_left_triangles, bottom_right_triangles, bottom_left_triangles, top_right_triangles
+
+    # Meshes all the cells of a window of the height grid except for its outermost ring of cells
+    # The window's first vertex is at (x_offset, y_offset) in the full height grid
+    # The cells are meshed block by block (see window_blocks()), each block with the ring of vertices around it
+    def mesh_window(self, heights, valid_vertices, x_offset, y_offset):
+        x_chunks, y_chunks, z_chunks, bottom_chunks = [], [], [], []
+        for start, stop, is_full in self.window_blocks(valid_vertices):
+            self.check_canceled()
+            rows = slice(start - 1, stop + 2)
+            mesh_block = self.mesh_full_block if is_full else self.mesh_block
+            mesh_block(heights[rows], valid_vertices[rows], x_offset, y_offset + start - 1,
+                       (x_chunks, y_chunks, z_chunks, bottom_chunks))
+
+        if not x_chunks:
+            return MeshChunk(np.empty((0, 3), dtype=np.int64), np.empty((0, 3), dtype=np.int64),
+                             np.empty((0, 3), dtype=np.float32), np.empty((0, 3), dtype=bool))
+
+        return MeshChunk(np.concatenate(x_chunks), np.concatenate(y_chunks),
+                         np.concatenate(z_chunks), np.concatenate(bottom_chunks))
+
+    # Splits the rows of cells of the window (except for its outermost ring) into blocks of blockSize rows
+    # Returns the [start, stop) range of rows of cells of every block with a valid vertex, and whether it's full:
+    # all the vertices of its cells and of the cells around them are valid, except for the outermost columns
+    # of the window which may also be invalid on all of those rows
+    # Neighbouring blocks of the same kind are joined. The merged cells are only ever split at the empty blocks,
+    # since their rectangles and wall strips have to be meshed in one go
+    def window_blocks(self, valid_vertices):
+        height, width = valid_vertices.shape
+        valid_counts = np.count_nonzero(valid_vertices[:, 1:-1], axis=1)
+        used_rows = valid_counts > 0
+        full_rows = valid_counts == width - 2
+
+        blocks = []
+        for start in range(1, height - 2, self.blockSize):
+            stop = min(start + self.blockSize, height - 2)
+
+            # The cells of the block have no triangles or walls if none of their vertices are valid
+            if not used_rows[start:stop + 1].any():
+                continue
+
+            around = slice(start - 1, stop + 2)
+            is_full = (not self.mergeCoplanar and full_rows[around].all()
+                       and all(side.all() or not side.any() for side in valid_vertices[around, [0, -1]].T))
+
+            if blocks and blocks[-1][1] == start and blocks[-1][2] == is_full:
+                blocks[-1] = (blocks[-1][0], stop, is_full)
+            else:
+                blocks.append((start, stop, is_full))
+
+        return blocks
+
+    # Meshes the cells of a full block (see window_blocks()) straight from the templates
+    # and appends their x, y, z and bottom corners to the chunks
+    # Its cells only have the surface and floor triangles that split them from their top right to their bottom left
+    # corner, and the walls along the outermost columns of the window if they're invalid, so the corners of every
+    # template are read from slices of the window instead of being looked up cell by cell
+    def mesh_full_block(self, heights, valid_vertices, x_offset, y_offset, chunks):
+        height, width = heights.shape
+        rows = np.arange(1, height - 2)
+
+        # The columns of the inner cells with each of the templates
+        columns = {"top_left": (1, width - 2), "bottom_right": (1, width - 2)}
+        if not valid_vertices[0, 0]:
+            columns["left_wall"] = (1, 2)
+        if not valid_vertices[0, -1]:
+            columns["right_wall"] = (width - 3, width - 2)
+
+        for mask_name, corners in TRIANGLE_TEMPLATES:
+            if mask_name not in columns:
+                continue
+
+            first, last = columns[mask_name]
+            shape = (len(rows), last - first, 3)
+            x_corners = np.empty(shape, dtype=np.int64)
+            y_corners = np.empty(shape, dtype=np.int64)
+            z_corners = np.empty(shape, dtype=np.float32)
+            bottom_corners = np.empty(shape, dtype=bool)
+
+            for i, (dx, dy, is_bottom) in enumerate(corners):
+                x_corners[..., i] = np.arange(first, last) + (x_offset + dx)
+                y_corners[..., i] = rows[:, None] + (y_offset + dy)
+                bottom_corners[..., i] = is_bottom
+                if is_bottom:
+                    z_corners[..., i] = np.float32(self.bottomLevel)
+                else:
+                    z_corners[..., i] = heights[1 + dy:height - 2 + dy, first + dx:last + dx]
+
+            for window_chunks, block_corners in zip(chunks, (x_corners, y_corners, z_corners, bottom_corners)):
+                window_chunks.append(block_corners.reshape(-1, 3))
+
+    # Meshes all the cells of a block of rows of the window except for its outermost ring of cells
+    # and appends their x, y, z and bottom corners to the chunks
+    # The block's first vertex is at (x_offset, y_offset) in the full height grid
+    def mesh_block(self, heights, valid_vertices, x_offset, y_offset, chunks):
+        masks = self.cell_masks(valid_vertices)
+
+        # The surface and floor of the merged cells are meshed as rectangles instead, only their walls are kept
+        mergeable = self.coplanar_cells(heights, valid_vertices) if self.mergeCoplanar else None
+        if mergeable is not None:
+            # Only the cells with all four vertices are merged, which are split into these two triangles
+            for name in ("top_left", "bottom_right"):
+                for is_bottom, merged in enumerate(mergeable):
+                    masks[name, bool(is_bottom)] = masks[name] & ~merged[1:-1, 1:-1]
+                del masks[name]
+
+            # The straight walls are merged along their lines
+            walls = {name: masks.pop(name) for name in STRAIGHT_WALLS}
+
+        # Get the position of the cells of each mask only once
+        cells = {name: np.nonzero(mask) for name, mask in masks.items()}
+
+        x_chunks, y_chunks, z_chunks, bottom_chunks = [], [], [], []
+        for mask_name, corners in TRIANGLE_TEMPLATES:
+            self.check_canceled()
+            mask_cells = cells.get((mask_name, corners[0][2])) or cells.get(mask_name)
+            if mask_cells is None:
+                # Merged by mesh_rectangles() instead
+                continue
+            y, x = mask_cells
+
+            # Skip the ring of cells that was left out of the masks
+            y = y + 1
+            x = x + 1
+
+            x_corners = np.empty((len(y), 3), dtype=np.int64)
+            y_corners = np.empty((len(y), 3), dtype=np.int64)
+            z_corners = np.empty((len(y), 3), dtype=np.float32)
+            bottom_corners = np.empty((len(y), 3), dtype=bool)
+
+            for i, (dx, dy, is_bottom) in enumerate(corners):
+                x_corners[:, i] = x + dx
+                y_corners[:, i] = y + dy
+                bottom_corners[:, i] = is_bottom
+                if is_bottom:
+                    z_corners[:, i] = np.float32(self.bottomLevel)
+                else:
+                    z_corners[:, i] = heights[y + dy, x + dx].astype(np.float32)
+
+            x_chunks.append(x_corners)
+            y_chunks.append(y_corners)
+            z_chunks.append(z_corners)
+            bottom_chunks.append(bottom_corners)
+
+        if mergeable is not None:
+            self.check_canceled()
+            self.mesh_rectangles(heights, valid_vertices, mergeable, walls,
+                                 x_chunks, y_chunks, z_chunks, bottom_chunks)
+
+        # Move the corners to the full height grid
+        for x, y in zip(x_chunks, y_chunks):
+            x += x_offset
+            y += y_offset
+
+        for window_chunks, block_chunks in zip(chunks, (x_chunks, y_chunks, z_chunks, bottom_chunks)):
+            window_chunks.extend(block_chunks)
+
+    # Returns the masks of the cells whose surface and whose floor can be merged with their neighbours',
+    # including the outermost ring of cells
+    # The floor of every cell with all four vertices is flat, while the surface also needs the vertices to be level
+    def coplanar_cells(self, heights, valid_vertices):
+        full = valid_vertices[:-1, :-1] & valid_vertices[1:, :-1] & valid_vertices[:-1, 1:] & valid_vertices[1:, 1:]
+
+        corner = heights[:-1, :-1]
+        flat = full & (heights[1:, :-1] == corner) & (heights[:-1, 1:] == corner) & (heights[1:, 1:] == corner)
+        return flat, full
+
+    # Merges the mergeable cells of the window into rectangles and the straight walls into strips (see mesh_walls())
+    # and appends their triangles to the chunks
+    # The sides of the rectangles keep every vertex used by the other triangles so the mesh stays closed
+    def mesh_rectangles(self, heights, valid_vertices, mergeable, walls,
+                        x_chunks, y_chunks, z_chunks, bottom_chunks):
+        height, width = heights.shape
+
+        # Mark the surface and floor vertices used by the triangles of the window
+        needed = np.zeros((2, height, width), dtype=bool)
+        for x, y, bottom in zip(x_chunks, y_chunks, bottom_chunks):
+            needed[bottom.astype(np.intp), y, x] = True
+
+        # The outermost columns of cells belong to the neighbouring bands, whose triangles and rectangles
+        # end on the vertices they share with this band. Their rectangles start and end with the runs of
+        # cells of these columns, so the neighbours' vertices can be found without meshing them
+        halo_columns = (0, width - 2)
+        for column in halo_columns:
+            triangles = self.triangle_masks(valid_vertices[:, column:column + 2])
+            for level, merged in enumerate(mergeable):
+                for name, mask in zip(("top_left", "bottom_right", "bottom_left", "top_right"), triangles):
+                    rows = np.nonzero(mask[:, 0] & ~merged[:, column])[0]
+                    for dx, dy, _ in SURFACE_TRIANGLES[name]:
+                        needed[level, rows + dy, column + dx] = True
+
+        rectangles = []
+        for level, merged in enumerate(mergeable):
+            is_bottom = bool(level)
+            columns, starts, stops = find_runs(merged, None if is_bottom else heights[:-1, :-1])
+
+            in_halo = np.isin(columns, halo_columns)
+            for x in (columns[in_halo], columns[in_halo] + 1):
+                for y in (starts[in_halo], stops[in_halo]):
+                    needed[level, y, x] = True
+
+            columns, starts, stops = columns[~in_halo], starts[~in_halo], stops[~in_halo]
+            if len(columns) == 0:
+                continue
+
+            keys = None if is_bottom else heights[starts, columns]
+            x_start, x_stop, y_start, y_stop = merge_runs(columns, starts, stops, keys)
+            for x in (x_start, x_stop):
+                for y in (y_start, y_stop):
+                    needed[level, y, x] = True
+            rectangles.append((is_bottom, x_start, x_stop, y_start, y_stop))
+
+        # The walls only keep the floor vertices they need, which the floor rectangles have to keep as well
+        self.mesh_walls(heights, walls, needed, x_chunks, y_chunks, z_chunks, bottom_chunks)
+
+        for is_bottom, x_start, x_stop, y_start, y_stop in rectangles:
+            x, y = triangulate_rectangles(x_start, x_stop, y_start, y_stop, needed[int(is_bottom)])
+            if is_bottom:
+                # The floor faces down
+                x[:, 1:] = x[:, 2:0:-1]
+                y[:, 1:] = y[:, 2:0:-1]
+                z = np.full(x.shape, self.bottomLevel, dtype=np.float32)
+            else:
+                z = heights[y, x].astype(np.float32)
+
+            x_chunks.append(x)
+            y_chunks.append(y)
+            z_chunks.append(z)
+            bottom_chunks.append(np.full(x.shape, is_bottom))
+
+    # Merges the consecutive straight walls on the same line of the window into strips and appends their triangles
+    # to the chunks. The strips keep the surface vertices used by the other triangles, and the floor vertices they
+    # share with the other triangles or need not to fold over, which get marked in the needed grid
+    def mesh_walls(self, heights, walls, needed, x_chunks, y_chunks, z_chunks, bottom_chunks):
+        runs = {}
+        for name, mask in walls.items():
+            (dx, dy), (end_dx, _) = STRAIGHT_WALLS[name]
+            along_y = dx == end_dx
+
+            # Runs of walls down the columns of cells for the walls along the y axis and along the rows for the others,
+            # as the line of vertices they're on and the first and last vertex along it
+            lines, starts, stops = find_runs(mask if along_y else mask.T)
+            lines, starts, stops = lines + 1 + (dx if along_y else dy), starts + 1, stops + 1
+            runs[name] = along_y, lines, starts, stops
+
+            # The ends of the strips are shared with the triangles around them
+            for position in (starts, stops):
+                x, y = (lines, position) if along_y else (position, lines)
+                needed[:, y, x] = True
+
+        for name, (along_y, lines, starts, stops) in runs.items():
+            if len(lines) == 0:
+                continue
+
+            owners, positions = value_ranges(starts, stops + 1)
+            x, y = (lines[owners], positions) if along_y else (positions, lines[owners])
+
+            points, on_bottom, bottom = triangulate_walls(owners, heights[y, x], needed[0, y, x], needed[1, y, x],
+                                                          self.bottomLevel)
+            needed[1, y[bottom], x[bottom]] = True
+            x, y = x[points], y[points]
+
+            # Give the triangles the winding of the wall's own triangles (see zip_walls())
+            corners = next(corners for mask_name, corners in TRIANGLE_TEMPLATES if mask_name == name)
+            (p0, u0), (p1, u1), (p2, u2) = [(dy if along_y else dx, not is_bottom) for dx, dy, is_bottom in corners]
+            if (p1 - p0) * (u2 - u0) - (u1 - u0) * (p2 - p0) > 0:
+                x[:, 1:] = x[:, 2:0:-1]
+                y[:, 1:] = y[:, 2:0:-1]
+                on_bottom[:, 1:] = on_bottom[:, 2:0:-1]
+
+            x_chunks.append(x)
+            y_chunks.append(y)
+            z_chunks.append(np.where(on_bottom, np.float32(self.bottomLevel), heights[y, x]).astype(np.float32))
+            bottom_chunks.append(on_bottom)
+
+    # Reads the windows of the cells inside of the bounds (x_min, x_max, y_min, y_max) of the height grid band by band
+    # Every vertex outside of the bounds is treated as a no data vertex so the mesh is closed off with walls
+    # Only the bands with the cell columns in [x_start, x_stop) are read if they're given
+    # Yields the arguments of mesh_window() for every band
+    def iter_windows(self, source, bounds=None, x_start=None, x_stop=None):
+        (x_min, x_max, y_min, y_max), bands = self.window_layout(source, bounds, x_start, x_stop)
+
+        for band_start in bands:
+            self.check_canceled()
+            band_stop = min(band_start + bands.step, bands.stop)
+
+            # Pad the band with one extra ring of vertices on each side to find the walls on its edges
+            heights = source.window(y_min - 1, y_max + 2, band_start - 1, band_stop + 2)
+
+            # Only the vertices inside of the bounds are valid
+            valid_vertices = heights != self.noDataValue
+            valid_vertices[:, :max(0, x_min - band_start + 1)] = False
+            valid_vertices[:, x_max - band_start + 2:] = False
+            valid_vertices[[0, -1], :] = False
+
+            yield heights, valid_vertices, band_start - 1, y_min - 1
+
+    # Returns the bounds and the range of the first cell columns of the bands that iter_windows() reads
+    def window_layout(self, source, bounds=None, x_start=None, x_stop=None):
+        height, width = source.shape
+        x_min, x_max, y_min, y_max = bounds or (0, width - 1, 0, height - 1)
+        x_start = x_min if x_start is None else x_start
+        x_stop = x_max if x_stop is None else x_stop
+
+        # Number of cell columns in a band so each band holds roughly the same number of cells
+        band_width = max(1, self.bandSize // (y_max - y_min + 2))
+
+        return (x_min, x_max, y_min, y_max), range(x_start, x_stop, band_width)
+
+    # Returns the number of windows iter_windows() yields
+    def count_windows(self, source, bounds=None, x_start=None, x_stop=None):
+        return len(self.window_layout(source, bounds, x_start, x_stop)[1])
+
+    # Generates the mesh of the cells inside of the bounds band by band (see iter_windows())
+    def iter_mesh_chunks(self, source, bounds=None, x_start=None, x_stop=None):
+        for window in self.iter_windows(source, bounds, x_start, x_stop):
+            yield self.mesh_window(*window)
+
+    # Meshes every (writer, window) pair and writes the chunk with its writer.
+    # The stages run side by side when the pipelined mode is on, otherwise one after the other
+    # The progress of the mesh stage is reported out of the given total number of jobs, of which the first
+    # start were already done earlier. Returns the number of jobs that were done afterwards
+    def mesh_and_write(self, jobs, total, start=0):
+        done = start
+
+        def mesh(job):
+            writer, window = job
+            chunk = self.mesh_window(*window)
+
+            # The chunk is only passed on if its mesh is validated
+            validated_chunk = chunk if writer in self.validators else None
+            if not writer.splittable:
+                return writer, [writer.prepare(chunk)], validated_chunk
+
+            # Prepare the chunk in slices so the cancellation is checked in between
+            prepared = []
+            for piece in chunk.split(self.sliceSize):
+                self.check_canceled()
+                prepared.append(writer.prepare(piece))
+            return writer, prepared, validated_chunk
+
+        def write(result):
+            nonlocal done
+            writer, prepared, validated_chunk = result
+            for data in prepared:
+                self.check_canceled()
+                writer.write_prepared(data)
+
+            # The validators have to get the chunks in order too
+            if validated_chunk is not None:
+                self.validators[writer].add(validated_chunk)
+
+            done += 1
+            self.progress_update(done / max(total, 1))
+
+        pipeline = MeshPipeline(self.meshWorkers, self.readQueueDepth, self.writeQueueDepth)
+        if self.pipelined:
+            pipeline.run(jobs, mesh, write)
+        else:
+            pipeline.run_serial(jobs, mesh, write)
+
+        # The tiles of a model are meshed in several calls, so their timings are added up
+        for stage, seconds in pipeline.timings().items():
+            self.stageTimings[stage] = self.stageTimings.get(stage, 0.0) + seconds
+        elapsed = self.stageTimings["elapsed"]
+        self.stageUtilisation = {stage: seconds / elapsed if elapsed > 0 else 0.0
+                                 for stage, seconds in self.stageTimings.items() if stage != "elapsed"}
+        self.logger.info(
+            "Stage utilisation: " + ", ".join(f"{stage} {share:.0%}" for stage, share in self.stageUtilisation.items())
+        )
+        return done
 
-        # Determine if one of the edges of a triangle is also a wall
-        # A wall only occurs if there is only valid triangle on one side of the edge
-        has_left_wall = np.copy(has_left_edge)
-        has_left_wall[:, 1:] = has_left_edge[:, 1:] & (~has_right_edge[:, :-1])
-
-        has_right_wall = np.copy(has_right_edge)
-        has_right_wall[:, :-1] = has_right_edge[:, :-1] & (~has_left_edge[:, 1:])
-
-        has_top_wall = np.copy(has_top_edge)
-        has_top_wall[1:, :] = has_top_edge[1:, :] & (~has_bottom_edge[:-1, :])
-
-        has_bottom_wall = np.copy(has_bottom_edge)
-        has_bottom_wall[:-1, :] = has_bottom_edge[:-1, :] & (~has_top_edge[1:, :])
-
-        has_up_diag_wall = top_left_triangles ^ bottom_right_triangles
-
-        has_down_diag_wall = bottom_left_triangles ^ top_right_triangles
-
-        # Write all of the triangles for the STL into a numpy array
-
-
-        y, x = np.where(top_left_triangles)
-
-        bottom = np.full(len(y), self.bottomLevel, dtype=np.float32)
-
-        top_left_portion_surface = self.make_triangles(np.stack([
-                                                np.column_stack([x.astype(np.float32), y.astype(np.float32), self.array[y, x].astype(np.float32)]),
-                                                np.column_stack([(x + 1).astype(np.float32), y.astype(np.float32), self.array[y, x + 1].astype(np.float32)]),
-                                                np.column_stack([x.astype(np.float32), (y + 1).astype(np.float32), self.array[y + 1, x].astype(np.float32)]),
-                                                ],
-                                                axis=1))
-        top_left_portion_floor = self.make_triangles(np.stack([
-                                                np.column_stack([x.astype(np.float32), y.astype(np.float32), bottom]),
-                                                np.column_stack([x.astype(np.float32), (y + 1).astype(np.float32), bottom]), 
-                                                np.column_stack([(x + 1).astype(np.float32), y.astype(np.float32), bottom]),
-                                                ],
-                                                axis=1))
-
-        # Calculate all of the bottom right triangles for the surface and floor portions of the STL
-        y, x = np.where(bottom_right_triangles)
-
-        bottom = np.full(len(y), self.bottomLevel, dtype=np.float32)
-
-        bottom_right_portion_surface = self.make_triangles(np.stack([
-                                                    np.column_stack([(x + 1).astype(np.float32), y.astype(np.float32), self.array[y, x + 1].astype(np.float32)]),
-                                                    np.column_stack([(x + 1).astype(np.float32), (y + 1).astype(np.float32), self.array[y + 1, x + 1].astype(np.float32)]),
-                                                    np.column_stack([x.astype(np.float32), (y + 1).astype(np.float32), self.array[y + 1, x].astype(np.float32)]),
-                                                    ],
-                                                    axis=1))
-        bottom_right_portion_floor = self.make_triangles(np.stack([
-                                                    np.column_stack([(x + 1).astype(np.float32), y.astype(np.float32), bottom]),
-                                                    np.column_stack([x.astype(np.float32), (y + 1).astype(np.float32), bottom]),
-                                                    np.column_stack([(x + 1).astype(np.float32), (y + 1).astype(np.float32), bottom]),
-                                                    ],
-                                                    axis=1))
-
-        # Calculate all of the bottom left triangles for the surface and floor portions of the STL
-        y, x = np.where(bottom_left_triangles)
-
-        bottom = np.full(len(y), self.bottomLevel, dtype=np.float32)
-
-        bottom_left_portion_surface = self.make_triangles(np.stack([
-                                                    np.column_stack([(x).astype(np.float32), (y).astype(np.float32), self.array[y, x].astype(np.float32)]),
-                                                    np.column_stack([(x + 1).astype(np.float32), (y + 1).astype(np.float32), self.array[y + 1, x + 1].astype(np.float32)]),
-                                                    np.column_stack([x.astype(np.float32), (y + 1).astype(np.float32), self.array[y + 1, x].astype(np.float32)]),
-                                                    ],
-                                                    axis=1))
-        bottom_left_portion_floor = self.make_triangles(np.stack([
-                                                    np.column_stack([(x).astype(np.float32), (y).astype(np.float32), bottom]),
-                                                    np.column_stack([x.astype(np.float32), (y + 1).astype(np.float32), bottom]),
-                                                    np.column_stack([(x + 1).astype(np.float32), (y + 1).astype(np.float32), bottom]),
-                                                    ],
-                                                    axis=1))
-
-        # Calculate all of the top right triangles for the surface and floor portions of the STL
-        y, x = np.where(top_right_triangles)
-
-        bottom = np.full(len(y), self.bottomLevel, dtype=np.float32)
-
-        top_right_portion_surface = self.make_triangles(np.stack([
-                                                np.column_stack([(x + 1).astype(np.float32), y.astype(np.float32), self.array[y, x + 1].astype(np.float32)]),
-                                                np.column_stack([(x + 1).astype(np.float32), (y + 1).astype(np.float32), self.array[y + 1, x + 1].astype(np.float32)]),
-                                                np.column_stack([x.astype(np.float32), (y).astype(np.float32), self.array[y, x].astype(np.float32)]),
-                                                ],
-                                                axis=1))
-        top_right_portion_floor = self.make_triangles(np.stack([
-                                                np.column_stack([(x + 1).astype(np.float32), y.astype(np.float32), bottom]),
-                                                np.column_stack([x.astype(np.float32), (y).astype(np.float32), bottom]),
-                                                np.column_stack([(x + 1).astype(np.float32), (y + 1).astype(np.float32), bottom]),
-                                                ],
-                                                axis=1))
-
-        # Write all of the wall triangles into a numpy array
-
-        y, x = np.where(has_left_wall)
-        bottom = np.full(len(y), self.bottomLevel, dtype=np.float32)
-
-        left_wall_1 = self.make_triangles(np.stack([
-                                                np.column_stack([(x).astype(np.float32), y.astype(np.float32), self.array[y, x].astype(np.float32)]),
-                                                np.column_stack([(x).astype(np.float32), (y + 1).astype(np.float32), bottom]),
-                                                np.column_stack([x.astype(np.float32), (y).astype(np.float32), bottom]),
-                                                ],
-                                                axis=1))
-        left_wall_2 = self.make_triangles(np.stack([
-                                                np.column_stack([(x).astype(np.float32), y.astype(np.float32), self.array[y, x].astype(np.float32)]),
-                                                np.column_stack([x.astype(np.float32), (y + 1).astype(np.float32), self.array[y + 1, x].astype(np.float32)]),
-                                                np.column_stack([(x).astype(np.float32), (y + 1).astype(np.float32), bottom]),
-                                                ],
-                                                axis=1))
-
-        y, x = np.where(has_right_wall)
-        bottom = np.full(len(y), self.bottomLevel, dtype=np.float32)
-
-        right_wall_1 = self.make_triangles(np.stack([
-                                                np.column_stack([(x + 1).astype(np.float32), y.astype(np.float32), self.array[y, x + 1].astype(np.float32)]),
-                                                np.column_stack([(x + 1).astype(np.float32), (y).astype(np.float32), bottom]),
-                                                np.column_stack([(x + 1).astype(np.float32), (y + 1).astype(np.float32), bottom]),
-                                                ],
-                                                axis=1))
-        right_wall_2 = self.make_triangles(np.stack([
-                                                np.column_stack([(x + 1).astype(np.float32), y.astype(np.float32), self.array[y, x + 1].astype(np.float32)]),
-                                                np.column_stack([(x + 1).astype(np.float32), (y + 1).astype(np.float32), bottom]),
-                                                np.column_stack([(x + 1).astype(np.float32), (y + 1).astype(np.float32), self.array[y + 1, x + 1].astype(np.float32)]),
-                                                ],
-                                                axis=1))
-
-        y, x = np.where(has_top_wall)
-        bottom = np.full(len(y), self.bottomLevel, dtype=np.float32)
-
-        top_wall_1 = self.make_triangles(np.stack([
-                                            np.column_stack([(x).astype(np.float32), y.astype(np.float32), self.array[y, x].astype(np.float32)]),
-                                            np.column_stack([(x).astype(np.float32), (y).astype(np.float32), bottom]),
-                                            np.column_stack([(x + 1).astype(np.float32), (y).astype(np.float32), bottom]),
-                                        ],
-                                        axis=1))
-        top_wall_2 = self.make_triangles(np.stack([
-                                            np.column_stack([(x).astype(np.float32), y.astype(np.float32), self.array[y, x].astype(np.float32)]),
-                                            np.column_stack([(x + 1).astype(np.float32), (y).astype(np.float32), bottom]),
-                                            np.column_stack([(x + 1).astype(np.float32), (y).astype(np.float32), self.array[y, x + 1].astype(np.float32)]),
-                                        ],
-                                        axis=1))
-
-        y, x = np.where(has_bottom_wall)
-        bottom = np.full(len(y), self.bottomLevel, dtype=np.float32)
-
-        bottom_wall_1 = self.make_triangles(np.stack([
-                                                np.column_stack([(x).astype(np.float32), (y + 1).astype(np.float32), self.array[y + 1, x].astype(np.float32)]),
-                                                np.column_stack([(x + 1).astype(np.float32), (y + 1).astype(np.float32), bottom]),
-                                                np.column_stack([(x).astype(np.float32), (y + 1).astype(np.float32), bottom]),
-                                            ],
-                                            axis=1))
-        bottom_wall_2 = self.make_triangles(np.stack([
-                                                np.column_stack([(x).astype(np.float32), (y + 1).astype(np.float32), self.array[y + 1, x].astype(np.float32)]),
-                                                np.column_stack([(x + 1).astype(np.float32), (y + 1).astype(np.float32), self.array[y + 1, x + 1].astype(np.float32)]),
-                                                np.column_stack([(x + 1).astype(np.float32), (y + 1).astype(np.float32), bottom]),
-                                            ],
-                                            axis=1))
-
-        y, x = np.where(has_up_diag_wall)
-        bottom = np.full(len(y), self.bottomLevel, dtype=np.float32)
-
-        up_diag_wall_1 = self.make_triangles(np.stack([
-                                                np.column_stack([(x + 1).astype(np.float32), y.astype(np.float32), self.array[y, x + 1].astype(np.float32)]),
-                                                np.column_stack([x.astype(np.float32), (y + 1).astype(np.float32), self.array[y + 1, x].astype(np.float32)]),
-                                                np.column_stack([x.astype(np.float32), (y + 1).astype(np.float32), bottom]),
-                                                ],
-                                                axis=1))
-        up_diag_wall_2 = self.make_triangles(np.stack([
-                                                np.column_stack([(x + 1).astype(np.float32), y.astype(np.float32), self.array[y, x + 1].astype(np.float32)]),
-                                                np.column_stack([x.astype(np.float32), (y + 1).astype(np.float32), bottom]),
-                                                np.column_stack([(x + 1).astype(np.float32), (y).astype(np.float32), bottom]),
-                                                ],
-                                                axis=1))
-
-        y, x = np.where(has_down_diag_wall)
-        bottom = np.full(len(y), self.bottomLevel, dtype=np.float32)
-
-        down_diag_wall_1 = self.make_triangles(np.stack([
-                                            np.column_stack([(x).astype(np.float32), (y).astype(np.float32), self.array[y, x].astype(np.float32)]),
-                                            np.column_stack([x.astype(np.float32), (y).astype(np.float32), bottom]),
-                                            np.column_stack([(x + 1).astype(np.float32), (y + 1).astype(np.float32), bottom]),
-                                            ],
-                                            axis=1))
-        down_diag_wall_2 = self.make_triangles(np.stack([
-                                            np.column_stack([(x).astype(np.float32), (y).astype(np.float32), self.array[y, x].astype(np.float32)]),
-                                            np.column_stack([(x + 1).astype(np.float32), (y + 1).astype(np.float32), bottom]),
-                                            np.column_stack([(x + 1).astype(np.float32), (y + 1).astype(np.float32), self.array[y + 1, x + 1].astype(np.float32)]),
-                                            ],
-                                            axis=1))
-
-        # Combine all the triangle arrays
-
-        triangles = np.concatenate([
-            top_left_portion_surface, top_left_portion_floor,
-            bottom_right_portion_surface, bottom_right_portion_floor,
-            bottom_left_portion_surface, bottom_left_portion_floor,
-            top_right_portion_surface, top_right_portion_floor,
-            left_wall_1, left_wall_2,
-            right_wall_1, right_wall_2,
-            top_wall_1, top_wall_2,
-            bottom_wall_1, bottom_wall_2,
-            up_diag_wall_1, up_diag_wall_2,
-            down_diag_wall_1, down_diag_wall_2,
-        ])
+    # Returns the writer for the selected output format
+    def create_writer(self, path, origin=(0, 0)):
+        if self.outputFormat not in WRITERS:
+            raise MeshGeneratorError(f"Unknown output format: {self.outputFormat}")
 
-        # Calculate normals
-        v0 = triangles["vertices"][:, 0]
-        v1 = triangles["vertices"][:, 1]
-        v2 = triangles["vertices"][:, 2]
+        writer = WRITERS[self.outputFormat]
+        if getattr(writer, "compressed", False):
+            return writer(path, self.stl_header(), self.lineWidth, origin=origin,
+                          compression_level=self.compressionLevel, threads=self.compressionThreads)
 
-        edge1 = v1 - v0
-        edge2 = v2 - v0
+        return writer(path, self.stl_header(), self.lineWidth, origin=origin)
 
-        normals = np.cross(edge1, edge2)
+    def python_write_stl(self):
+        if self.lazyRead:
+            # The grid isn't read up front, so the bounding box of its valid vertices isn't known
+            source, bounds = self.heightSource, None
+        else:
+            # The mesh is generated from the transposed array
+            # Needed b/c the generated STL will be flipped along its down diagonal otherwise
+            # NOTE: This is a temporary solution. Should look into a way of avoiding having to do this
+            source = ArrayHeightSource(self.array.T, self.noDataValue)
+
+            # Clipped rasters are mostly no data, so only the bounding box of the valid vertices is meshed
+            bounds = self.valid_bounds(source.array)
+
+        # A shard only meshes the bands of its columns. Their windows still read the rows next to them,
+        # so no walls are put along the seams
+        x_start, x_stop = None, None
+        if self.shard is not None:
+            from .mesh_shards import create_shard_writer
+            x_start, x_stop = self.shard["xStart"], self.shard["xStop"]
+            writer = create_shard_writer(self.saveLocation, self.outputFormat, self.stl_header(), self.lineWidth)
+        else:
+            writer = self.create_writer(self.saveLocation)
 
-        lengths = np.linalg.norm(normals, axis=1)
+        self.start_validation(writer)
+        try:
+            self.progress_stage("mesh")
+            self.mesh_and_write(((writer, window) for window in self.iter_windows(source, bounds, x_start, x_stop)),
+                                self.count_windows(source, bounds, x_start, x_stop))
+        except BaseException:
+            self.validators.pop(writer, None)
+            writer.abort()
+            raise
+
+        self.progress_stage("finish")
+        writer.progressCallback = self.progress_update
+        self.numTriangles = writer.close()
+        self.finish_validation(writer)
+
+    # Returns the bounds (x_min, x_max, y_min, y_max) of the valid vertices of the height grid, None if there are none
+    # The grid is checked in bands of columns so a memory mapped grid is never loaded all at once
+    def valid_bounds(self, grid):
+        height, width = grid.shape
+        valid_columns = np.zeros(width, dtype=bool)
+        valid_rows = np.zeros(height, dtype=bool)
+
+        band_width = max(1, self.bandSize // max(height, 1))
+        for start in range(0, width, band_width):
+            valid = grid[:, start:start + band_width] != self.noDataValue
+            valid_columns[start:start + band_width] = valid.any(axis=0)
+            valid_rows |= valid.any(axis=1)
+
+        columns = np.flatnonzero(valid_columns)
+        rows = np.flatnonzero(valid_rows)
+        if len(columns) == 0:
+            return None
+
+        return int(columns[0]), int(columns[-1]), int(rows[0]), int(rows[-1])
+
+    # Starts checking the mesh the writer is given, if the validation was asked for
+    def start_validation(self, writer):
+        if self.validateMesh:
+            from .mesh_validator import GridMeshValidator
+            self.validators[writer] = GridMeshValidator()
+
+    # Counts the remaining edges of the writer's mesh and logs the result
+    def finish_validation(self, writer):
+        validator = self.validators.pop(writer, None)
+        if validator is None:
+            return
+
+        self.record_validation(writer.path, validator.finish())
+
+    # Validates an already written file, only binary STLs can be read back
+    def validate_file(self, path):
+        if self.outputFormat not in ("stl", "stl.gz"):
+            self.logger.info(f"Skipped validating {path} since its format can't be read back.")
+            return
+
+        from .mesh_validator import validate_stl
+        self.record_validation(path, validate_stl(path, self.check_canceled, self.tempDir))
+
+    def record_validation(self, path, result):
+        self.validationResults.append((path, result))
+        if result.isWatertight:
+            self.logger.info(f"{path}: {result}")
+        else:
+            self.logger.warning(f"{path}: {result}")
 
-        valid = lengths > 0
-        normals[valid] /= lengths[valid, None]
+    # Splits the model into a grid of tiles that each fit on the print bed and writes an STL for every one of them
+    # The DEM is read band by band so the full model is never loaded into memory at once
+    def write_tiles(self):
+        source = self.heightSource
+        height, width = source.shape
 
-        triangles["normal"] = normals
+        # Number of cells that fit on the print bed along each axis
+        tile_width = max(1, int(self.bedX / self.lineWidth))
+        tile_height = max(1, int(self.bedY / self.lineWidth))
 
-        # Scale by line width
-        triangles["vertices"][:, :, 0] *= self.lineWidth
-        triangles["vertices"][:, :, 1] *= self.lineWidth
+        # Neighbouring tiles share the vertices along their edges so they line up perfectly
+        x_tiles = list(range(0, width - 1, tile_width))
+        y_tiles = list(range(0, height - 1, tile_height))
 
-        # Write the STL file
-        with open(self.saveLocation, "wb") as f:
-            # Write the header of the binary STL
-            f.write(b"\0" * 80)
+        self.logger.info(f"Splitting {self.name} into {len(x_tiles)} by {len(y_tiles)} tiles.")
 
-            # Write in the number of triangles
-            f.write(np.uint32(len(triangles)).tobytes())
-            
-            # Write in the surface faces
-            f.write(triangles.tobytes())
+        # Keep multi part extensions like .stl.gz together
+        extension = OUTPUT_FORMATS[self.outputFormat].extension
+        if self.saveLocation.endswith(extension):
+            base_path = self.saveLocation[:-len(extension)]
+        else:
+            base_path, extension = os.path.splitext(self.saveLocation)
+        self.tileLocations = []
+        self.numTriangles = 0
 
+        # Fill in the tiles one band at a time so only a single band of the DEM is read into memory
+        band_width = max(1, self.bandSize // (height + 1))
+
+        def tile_bands(x_start, x_stop):
+            return [(band_start, min(band_start + band_width, x_stop))
+                    for band_start in range(x_start, x_stop, band_width)]
+
+        # Number of windows read for all the tiles, used for the progress
+        total = 0
+        for x_start in x_tiles:
+            x_stop = min(x_start + tile_width, width - 1)
+            for y_start in y_tiles:
+                bounds = (x_start, x_stop, y_start, min(y_start + tile_height, height - 1))
+                total += sum(self.count_windows(source, bounds, band_start, band_stop)
+                             for band_start, band_stop in tile_bands(x_start, x_stop))
+
+        self.progress_stage("mesh")
+        done = 0
+
+        for column, x_start in enumerate(x_tiles):
+            x_stop = min(x_start + tile_width, width - 1)
+
+            # Open all the tiles of this column so they can be filled band by band
+            writers = []
+            try:
+                for row, y_start in enumerate(y_tiles):
+                    y_stop = min(y_start + tile_height, height - 1)
+                    location = f"{base_path}_tile_{column + 1}_{row + 1}{extension}"
+                    writers.append((self.create_writer(location, origin=(x_start, y_start)),
+                                    (x_start, x_stop, y_start, y_stop)))
+                    self.start_validation(writers[-1][0])
+
+                # Mesh the tiles of the column band by band
+                done = self.mesh_and_write(
+                    ((writer, window)
+                     for band_start, band_stop in tile_bands(x_start, x_stop)
+                     for writer, bounds in writers
+                     for window in self.iter_windows(source, bounds, band_start, band_stop)),
+                    total, done)
+
+            except BaseException:
+                for writer, _ in writers:
+                    self.validators.pop(writer, None)
+                    writer.abort()
+
+                # Don't leave an incomplete set of tiles behind
+                for location in self.tileLocations:
+                    if os.path.exists(location):
+                        os.remove(location)
+                self.tileLocations = []
+                raise
+
+            for writer, _ in writers:
+                self.numTriangles += writer.close()
+                self.tileLocations.append(writer.path)
+                self.finish_validation(writer)
+
+        self.logger.info(f"Wrote {len(self.tileLocations)} tiles with {self.numTriangles} triangles in total.")
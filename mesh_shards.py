@@ -0,0 +1,356 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ MeshShards
+                                 A QGIS plugin
+ This plugin lets you generate an STL from a DEM and allows the exclusion of nodata regions.
+                             -------------------
+        copyright            : (C) 2022 by Suheyb Aden
+        email                : suheyb1@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ Splits the generation of a single model from a huge DEM across several machines.
+ plan_shards() splits the rows of the DEM into shards and writes a manifest with everything the shards have to
+ share: the size of the height grid, the elevation range, the vertical exaggeration and the bottom level.
+ Every shard can then be meshed on its own machine with mesh_shard(), and merge_shards() joins them into the model.
+ A shard is a range of the bands the mesh generator splits every model into. The windows of its bands read the
+ rows next to it as well, so nothing is put along the seams, exactly like between the bands of a single model.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+from .mesh_generator import (
+    ENGINE_VERSION, WRITERS, MeshChunk, MeshGenerator, MeshGeneratorError, STLWriter, stl_header,
+)
+from .output_formats import OUTPUT_FORMATS
+
+
+# Version of the layout of the manifests, bumped whenever a field is renamed or its meaning changes
+MANIFEST_VERSION = 1
+
+# Formats whose shards are binary STLs that are merged by concatenating their triangles
+# The shards of the other formats keep their chunks, which are welded together while the model is written
+CONCATENATED_FORMATS = ("stl", "stl.gz")
+
+# Parameters that are set for every shard on its own
+SHARD_PARAMETERS = ("saveLocation", "shard", "useCache", "lazyRead")
+
+# Types the chunks of the shards are stored as
+CHUNK_DTYPES = (np.int32, np.int32, np.float32, np.bool_)
+
+
+class ShardMismatchError(MeshGeneratorError):
+    def __init__(self, index, message="The shard doesn't match its manifest"):
+        self.index = index
+        self.message = message
+        super().__init__(self.message)
+
+
+class ShardChunkWriter:
+    """
+    Writes the mesh chunks of a shard as they are, in grid units and one after the other.
+    The merge hands them to the writer of the model band by band, so its vertices are welded across
+    the seams the same way as between the bands of a single model.
+    """
+
+    splittable = False
+
+    def __init__(self, path):
+        self.path = path
+        self.numTriangles = 0
+        self.progressCallback = None
+        self.tempPath = path + ".part"
+        self.file = open(self.tempPath, "wb")
+
+    def prepare(self, chunk):
+        return chunk
+
+    def write_prepared(self, chunk):
+        self.write(chunk)
+
+    def write(self, chunk):
+        if len(chunk) == 0:
+            return
+
+        for array, dtype in zip((chunk.x, chunk.y, chunk.z, chunk.bottom), CHUNK_DTYPES):
+            np.save(self.file, np.ascontiguousarray(array, dtype=dtype), allow_pickle=False)
+        self.numTriangles += len(chunk)
+
+    def close(self):
+        self.file.close()
+        os.replace(self.tempPath, self.path)
+        return self.numTriangles
+
+    def abort(self):
+        self.file.close()
+        if os.path.exists(self.tempPath):
+            os.remove(self.tempPath)
+
+
+def create_shard_writer(path, output_format, header, line_width):
+    """Returns the writer of a shard of a model in the given format."""
+    if output_format in CONCATENATED_FORMATS:
+        # Even the compressed STLs are merged from plain ones, which are compressed in one go
+        return STLWriter(path, header, line_width)
+    return ShardChunkWriter(path)
+
+
+def read_shard_chunks(path):
+    """Yields the chunks written by a ShardChunkWriter."""
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        while f.tell() < size:
+            yield MeshChunk(*(np.load(f, allow_pickle=False) for _ in CHUNK_DTYPES))
+
+
+def shard_ranges(num_columns, num_shards):
+    """Splits the cell columns of the height grid into num_shards ranges of about the same size."""
+    num_shards = max(1, min(num_shards, num_columns))
+    edges = [num_columns * i // num_shards for i in range(num_shards + 1)]
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def shard_path(manifest_path, manifest, index, folder=None):
+    """Returns the path of the file of a shard, which is kept next to the manifest unless another folder is given."""
+    folder = folder or os.path.dirname(os.path.abspath(manifest_path))
+    return os.path.join(folder, manifest["shards"][index]["file"])
+
+
+def plan_shards(parameters, source_dem, manifest_path, num_shards=None, shard_rows=None):
+    """
+    Splits the model into shards of about the same number of DEM rows and writes its manifest.
+    Either the number of shards or the number of rows (of the height grid) in each shard has to be given.
+    The parameters are the ones of MeshGenerator.generate_height_array(), saveLocation being the merged model.
+    Returns the manifest.
+    """
+    if parameters.get("totalX") is not None or parameters.get("totalY") is not None:
+        raise MeshGeneratorError("Tiled models can't be split into shards")
+    if not num_shards and not shard_rows:
+        raise MeshGeneratorError("Either the number of shards or their number of rows has to be given")
+
+    output_format = parameters.get("outputFormat", "stl")
+    if output_format not in OUTPUT_FORMATS:
+        raise MeshGeneratorError(f"Unknown output format: {output_format}")
+
+    # Only the statistics of the DEM are read, the grid itself is only read by the shards
+    generator = MeshGenerator()
+    planned = dict(parameters)
+    planned.update(useCache=False, lazyRead=True)
+    generator.generate_height_array(planned, source_dem)
+
+    # The grid is transposed, its columns are the rows of the DEM
+    height, width = generator.heightSource.shape
+    num_columns = max(width - 1, 0)
+    if not num_shards:
+        num_shards = -(-num_columns // shard_rows)
+
+    # Every shard gets the elevation range of the whole DEM, so they're all scaled the same way
+    shared = {key: value for key, value in parameters.items() if key not in SHARD_PARAMETERS}
+    shared["minValue"], shared["maxValue"] = generator.elevationRange
+
+    stem = os.path.splitext(os.path.basename(manifest_path))[0]
+    extension = ".stl" if output_format in CONCATENATED_FORMATS else ".chunks"
+    manifest = {
+        "version": MANIFEST_VERSION,
+        "engine": ENGINE_VERSION,
+        "dem": os.path.abspath(source_dem) if os.path.exists(source_dem) else source_dem,
+        "rasterSize": [generator.dem.RasterXSize, generator.dem.RasterYSize],
+        "parameters": shared,
+        "output": parameters["saveLocation"],
+        "fingerprint": generator.fingerprint,
+        "grid": [height, width],
+        "verticalExaggeration": generator.verticalExaggeration,
+        "bottomLevel": generator.bottomLevel,
+        "noDataValue": generator.noDataValue,
+        "shards": [
+            {"index": index, "xStart": x_start, "xStop": x_stop, "file": f"{stem}.shard-{index:04d}{extension}"}
+            for index, (x_start, x_stop) in enumerate(shard_ranges(num_columns, num_shards))
+        ],
+    }
+    manifest["id"] = hashlib.sha256(json.dumps(manifest, sort_keys=True).encode("utf-8")).hexdigest()
+
+    temp_path = manifest_path + ".part"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(temp_path, manifest_path)
+
+    return manifest
+
+
+def load_manifest(manifest_path):
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        raise MeshGeneratorError(f"Couldn't read the shard manifest {manifest_path}: {e}")
+
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise MeshGeneratorError(f"The shard manifest {manifest_path} was written by another version of the plugin")
+    if manifest["engine"] != ENGINE_VERSION:
+        raise MeshGeneratorError(
+            f"The shards were planned for the engine {manifest['engine']}, but this is the engine {ENGINE_VERSION}")
+    return manifest
+
+
+def mesh_shard(manifest_path, index, source_dem=None, output_path=None, folder=None, generator=None):
+    """
+    Meshes a single shard of the manifest into its file (or output_path) and returns its number of triangles.
+    source_dem replaces the path of the DEM in the manifest, e.g. with a copy on the machine running the shard.
+    A generator with its callbacks already set can be passed in, a new one is created otherwise.
+    """
+    manifest = load_manifest(manifest_path)
+    if not 0 <= index < len(manifest["shards"]):
+        raise MeshGeneratorError(f"The manifest only has {len(manifest['shards'])} shards")
+
+    shard = manifest["shards"][index]
+    path = output_path or shard_path(manifest_path, manifest, index, folder)
+
+    parameters = dict(manifest["parameters"])
+    parameters.update(saveLocation=path, useCache=False, shard={"xStart": shard["xStart"], "xStop": shard["xStop"]})
+
+    generator = generator or MeshGenerator()
+    generator.generate_height_array(parameters, source_dem or manifest["dem"])
+
+    # The shards only line up if every one of them was scaled the same way
+    for key, value in (
+        ("rasterSize", [generator.dem.RasterXSize, generator.dem.RasterYSize]),
+        ("grid", list(generator.heightSource.shape)),
+        ("verticalExaggeration", generator.verticalExaggeration),
+        ("bottomLevel", generator.bottomLevel),
+        ("noDataValue", generator.noDataValue),
+    ):
+        if value != manifest[key]:
+            raise ShardMismatchError(index, f"The {key} of shard {index} is {value} instead of {manifest[key]}, "
+                                            "it was meshed from another DEM than the one that was planned")
+
+    generator.manually_generate_stl()
+
+    # Lets the merge check that the file is a complete shard of this manifest
+    with open(path + ".json", "w", encoding="utf-8") as f:
+        json.dump({"manifest": manifest["id"], "index": index, "triangles": generator.numTriangles}, f)
+
+    return generator.numTriangles
+
+
+def check_shards(manifest_path, manifest, folder=None):
+    """Returns the paths and the numbers of triangles of the shards, once they're all there and complete."""
+    shards = []
+    missing = []
+    for index in range(len(manifest["shards"])):
+        path = shard_path(manifest_path, manifest, index, folder)
+        try:
+            with open(path + ".json", "r", encoding="utf-8") as f:
+                done = json.load(f)
+        except (OSError, ValueError):
+            missing.append(index)
+            continue
+
+        if done.get("manifest") != manifest["id"] or done.get("index") != index or not os.path.exists(path):
+            raise ShardMismatchError(index, f"{path} isn't shard {index} of this manifest")
+        shards.append((path, done["triangles"]))
+
+    if missing:
+        raise MeshGeneratorError(f"The shards {', '.join(map(str, missing))} haven't been meshed yet")
+    return shards
+
+
+def merge_shards(manifest_path, output_path=None, folder=None, validate=False, check_canceled=None):
+    """
+    Merges the meshed shards into the model (at output_path or the saveLocation of the planned parameters).
+    Returns the number of triangles of the model and its MeshValidationResult (None unless validate is set).
+    """
+    check_canceled = check_canceled or (lambda: None)
+    manifest = load_manifest(manifest_path)
+    shards = check_shards(manifest_path, manifest, folder)
+
+    output_format = manifest["parameters"].get("outputFormat", "stl")
+    path = output_path or manifest["output"]
+    header = stl_header(manifest["fingerprint"])
+
+    if output_format in CONCATENATED_FORMATS:
+        num_triangles = merge_stls(shards, path, header, output_format, manifest["parameters"], check_canceled)
+        if not validate:
+            return num_triangles, None
+
+        from .mesh_validator import validate_stl
+        return num_triangles, validate_stl(path, check_canceled)
+
+    return merge_chunks(shards, path, header, output_format, manifest["parameters"]["lineWidth"], validate,
+                        check_canceled)
+
+
+def merge_stls(shards, path, header, output_format, parameters, check_canceled):
+    """Concatenates the triangles of the shards into one binary STL, without reading them."""
+    for shard_file, num_triangles in shards:
+        with open(shard_file, "rb") as f:
+            f.seek(80)
+            count = int(np.frombuffer(f.read(4), dtype="<u4")[0])
+        if count != num_triangles or os.path.getsize(shard_file) != 84 + 50 * count:
+            raise MeshGeneratorError(f"The shard {shard_file} is incomplete")
+
+    total = sum(num_triangles for _, num_triangles in shards)
+    if total >= 2 ** 32:
+        raise MeshGeneratorError("The model has too many triangles for a binary STL")
+
+    temp_path = path + ".part"
+    if output_format == "stl.gz":
+        output = gzip.open(temp_path, "wb", compresslevel=parameters.get("compressionLevel", 6))
+    else:
+        output = open(temp_path, "wb")
+
+    try:
+        with output:
+            output.write(header)
+            output.write(np.uint32(total).tobytes())
+            for shard_file, _ in shards:
+                check_canceled()
+                with open(shard_file, "rb") as f:
+                    f.seek(84)
+                    shutil.copyfileobj(f, output, 16 * 1024 * 1024)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    os.replace(temp_path, path)
+    return total
+
+
+def merge_chunks(shards, path, header, output_format, line_width, validate, check_canceled):
+    """Writes the chunks of the shards into a model of an indexed format, welding the vertices along the seams."""
+    writer = WRITERS[output_format](path, header, line_width)
+    validator = None
+    if validate:
+        from .mesh_validator import GridMeshValidator
+        validator = GridMeshValidator()
+
+    try:
+        for shard_file, num_triangles in shards:
+            start = writer.numTriangles
+            for chunk in read_shard_chunks(shard_file):
+                check_canceled()
+                writer.write(chunk)
+                if validator is not None:
+                    validator.add(chunk)
+
+            if writer.numTriangles - start != num_triangles:
+                raise MeshGeneratorError(f"The shard {shard_file} is incomplete")
+    except BaseException:
+        writer.abort()
+        raise
+
+    return writer.close(), validator.finish() if validator is not None else None
@@ -0,0 +1,238 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ MeshValidator
+                                 A QGIS plugin
+ This plugin lets you generate an STL from a DEM and allows the exclusion of nodata regions.
+                             -------------------
+        copyright            : (C) 2022 by Suheyb Aden
+        email                : suheyb1@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ Checks that the generated meshes are watertight and manifold.
+ The edges are counted by sorting integer keys with NumPy, so even meshes with tens of millions of
+ triangles are checked in about the time it takes to write them.
+"""
+
+import gzip
+import shutil
+import tempfile
+
+import numpy as np
+
+from .mesh_generator import STL_TRIANGLE_DTYPE, GridVertexIndexer, MeshGeneratorError
+
+
+# Vertex ids have to stay below this for the edge keys to fit into 64 bits
+MAX_VERTICES = 2 ** 31
+
+
+class MeshValidationResult:
+    """
+    The number of defects found in a mesh.
+    A mesh is watertight if every edge is shared by exactly two triangles that run along it in opposite directions.
+    """
+
+    def __init__(self):
+        self.numTriangles = 0
+        self.numEdges = 0
+        # Edges used by a single triangle (holes in the surface)
+        self.boundaryEdges = 0
+        # Edges shared by more than two triangles
+        self.nonManifoldEdges = 0
+        # Extra triangles running along an edge in the same direction as another one
+        # (flipped or duplicated triangles)
+        self.duplicateEdges = 0
+        # Triangles with two or more corners on the same vertex
+        self.degenerateTriangles = 0
+
+    @property
+    def isWatertight(self):
+        return self.boundaryEdges == 0 and self.nonManifoldEdges == 0 and self.duplicateEdges == 0
+
+    def as_dict(self):
+        return {
+            "triangles": self.numTriangles,
+            "edges": self.numEdges,
+            "boundary_edges": self.boundaryEdges,
+            "non_manifold_edges": self.nonManifoldEdges,
+            "duplicate_edges": self.duplicateEdges,
+            "degenerate_triangles": self.degenerateTriangles,
+            "watertight": self.isWatertight,
+        }
+
+    def __str__(self):
+        if self.isWatertight:
+            return f"The mesh is watertight ({self.numTriangles} triangles, {self.numEdges} edges)."
+
+        return (
+            f"The mesh isn't watertight: {self.boundaryEdges} boundary edges, "
+            f"{self.nonManifoldEdges} non-manifold edges and {self.duplicateEdges} duplicate edges "
+            f"({self.numTriangles} triangles, {self.numEdges} edges, {self.degenerateTriangles} degenerate triangles)."
+        )
+
+
+class EdgeValidator:
+    """
+    Counts the defective edges of an indexed mesh that's added in chunks.
+    Each edge is turned into a single integer key made of its vertex ids (smaller one first) and its direction,
+    so finding the triangles that share an edge is just a matter of sorting the keys.
+    Only the edges that touch the still open vertices (the ones later chunks can use again) are kept between
+    the chunks, which keeps the memory bounded by the size of a chunk.
+    """
+
+    def __init__(self):
+        self.result = MeshValidationResult()
+        self.pending = np.empty(0, dtype=np.int64)
+
+    # Adds the triangles given as (n, 3) vertex ids
+    # open_vertices are the ids of the vertices the later chunks may still use, None if every vertex is still open
+    def add(self, faces, open_vertices=None):
+        faces = np.asarray(faces, dtype=np.int64).reshape(-1, 3)
+        self.result.numTriangles += len(faces)
+
+        degenerate = (faces[:, 0] == faces[:, 1]) | (faces[:, 1] == faces[:, 2]) | (faces[:, 0] == faces[:, 2])
+        self.result.degenerateTriangles += int(np.count_nonzero(degenerate))
+        faces = faces[~degenerate]
+
+        if len(faces) and faces.max() >= MAX_VERTICES:
+            raise MeshGeneratorError("The mesh has too many vertices to be validated")
+
+        start = faces.ravel()
+        stop = faces[:, [1, 2, 0]].ravel()
+        low = np.minimum(start, stop)
+        high = np.maximum(start, stop)
+        keys = ((low * MAX_VERTICES + high) << 1) | (start < stop)
+
+        keys = np.concatenate([self.pending, keys])
+        if open_vertices is None:
+            self.pending = keys
+            return
+
+        # Count the edges that can't be used by the later chunks anymore
+        edges = keys >> 1
+        still_open = np.isin(edges // MAX_VERTICES, open_vertices) | np.isin(edges % MAX_VERTICES, open_vertices)
+        self.pending = keys[still_open]
+        self.count(keys[~still_open])
+
+    def count(self, keys):
+        if len(keys) == 0:
+            return
+
+        keys = np.sort(keys)
+        edges = keys >> 1
+
+        # Start of every run of the same edge, and of the same edge in the same direction
+        edge_starts = np.flatnonzero(np.r_[True, edges[1:] != edges[:-1]])
+        key_starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+        uses = np.diff(np.r_[edge_starts, len(keys)])
+        directed_uses = np.diff(np.r_[key_starts, len(keys)])
+
+        self.result.numEdges += len(edge_starts)
+        self.result.boundaryEdges += int(np.count_nonzero(uses == 1))
+        self.result.nonManifoldEdges += int(np.count_nonzero(uses > 2))
+        self.result.duplicateEdges += int(np.sum(directed_uses - 1))
+
+    # Counts the remaining edges and returns the result
+    def finish(self):
+        self.count(self.pending)
+        self.pending = np.empty(0, dtype=np.int64)
+        return self.result
+
+
+class GridMeshValidator:
+    """
+    Validates the mesh from the topology of the height grid while it's being generated.
+    The chunks have to be added band by band (see GridVertexIndexer), which lets the edges of every
+    band be counted as soon as the next band can't touch them anymore.
+    """
+
+    def __init__(self):
+        self.indexer = GridVertexIndexer()
+        self.edges = EdgeValidator()
+
+    def add(self, chunk):
+        _, faces = self.indexer.add(chunk)
+
+        # Only the last column of vertices is shared with the next band
+        open_vertices = np.empty(0, dtype=np.int64)
+        if self.indexer.lastColumn is not None:
+            open_vertices = self.indexer.lastColumn[2].ravel()
+            open_vertices = open_vertices[open_vertices >= 0]
+
+        self.edges.add(faces, open_vertices)
+
+    def finish(self):
+        return self.edges.finish()
+
+
+def weld_vertices(corners):
+    """
+    Returns the vertex id of each of the (n, 3) corners, giving the same id to the corners at the same position.
+    The corners are sorted by the bits of their coordinates, so no tolerance is used.
+    All the corners are sorted at once, which takes about 40 bytes of memory per corner (120 per triangle),
+    on top of the corners themselves.
+    """
+    # Adding zero turns -0.0 into 0.0 so both get the same bits
+    bits = (np.ascontiguousarray(corners, dtype=np.float32) + np.float32(0)).view(np.uint32).reshape(-1, 3)
+    order = np.lexsort((bits[:, 2], bits[:, 1], bits[:, 0]))
+
+    sorted_bits = bits[order]
+    new_vertex = np.r_[True, np.any(sorted_bits[1:] != sorted_bits[:-1], axis=1)]
+
+    ids = np.empty(len(order), dtype=np.int64)
+    ids[order] = np.cumsum(new_vertex) - 1
+    return ids
+
+
+def map_stl_triangles(file):
+    """Maps the triangles of a binary STL file (a path or an open file) as a read only array of STL_TRIANGLE_DTYPE."""
+    size = np.memmap(file, dtype=np.uint32, mode="r", offset=80, shape=(1,))[0]
+    return np.memmap(file, dtype=STL_TRIANGLE_DTYPE, mode="r", offset=84, shape=(int(size),))
+
+
+def read_stl_triangles(path, temp_dir=None, block_size=16 * 1024 * 1024):
+    """
+    Returns the triangles of a binary STL file (optionally gzip compressed) as an array of STL_TRIANGLE_DTYPE.
+
+    The file is mapped instead of read, the triangles are only read once while they're welded.
+    A compressed file is decompressed in blocks of block_size bytes into a temporary file in temp_dir
+    (the system's temporary directory if None), which is mapped the same way. So only a block of the
+    decompressed STL is ever held in memory, and the temporary file is deleted once the array is released.
+    """
+    if not path.endswith(".gz"):
+        return map_stl_triangles(path)
+
+    # The map keeps the data of the temporary file once it's closed, so the file is gone along with the array
+    with gzip.open(path, "rb") as compressed, tempfile.TemporaryFile(
+            prefix="stl_generator_", suffix=".stl", dir=temp_dir) as spool:
+        shutil.copyfileobj(compressed, spool, block_size)
+        spool.flush()
+        return map_stl_triangles(spool)
+
+
+def validate_stl(path, check_canceled=None, temp_dir=None):
+    """
+    Validates a binary STL file and returns its MeshValidationResult.
+    Compressed files are decompressed into a temporary file in temp_dir (see read_stl_triangles()).
+    """
+    try:
+        triangles = read_stl_triangles(path, temp_dir)
+    except (OSError, EOFError, ValueError) as e:
+        raise MeshGeneratorError(f"Couldn't read the STL file {path}: {e}")
+
+    ids = weld_vertices(triangles["vertices"].reshape(-1, 3))
+    if check_canceled is not None:
+        check_canceled()
+
+    validator = EdgeValidator()
+    validator.add(ids.reshape(-1, 3))
+    return validator.finish()
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ OutputFormats
+                                 A QGIS plugin
+ This plugin lets you generate an STL from a DEM and allows the exclusion of nodata regions.
+                             -------------------
+        copyright            : (C) 2022 by Suheyb Aden
+        email                : suheyb1@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+ The file formats the models can be saved as.
+ Kept apart from the mesh generator (and free of NumPy and GDAL) so that the dialog and the
+ Processing algorithms can list the formats without loading the meshing engine.
+"""
+
+from collections import namedtuple
+
+
+OutputFormat = namedtuple("OutputFormat", ["name", "extension"])
+
+# Keyed by the id used in the generation parameters
+# New formats have to be added at the end, since the Processing algorithms refer to them by their index
+OUTPUT_FORMATS = {
+    "stl": OutputFormat("STL", ".stl"),
+    "3mf": OutputFormat("3MF", ".3mf"),
+    "ply": OutputFormat("PLY", ".ply"),
+    "obj": OutputFormat("OBJ", ".obj"),
+    "glb": OutputFormat("GLB", ".glb"),
+    "stl.gz": OutputFormat("STL (gzip)", ".stl.gz"),
+}
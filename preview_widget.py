@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+"""
+/***************************************************************************
+ PreviewWidget
+                                 A QGIS plugin
+ This plugin lets you generate an STL from a DEM and allows the exclusion of nodata regions.
+                             -------------------
+        copyright            : (C) 2022 by Suheyb Aden
+        email                : suheyb1@gmail.com
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+
+import numpy as np
+
+from qgis.PyQt import QtCore, QtGui, QtWidgets
+
+
+class PreviewWidget(QtWidgets.QWidget):
+    """
+    Draws a shaded isometric view of a (coarse) mesh.
+    The triangles are drawn from the back to the front, so no depth buffer or 3D engine is needed.
+    The view is rendered into an image once per mesh and size, which is then reused for every repaint.
+    """
+
+    # Colour of a triangle facing the light
+    BASE_COLOR = (120, 170, 110)
+    BACKGROUND_COLOR = QtGui.QColor(245, 245, 245)
+    # Direction the light comes from (from the upper left of the view)
+    LIGHT = np.array([-1.0, -2.0, 3.0]) / np.sqrt(14.0)
+    MARGIN = 8
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setMinimumSize(200, 160)
+        self.vertices = None
+        self.faces = None
+        self.message = ""
+        self.image = None
+
+    # Shows the given mesh. The vertices are (x, y, z) in mm and the faces are the vertex ids of the triangles
+    def set_mesh(self, vertices, faces):
+        self.vertices = vertices
+        self.faces = faces
+        self.message = "" if len(faces) else self.tr("The model is empty")
+        self.image = None
+        self.update()
+
+    # Clears the mesh and shows the message instead
+    def set_message(self, message):
+        self.vertices = None
+        self.faces = None
+        self.message = message
+        self.image = None
+        self.update()
+
+    def resizeEvent(self, event):
+        self.image = None
+        super().resizeEvent(event)
+
+    def paintEvent(self, event):
+        if self.image is None:
+            self.image = self.render_image()
+
+        painter = QtGui.QPainter(self)
+        painter.drawImage(0, 0, self.image)
+        painter.end()
+
+    def render_image(self):
+        image = QtGui.QImage(self.size(), QtGui.QImage.Format_RGB32)
+        image.fill(self.BACKGROUND_COLOR)
+
+        painter = QtGui.QPainter(image)
+        painter.setRenderHint(QtGui.QPainter.Antialiasing, False)
+
+        if self.faces is None or len(self.faces) == 0:
+            painter.drawText(image.rect(), QtCore.Qt.AlignCenter, self.message)
+            painter.end()
+            return image
+
+        corners = self.vertices[self.faces].astype(np.float64)
+
+        # Isometric projection looking down at the model from above its (0, 0) corner
+        screen_x = (corners[..., 0] - corners[..., 1]) * 0.866
+        screen_y = -(corners[..., 0] + corners[..., 1]) * 0.5 - corners[..., 2]
+
+        # Fit the model into the widget
+        x_min, x_max = screen_x.min(), screen_x.max()
+        y_min, y_max = screen_y.min(), screen_y.max()
+        scale = min((self.width() - 2 * self.MARGIN) / max(x_max - x_min, 1e-9),
+                    (self.height() - 2 * self.MARGIN) / max(y_max - y_min, 1e-9))
+        offset_x = (self.width() - (x_max - x_min) * scale) / 2
+        offset_y = (self.height() - (y_max - y_min) * scale) / 2
+        screen_x = (screen_x - x_min) * scale + offset_x
+        screen_y = (screen_y - y_min) * scale + offset_y
+
+        # Lambert shading. The winding isn't used, so both sides of a triangle are lit the same
+        normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+        lengths = np.linalg.norm(normals, axis=1)
+        lengths[lengths == 0] = 1
+        light = np.abs(normals @ self.LIGHT) / lengths
+        shades = (0.35 + 0.65 * light)[:, None] * np.array(self.BASE_COLOR)
+        shades = shades.astype(np.int64).tolist()
+
+        # Distance along the viewing direction (1, 1, -1), the farthest triangles are drawn first
+        depth = (corners[..., 0] + corners[..., 1] - corners[..., 2]).mean(axis=1)
+        for i in np.argsort(-depth):
+            color = QtGui.QColor(*shades[i])
+            painter.setPen(color)
+            painter.setBrush(color)
+            painter.drawPolygon(QtGui.QPolygonF([
+                QtCore.QPointF(screen_x[i, 0], screen_y[i, 0]),
+                QtCore.QPointF(screen_x[i, 1], screen_y[i, 1]),
+                QtCore.QPointF(screen_x[i, 2], screen_y[i, 2]),
+            ]))
+
+        painter.end()
+        return image
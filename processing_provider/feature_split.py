@@ -0,0 +1,274 @@
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+from qgis.core import (
+    QgsCoordinateTransformContext,
+    QgsFeatureRequest,
+    QgsRasterBandStats,
+    QgsRasterLayer,
+    QgsRectangle,
+    QgsVectorFileWriter,
+    QgsVectorLayer,
+)
+
+import hashlib
+import json
+import os
+import re
+import zipfile
+
+
+def group_overlapping_features(vector_layer: QgsVectorLayer, field: str, extent: QgsRectangle) -> dict:
+    """
+    Groups the features of the vector layer by the value of the given field,
+    keeping only the features whose bounding box overlaps with the extent.
+
+    The extent filter is passed on to the data provider, so layers with a
+    spatial index never hand back the features that lie outside of it.
+
+    Returns a dictionary that maps each field value to a tuple containing
+    the list of overlapping features and their combined bounding box.
+    """
+    request = QgsFeatureRequest().setFilterRect(extent)
+
+    groups = {}
+    for feature in vector_layer.getFeatures(request):
+        geometry = feature.geometry()
+        if geometry.isNull() or geometry.isEmpty():
+            continue
+
+        # The provider filter is allowed to be approximate, so recheck the bounding box
+        bounding_box = geometry.boundingBox()
+        if not bounding_box.intersects(extent):
+            continue
+
+        value = feature[field]
+        if value not in groups:
+            groups[value] = ([], QgsRectangle(bounding_box))
+        else:
+            groups[value][1].combineExtentWith(bounding_box)
+        groups[value][0].append(feature)
+
+    return groups
+
+
+def elevation_range(raster_layer: QgsRasterLayer, extents) -> tuple:
+    """
+    Returns the minimum and maximum elevation of the raster within the combined bounding box of the extents.
+
+    The statistics are computed in one pass over that window of the source raster,
+    instead of one pass over every clipped raster. The window also covers the pixels
+    between the features, so the range can be a little wider than the one of the clips.
+
+    Returns (None, None) if there are no extents.
+    """
+    combined = None
+    for extent in extents:
+        if combined is None:
+            combined = QgsRectangle(extent)
+        else:
+            combined.combineExtentWith(extent)
+
+    if combined is None:
+        return None, None
+
+    stats = raster_layer.dataProvider().bandStatistics(
+        1, QgsRasterBandStats.Min | QgsRasterBandStats.Max, combined, 0
+    )
+    return stats.minimumValue, stats.maximumValue
+
+
+def group_filename(field: str, value) -> str:
+    """
+    Returns the file name (without an extension) used for the outputs of a group.
+    Mirrors the naming of the "split vector layer" algorithm.
+    """
+    return re.sub(r"[^\w\-.]", "_", f"{field}_{value}")
+
+
+def group_key(value) -> str:
+    """
+    Returns a text key that tells apart every raw value of the split field, including its type,
+    e.g. to key the manifest on. NULL values all share the same key.
+    """
+    if value is None or (hasattr(value, "isNull") and value.isNull()):
+        return "NULL"
+    return f"{type(value).__name__}:{value}"
+
+
+def group_filenames(field: str, values) -> dict:
+    """
+    Returns a dictionary that maps each value of the split field to a unique file name for its group.
+
+    Replacing the characters that can't be used in file names maps different values (e.g. "a b", "a_b"
+    and "a/b") to the same name, so a short hash of the raw value is appended to every name that was
+    changed that way. Names that still collide, e.g. only by case on case insensitive file systems,
+    get the hash too.
+    """
+    def with_hash(name, value):
+        return f"{name}_{hashlib.sha256(group_key(value).encode('utf-8')).hexdigest()[:8]}"
+
+    filenames = {}
+    for value in values:
+        filename = group_filename(field, value)
+        if filename != f"{field}_{value}":
+            filename = with_hash(filename, value)
+        filenames[value] = filename
+
+    counts = {}
+    for filename in filenames.values():
+        counts[filename.casefold()] = counts.get(filename.casefold(), 0) + 1
+
+    return {
+        value: with_hash(filename, value) if counts[filename.casefold()] > 1 else filename
+        for value, filename in filenames.items()
+    }
+
+
+def write_mask_layer(features: list, vector_layer: QgsVectorLayer, filepath: str) -> str:
+    """
+    Writes the given features into a new GeoPackage that can be used as a clipping mask.
+    Returns the path of the written file.
+    """
+    options = QgsVectorFileWriter.SaveVectorOptions()
+    options.driverName = "GPKG"
+
+    if os.path.exists(filepath):
+        os.remove(filepath)
+
+    writer = QgsVectorFileWriter.create(
+        filepath,
+        vector_layer.fields(),
+        vector_layer.wkbType(),
+        vector_layer.crs(),
+        QgsCoordinateTransformContext(),
+        options,
+    )
+    if writer.hasError() != QgsVectorFileWriter.NoError:
+        raise IOError(writer.errorMessage())
+
+    writer.addFeatures(features)
+
+    # Deleting the writer flushes the features to the disk
+    del writer
+
+    return filepath
+
+
+def bundle_files(filepaths: list, archive_path: str, compression_level: int = 6) -> str:
+    """
+    Bundles the given files into one zip archive. The files are streamed into the archive,
+    so they never have to be held in memory. Returns the path of the archive.
+    """
+    # Write to a temporary file first so an interrupted run can't leave a truncated archive behind
+    temp_path = archive_path + ".part"
+    with zipfile.ZipFile(
+        temp_path, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=compression_level, allowZip64=True
+    ) as archive:
+        for filepath in filepaths:
+            archive.write(filepath, arcname=os.path.basename(filepath))
+    os.replace(temp_path, archive_path)
+
+    return archive_path
+
+
+def geometry_hash(features: list) -> str:
+    """
+    Returns a hash of the geometries of the given features that doesn't depend on the feature order.
+    """
+    digests = sorted(
+        hashlib.sha256(bytes(feature.geometry().asWkb())).hexdigest() for feature in features
+    )
+    return hashlib.sha256("".join(digests).encode("utf-8")).hexdigest()
+
+
+def dem_fingerprint(filepath: str) -> dict:
+    """
+    Returns a cheap fingerprint of the DEM file that changes whenever the file is replaced or modified.
+    """
+    try:
+        stat = os.stat(filepath)
+    except OSError:
+        # Rasters that aren't plain files (e.g. web services) can't be fingerprinted
+        return {"path": filepath, "size": None, "mtime": None}
+
+    return {"path": os.path.abspath(filepath), "size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+
+def parameters_hash(parameters: dict) -> str:
+    """
+    Returns a hash of the parameters used to generate an STL.
+    """
+    return hashlib.sha256(json.dumps(parameters, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class SplitManifest:
+    """
+    Keeps track of the STLs generated in an output folder by a feature split run,
+    so that later runs only have to regenerate the features that changed.
+
+    Every entry is keyed by the raw value of the group's field (see group_key) and records the hashes
+    of its geometry, the DEM's fingerprint, the generation parameters and the STL that was written.
+    """
+
+    FILENAME = "stl_generator_manifest.json"
+    VERSION = 2
+
+    def __init__(self, folder: str):
+        self.filepath = os.path.join(folder, self.FILENAME)
+        self.entries = {}
+
+        try:
+            with open(self.filepath, "r", encoding="utf-8") as f:
+                contents = json.load(f)
+            if contents.get("version") == self.VERSION:
+                self.entries = contents.get("entries", {})
+        except (OSError, ValueError):
+            # Start from an empty manifest if there isn't a usable one yet
+            self.entries = {}
+
+    def is_unchanged(self, key: str, geometry: str, dem: dict) -> bool:
+        """Checks if the group's geometry and DEM are the same as the last time it was generated."""
+        entry = self.entries.get(key)
+        return entry is not None and entry.get("geometry") == geometry and entry.get("dem") == dem
+
+    def is_up_to_date(self, key: str, geometry: str, dem: dict, parameters: str) -> bool:
+        """Checks if the group's STL was already generated from the same inputs and still exists."""
+        entry = self.entries.get(key)
+        return (
+            self.is_unchanged(key, geometry, dem)
+            and entry.get("parameters") == parameters
+            and os.path.exists(entry.get("output", ""))
+        )
+
+    def prune(self, keys) -> list:
+        """
+        Removes the entries (and the STLs) of the groups that aren't in the given keys.
+        Returns the list of removed STL files.
+        """
+        removed = []
+        for key in list(self.entries.keys()):
+            if key in keys:
+                continue
+
+            output = self.entries.pop(key).get("output")
+            if output and os.path.exists(output):
+                os.remove(output)
+                removed.append(output)
+
+        return removed
+
+    def save(self):
+        # Write to a temporary file first so an interrupted run can't leave a corrupted manifest behind
+        temp_filepath = self.filepath + ".tmp"
+        with open(temp_filepath, "w", encoding="utf-8") as f:
+            json.dump({"version": self.VERSION, "entries": self.entries}, f, indent=2, sort_keys=True)
+        os.replace(temp_filepath, self.filepath)
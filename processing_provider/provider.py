@@ -1,9 +1,13 @@
+import os
+
 from qgis.core import QgsProcessingProvider
 from qgis.PyQt.QtGui import QIcon
 
 from .stl_from_raster import STLFromRaster
 from .stl_from_features_total_size import STLFromFeaturesTotalSize
 from .stl_from_features_bed_size import STLFromFeaturesBedSize
+from .stl_tiles_from_raster import STLTilesFromRaster
+from .validate_mesh import ValidateMesh
 
 
 class Provider(QgsProcessingProvider):
@@ -12,6 +16,8 @@ class Provider(QgsProcessingProvider):
         self.addAlgorithm(STLFromRaster())
         self.addAlgorithm(STLFromFeaturesBedSize())
         self.addAlgorithm(STLFromFeaturesTotalSize())
+        self.addAlgorithm(STLTilesFromRaster())
+        self.addAlgorithm(ValidateMesh())
 
     def id(self, *args, **kwargs):
         """The ID of your plugin, used for identifying the provider.
@@ -34,4 +40,4 @@ class Provider(QgsProcessingProvider):
         the Processing toolbox.
         """
         # return QgsProcessingProvider.icon(self)
-        return QIcon(":/plugins/stl_generator/icon.png")
+        return QIcon(os.path.join(os.path.dirname(os.path.dirname(__file__)), "icon.png"))
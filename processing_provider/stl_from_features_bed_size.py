@@ -15,18 +15,37 @@ from qgis.core import (
     QgsProcessing,
     QgsProcessingException,
     QgsProcessingAlgorithm,
+    QgsProcessingParameterBoolean,
     QgsProcessingParameterField,
     QgsProcessingParameterRasterLayer,
     QgsProcessingParameterVectorLayer,
+    QgsProcessingParameterEnum,
+    QgsProcessingParameterDefinition,
     QgsProcessingParameterNumber,
     QgsProcessingParameterFolderDestination,
+    QgsProcessingMultiStepFeedback,
+    QgsProcessingOutputFile,
+    QgsProcessingUtils,
     QgsRasterLayer,
     QgsVectorLayer,
     QgsWkbTypes,
 )
 from qgis import processing
 
-from ..mesh_generator import MeshGenerator, MeshGeneratorError
+from ..output_formats import OUTPUT_FORMATS
+from .feature_split import (
+    bundle_files,
+    SplitManifest,
+    dem_fingerprint,
+    elevation_range,
+    geometry_hash,
+    group_filename,
+    group_filenames,
+    group_key,
+    group_overlapping_features,
+    parameters_hash,
+    write_mask_layer,
+)
 
 import os
 
@@ -57,7 +76,12 @@ class STLFromFeaturesBedSize(QgsProcessingAlgorithm):
     BED_WIDTH = "BED WIDTH"
     BED_LENGTH = "BED LENGTH"
     LINE_WIDTH = "LINE WIDTH"
+    INCREMENTAL = "INCREMENTAL"
+    OUTPUT_FORMAT = "OUTPUT FORMAT"
+    BUNDLE = "BUNDLE"
+    COMPRESSION_LEVEL = "COMPRESSION LEVEL"
     OUTPUT = "OUTPUT"
+    ARCHIVE = "ARCHIVE"
     SUCCESS = "SUCCESS"
 
     def tr(self, string):
@@ -198,6 +222,48 @@ class STLFromFeaturesBedSize(QgsProcessingAlgorithm):
             )
         )
 
+        # Only regenerate the STLs of the features that changed since the last run into the same folder
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.INCREMENTAL,
+                self.tr("Only regenerate new or modified features"),
+                defaultValue=False,
+            )
+        )
+
+        # The file format of the generated model(s)
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                self.OUTPUT_FORMAT,
+                self.tr("Output Format"),
+                options=[output_format.name for output_format in OUTPUT_FORMATS.values()],
+                defaultValue=0,
+            )
+        )
+
+        # Bundle all the generated files into one zip archive
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.BUNDLE,
+                self.tr("Bundle the generated files into one zip archive"),
+                defaultValue=False,
+            )
+        )
+
+        # The deflate level (0 to 9) of the archive and the compressed output formats
+        compression_level = QgsProcessingParameterNumber(
+            self.COMPRESSION_LEVEL,
+            self.tr("Compression Level"),
+            type=QgsProcessingParameterNumber.Integer,
+            defaultValue=6,
+            minValue=0,
+            maxValue=9,
+        )
+        compression_level.setFlags(
+            compression_level.flags() | QgsProcessingParameterDefinition.FlagAdvanced
+        )
+        self.addParameter(compression_level)
+
         # The folder destination where we'll save the generated STL(s)
         self.addParameter(
             QgsProcessingParameterFolderDestination(
@@ -205,6 +271,9 @@ class STLFromFeaturesBedSize(QgsProcessingAlgorithm):
             )
         )
 
+        # The zip archive of the generated files, only written when they're bundled
+        self.addOutput(QgsProcessingOutputFile(self.ARCHIVE, self.tr("Zip Archive")))
+
     def processAlgorithm(self, parameters, context, feedback):
         """
         Here is where the processing itself takes place.
@@ -233,6 +302,10 @@ class STLFromFeaturesBedSize(QgsProcessingAlgorithm):
         bed_length = self.parameterAsDouble(parameters, self.BED_LENGTH, context)
         line_width = self.parameterAsDouble(parameters, self.LINE_WIDTH, context)
         dest_folder = self.parameterAsFile(parameters, self.OUTPUT, context)
+        output_format = self.parameterAsEnum(parameters, self.OUTPUT_FORMAT, context)
+        bundle = self.parameterAsBoolean(parameters, self.BUNDLE, context)
+        compression_level = self.parameterAsInt(parameters, self.COMPRESSION_LEVEL, context)
+        incremental = self.parameterAsBoolean(parameters, self.INCREMENTAL, context)
 
         # Send some information to the user
         feedback.pushInfo("Loaded all the parameters\n")
@@ -257,7 +330,7 @@ class STLFromFeaturesBedSize(QgsProcessingAlgorithm):
             )
             if not orig_raster_layer.dataProvider().setNoDataValue(1, -9999):
                 feedback.pushWarning("ERROR: Failed to set the no data value!")
-                return {self.SUCCESS: False, self.OUTPUT: []}
+                return {self.SUCCESS: False, self.OUTPUT: [], self.ARCHIVE: None}
             orig_raster_layer.reload()
 
         feedback.pushInfo(
@@ -315,20 +388,17 @@ class STLFromFeaturesBedSize(QgsProcessingAlgorithm):
         
         feedback.pushInfo(f"Splitting the vector file based on the {field} field...")
 
-        # Split the multi polygon layer into multiple vector layers using the "split vector layer" algorithm
-        vector_filepaths: list[str] = processing.run(
-            "native:splitvectorlayer",
-            {
-                "FIELD": field,
-                "FILE_TYPE": 0,
-                "INPUT": vector_filepath,
-                "OUTPUT": "TEMPORARY_OUTPUT",
-                "PREFIX_FIELD": True,
-            },
-        )["OUTPUT_LAYERS"]
+        # Group the features by the split field, skipping any feature that doesn't overlap with the raster
+        raster_extent = orig_raster_layer.extent()
+        feature_groups = group_overlapping_features(orig_vector_layer, field, raster_extent)
 
         # Send some information to the user
-        feedback.pushInfo(f"Finished splitting the vector layer!\n")
+        feedback.pushInfo(
+            f"Found {len(feature_groups)} group(s) of features that overlap with the input raster.\n"
+        )
+
+        # Clipping and generating the STL of every group are a step each of the overall progress
+        step_feedback = QgsProcessingMultiStepFeedback(max(1, 2 * len(feature_groups)), feedback)
 
         # **************************************************************************************************
         # 4) CLIP THE RASTER LAYER AND FIND THE APPROPRIATE SCALE FACTOR
@@ -338,63 +408,66 @@ class STLFromFeaturesBedSize(QgsProcessingAlgorithm):
             "Started clipping the raster layer by the split vector layer.\n"
         )
 
+        temp_folder = QgsProcessingUtils.tempFolder()
+
+        # Load the STLs generated by the previous runs into this folder
+        manifest = SplitManifest(dest_folder)
+        dem = dem_fingerprint(raster_filepath)
+
         scale_factor = 1.0
-        rasters_to_process: list[QgsRasterLayer] = []
+        rasters_to_process: list[dict] = []
+
+        # The elevation range of all the overlapping features combined, computed once over the source raster.
+        # Shared by every STL so that they're all printed with the same vertical scale
+        min_elevation, max_elevation = elevation_range(
+            orig_raster_layer,
+            [group_extent.intersect(raster_extent) for _, group_extent in feature_groups.values()],
+        )
+
+        # Every group's outputs are named after its value, made unique where the sanitized names collide
+        filenames = group_filenames(field, feature_groups)
 
         # Clip the raster file using the vector masks and
         # find the scale factor required to fit the largest clipped raster onto the print bed
-        for mask_filepath in vector_filepaths:
-            # Get the filename of the mask layer so the clipped raster can get the same name
-            filename = mask_filepath.split(".")[-2]
-            clipped_raster_filepath = os.path.join(
-                dest_folder, filename + "_raster.tif"
-            )
+        for index, (value, (features, group_extent)) in enumerate(feature_groups.items()):
+            if feedback.isCanceled():
+                feedback.pushInfo("Canceled before all the features were clipped.")
+                return {self.SUCCESS: False, self.OUTPUT: [], self.ARCHIVE: None}
+
+            step_feedback.setCurrentStep(index)
+
+            filename = filenames[value]
+            group = {
+                "name": filename,
+                "key": group_key(value),
+                "features": features,
+                "overlap": group_extent.intersect(raster_extent),
+                "geometry": geometry_hash(features),
+                "layer": None,
+            }
+
+            if incremental and manifest.is_unchanged(group["key"], group["geometry"], dem):
+                # Reuse the size recorded the last time this group was clipped
+                entry = manifest.entries[group["key"]]
+                group.update(width=entry["width"], height=entry["height"])
+                feedback.pushInfo(f"{filename} hasn't changed since the last run.\n")
 
-            # Load the mask layer
-            mask_layer = QgsVectorLayer(path=mask_filepath)
+            else:
+                try:
+                    group["layer"] = self.clip_raster(
+                        group, orig_raster_layer, orig_vector_layer, temp_folder, dest_folder, step_feedback
+                    )
+                except QgsProcessingException as e:
+                    feedback.pushInfo(f"Error: {e}")
+                    return {self.SUCCESS: False, self.OUTPUT: [], self.ARCHIVE: None}
 
-            # Skip any mask layers that don't overlap with the raster file
-            overlap = mask_layer.extent().intersect(orig_raster_layer.extent())
-            if overlap.isEmpty():
-                # Send some information to the user
-                feedback.pushInfo(f"{filename} has no overlap with the input raster.\n")
-                continue
-
-            # Send some information to the user
-            feedback.pushInfo(f"Clipping the input raster layer using {filename}...")
-
-            try:
-                # Clip the raster layer with the mask layer
-                clipped_raster_filepath = processing.run(
-                    "gdal:cliprasterbymasklayer",
-                    {
-                        "INPUT": raster_filepath,
-                        "MASK": mask_filepath,
-                        "SOURCE_CRS": orig_raster_layer.crs(),
-                        "TARGET_CRS": mask_layer.crs(),
-                        "TARGET_EXTENT": f"{overlap.xMinimum()}, {overlap.xMaximum()}, {overlap.yMinimum()}, {overlap.yMaximum()}",
-                        "MULTITHREADING": True,
-                        "NODATA": orig_raster_layer.dataProvider().sourceNoDataValue(1),
-                        # "KEEP_RESOLUTION": True,
-                        "OUTPUT": clipped_raster_filepath,
-                    },
-                )["OUTPUT"]
-
-            except QgsProcessingException as e:
-                feedback.pushInfo(f"Error: {e}")
-                return {self.SUCCESS: False, self.OUTPUT: []}
-
-            # Load the clipped raster layer and get its height and width
-            clipped_raster_layer = QgsRasterLayer(clipped_raster_filepath)
+                # Get the clipped raster's size
+                group.update(width=group["layer"].width(), height=group["layer"].height())
 
             larger_bed_axis = max(bed_length, bed_width)
             smaller_bed_axis = min(bed_length, bed_width)
-            larger_layer_axis = max(
-                clipped_raster_layer.height(), clipped_raster_layer.width()
-            )
-            smaller_layer_axis = min(
-                clipped_raster_layer.height(), clipped_raster_layer.width()
-            )
+            larger_layer_axis = max(group["height"], group["width"])
+            smaller_layer_axis = min(group["height"], group["width"])
 
             # Get the min scale factor needed to downscale the raster to fit in the print bed
             scale_factor = min(
@@ -404,12 +477,7 @@ class STLFromFeaturesBedSize(QgsProcessingAlgorithm):
             )
 
             # Add the clipped raster to the list of rasters to process
-            rasters_to_process.append(clipped_raster_layer)
-
-            # Send some information to the user
-            feedback.pushInfo(
-                f"Finished clipping the input raster layer to {clipped_raster_filepath}.\n"
-            )
+            rasters_to_process.append(group)
 
         # **************************************************************************************************
         # 5) GENERATE AN STL FOR EACH CLIPPED RASTER LAYER
@@ -424,31 +492,89 @@ class STLFromFeaturesBedSize(QgsProcessingAlgorithm):
         generated_STLs: list[str] = []
         success = True
 
+        feedback.pushInfo(
+            f"All the STLs will share the elevation range of {min_elevation} to {max_elevation}.\n"
+        )
+
         # Generates an STL from each of the clipped raster layers
-        for clipped_raster_layer in rasters_to_process:
-            feedback.pushInfo(f"Creating an STL for {clipped_raster_layer.source()}")
-            width = (clipped_raster_layer.height() * line_width) * scale_factor
-            height = (clipped_raster_layer.width() * line_width) * scale_factor
+        for index, group in enumerate(rasters_to_process):
+            if feedback.isCanceled():
+                feedback.pushInfo("Canceled the generation of the remaining STLs.")
+                success = False
+                break
+
+            step_feedback.setCurrentStep(len(feature_groups) + index)
+
+            width = (group["height"] * line_width) * scale_factor
+            height = (group["width"] * line_width) * scale_factor
+
+            # Everything that changes the contents of the STL
+            job_hash = parameters_hash(
+                {
+                    "model_height": print_height,
+                    "base_thickness": base_thickness,
+                    "line_width": line_width,
+                    "width": width,
+                    "height": height,
+                    "min_elevation": min_elevation,
+                    "max_elevation": max_elevation,
+                    "output_format": output_format,
+                    "compression_level": compression_level,
+                }
+            )
+
+            # Skip the STLs that were already generated from the same inputs
+            if incremental and manifest.is_up_to_date(group["key"], group["geometry"], dem, job_hash):
+                stl_filename = manifest.entries[group["key"]]["output"]
+                generated_STLs.append(stl_filename)
+                feedback.pushInfo(f"{stl_filename} is already up to date.\n")
+                continue
+
+            # Clip the groups that were skipped earlier but still need a new STL
+            if group["layer"] is None:
+                try:
+                    group["layer"] = self.clip_raster(
+                        group, orig_raster_layer, orig_vector_layer, temp_folder, dest_folder, step_feedback
+                    )
+                except QgsProcessingException as e:
+                    feedback.pushInfo(f"Error: {e}")
+                    return {self.SUCCESS: False, self.OUTPUT: [], self.ARCHIVE: None}
+
+            feedback.pushInfo(f"Creating an STL for {group['layer'].source()}")
 
             result = processing.run(
                 "stl_generator:stlfromraster",
                 {
-                    "INPUT": clipped_raster_layer.source(),
-                    "MODEL_HEIGHT": print_height,
+                    "INPUT": group["layer"].source(),
+                    "MODEL HEIGHT": print_height,
                     "BASE THICKNESS": base_thickness,
                     "BED WIDTH": width,
                     "BED LENGTH": height,
                     "LINE WIDTH": line_width,
+                    "MIN ELEVATION": min_elevation,
+                    "MAX ELEVATION": max_elevation,
+                    "OUTPUT FORMAT": output_format,
+                    "COMPRESSION LEVEL": compression_level,
                     "OUTPUT": dest_folder,
                 },
                 context=context,
-                feedback=feedback,
+                feedback=step_feedback,
             )
 
             stl_filename = result["OUTPUT"]
             if result["SUCCESS"]:
                 generated_STLs.append(stl_filename)
 
+                # Record how the STL was generated for the next runs
+                manifest.entries[group["key"]] = {
+                    "geometry": group["geometry"],
+                    "dem": dem,
+                    "parameters": job_hash,
+                    "output": stl_filename,
+                    "width": group["width"],
+                    "height": group["height"],
+                }
+
                 # Send some information to the user
                 feedback.pushInfo(f"Created a new STL: {stl_filename}")
                 feedback.pushInfo(
@@ -460,5 +586,62 @@ class STLFromFeaturesBedSize(QgsProcessingAlgorithm):
                 )
                 success = False
 
+        # Remove the STLs of the features that no longer exist
+        if incremental and not feedback.isCanceled():
+            for stl_filename in manifest.prune([group["key"] for group in rasters_to_process]):
+                feedback.pushInfo(f"Removed {stl_filename} since its feature no longer exists.")
+
+        manifest.save()
+
+        # Bundle the generated files into one archive
+        archive_filename = None
+        if bundle and generated_STLs and not feedback.isCanceled():
+            archive_filename = bundle_files(
+                generated_STLs,
+                os.path.join(dest_folder, group_filename(orig_vector_layer.name(), field) + ".zip"),
+                compression_level,
+            )
+            feedback.pushInfo(f"Bundled {len(generated_STLs)} file(s) into {archive_filename}")
+
         # Return the results of the algorithm
-        return {self.SUCCESS: success, self.OUTPUT: generated_STLs}
+        return {self.SUCCESS: success, self.OUTPUT: generated_STLs, self.ARCHIVE: archive_filename}
+
+    def clip_raster(self, group, orig_raster_layer, orig_vector_layer, temp_folder, dest_folder, feedback):
+        """
+        Clips the raster layer with the features of the group and returns the clipped raster layer.
+        The mask layer is only needed for the clip so it goes into the temporary folder,
+        while the clipped raster is kept next to the generated STLs.
+        """
+        # Only write the mask layers of the groups that overlap with the raster file
+        mask_filepath = write_mask_layer(
+            group["features"], orig_vector_layer, os.path.join(temp_folder, group["name"] + ".gpkg")
+        )
+        clipped_raster_filepath = os.path.join(dest_folder, group["name"] + "_raster.tif")
+        overlap = group["overlap"]
+
+        # Send some information to the user
+        feedback.pushInfo(f"Clipping the input raster layer using {group['name']}...")
+
+        # Clip the raster layer with the mask layer
+        clipped_raster_filepath = processing.run(
+            "gdal:cliprasterbymasklayer",
+            {
+                "INPUT": orig_raster_layer.source(),
+                "MASK": mask_filepath,
+                "SOURCE_CRS": orig_raster_layer.crs(),
+                "TARGET_CRS": orig_vector_layer.crs(),
+                "TARGET_EXTENT": f"{overlap.xMinimum()}, {overlap.xMaximum()}, {overlap.yMinimum()}, {overlap.yMaximum()}",
+                "MULTITHREADING": True,
+                "NODATA": orig_raster_layer.dataProvider().sourceNoDataValue(1),
+                # "KEEP_RESOLUTION": True,
+                "OUTPUT": clipped_raster_filepath,
+            },
+            feedback=feedback,
+        )["OUTPUT"]
+
+        # Send some information to the user
+        feedback.pushInfo(
+            f"Finished clipping the input raster layer to {clipped_raster_filepath}.\n"
+        )
+
+        return QgsRasterLayer(clipped_raster_filepath)
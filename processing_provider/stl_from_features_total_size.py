@@ -18,15 +18,29 @@ from qgis.core import (
     QgsProcessingParameterField,
     QgsProcessingParameterRasterLayer,
     QgsProcessingParameterVectorLayer,
+    QgsProcessingParameterEnum,
+    QgsProcessingParameterDefinition,
+    QgsProcessingParameterBoolean,
     QgsProcessingParameterNumber,
     QgsProcessingParameterFolderDestination,
+    QgsProcessingMultiStepFeedback,
+    QgsProcessingOutputFile,
+    QgsProcessingUtils,
     QgsRasterLayer,
     QgsVectorLayer,
     QgsWkbTypes,
 )
 from qgis import processing
 
-from ..mesh_generator import MeshGenerator, MeshGeneratorError
+from ..output_formats import OUTPUT_FORMATS
+from .feature_split import (
+    bundle_files,
+    elevation_range,
+    group_filename,
+    group_filenames,
+    group_overlapping_features,
+    write_mask_layer,
+)
 
 import os
 
@@ -57,7 +71,11 @@ class STLFromFeaturesTotalSize(QgsProcessingAlgorithm):
     TOTAL_WIDTH = "TOTAL WIDTH"
     TOTAL_LENGTH = "TOTAL LENGTH"
     LINE_WIDTH = "LINE WIDTH"
+    OUTPUT_FORMAT = "OUTPUT FORMAT"
+    BUNDLE = "BUNDLE"
+    COMPRESSION_LEVEL = "COMPRESSION LEVEL"
     OUTPUT = "OUTPUT"
+    ARCHIVE = "ARCHIVE"
     SUCCESS = "SUCCESS"
 
     def tr(self, string):
@@ -198,6 +216,39 @@ class STLFromFeaturesTotalSize(QgsProcessingAlgorithm):
             )
         )
 
+        # The file format of the generated model(s)
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                self.OUTPUT_FORMAT,
+                self.tr("Output Format"),
+                options=[output_format.name for output_format in OUTPUT_FORMATS.values()],
+                defaultValue=0,
+            )
+        )
+
+        # Bundle all the generated files into one zip archive
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.BUNDLE,
+                self.tr("Bundle the generated files into one zip archive"),
+                defaultValue=False,
+            )
+        )
+
+        # The deflate level (0 to 9) of the archive and the compressed output formats
+        compression_level = QgsProcessingParameterNumber(
+            self.COMPRESSION_LEVEL,
+            self.tr("Compression Level"),
+            type=QgsProcessingParameterNumber.Integer,
+            defaultValue=6,
+            minValue=0,
+            maxValue=9,
+        )
+        compression_level.setFlags(
+            compression_level.flags() | QgsProcessingParameterDefinition.FlagAdvanced
+        )
+        self.addParameter(compression_level)
+
         # The folder destination where we'll save the generated STL(s)
         self.addParameter(
             QgsProcessingParameterFolderDestination(
@@ -205,6 +256,9 @@ class STLFromFeaturesTotalSize(QgsProcessingAlgorithm):
             )
         )
 
+        # The zip archive of the generated files, only written when they're bundled
+        self.addOutput(QgsProcessingOutputFile(self.ARCHIVE, self.tr("Zip Archive")))
+
     def processAlgorithm(self, parameters, context, feedback):
         """
         Here is where the processing itself takes place.
@@ -233,6 +287,9 @@ class STLFromFeaturesTotalSize(QgsProcessingAlgorithm):
         total_length = self.parameterAsDouble(parameters, self.TOTAL_LENGTH, context)
         line_width = self.parameterAsDouble(parameters, self.LINE_WIDTH, context)
         dest_folder = self.parameterAsFile(parameters, self.OUTPUT, context)
+        output_format = self.parameterAsEnum(parameters, self.OUTPUT_FORMAT, context)
+        bundle = self.parameterAsBoolean(parameters, self.BUNDLE, context)
+        compression_level = self.parameterAsInt(parameters, self.COMPRESSION_LEVEL, context)
 
         # Send some information to the user
         feedback.pushInfo("Loaded all the parameters\n")
@@ -314,20 +371,17 @@ class STLFromFeaturesTotalSize(QgsProcessingAlgorithm):
         
         feedback.pushInfo(f"Splitting the vector file based on the {field} field...")
 
-        # Split the multi polygon layer into multiple vector layers using the "split vector layer" algorithm
-        vector_filepaths: list[str] = processing.run(
-            "native:splitvectorlayer",
-            {
-                "FIELD": field,
-                "FILE_TYPE": 0,
-                "INPUT": vector_filepath,
-                "OUTPUT": "TEMPORARY_OUTPUT",
-                "PREFIX_FIELD": True,
-            },
-        )["OUTPUT_LAYERS"]
+        # Group the features by the split field, skipping any feature that doesn't overlap with the raster
+        raster_extent = orig_raster_layer.extent()
+        feature_groups = group_overlapping_features(orig_vector_layer, field, raster_extent)
 
         # Send some information to the user
-        feedback.pushInfo(f"Finished splitting the vector layer!\n")
+        feedback.pushInfo(
+            f"Found {len(feature_groups)} group(s) of features that overlap with the input raster.\n"
+        )
+
+        # Clipping and generating the STL of every group are a step each of the overall progress plus the merge
+        step_feedback = QgsProcessingMultiStepFeedback(max(1, 2 * len(feature_groups) + 1), feedback)
 
         # **************************************************************************************************
         # 4) CLIP THE RASTER LAYER AND FIND THE APPROPRIATE SCALE FACTOR
@@ -337,26 +391,37 @@ class STLFromFeaturesTotalSize(QgsProcessingAlgorithm):
             "Started clipping the raster layer by the split vector layer.\n"
         )
 
+        temp_folder = QgsProcessingUtils.tempFolder()
+
         rasters_to_process: list[QgsRasterLayer] = []
 
+        # The elevation range of all the overlapping features combined, computed once over the source raster.
+        # Shared by every STL so that they're all printed with the same vertical scale
+        min_elevation, max_elevation = elevation_range(
+            orig_raster_layer,
+            [group_extent.intersect(raster_extent) for _, group_extent in feature_groups.values()],
+        )
+
+        # Every group's outputs are named after its value, made unique where the sanitized names collide
+        filenames = group_filenames(field, feature_groups)
+
         # Clip the raster file using the vector masks and
         # find the scale factor required to fit the largest clipped raster onto the print bed
-        for mask_filepath in vector_filepaths:
-            # Get the filename of the mask layer so the clipped raster can get the same name
-            filename = mask_filepath.split(".")[-2]
-            clipped_raster_filepath = os.path.join(
-                dest_folder, filename + "_raster.tif"
+        for index, (value, (features, group_extent)) in enumerate(feature_groups.items()):
+            if feedback.isCanceled():
+                feedback.pushInfo("Canceled before all the features were clipped.")
+                return {self.SUCCESS: False, self.OUTPUT: [], self.ARCHIVE: None}
+
+            step_feedback.setCurrentStep(index)
+
+            # Only write the mask layers of the groups that overlap with the raster file
+            filename = filenames[value]
+            overlap = group_extent.intersect(raster_extent)
+            mask_filepath = write_mask_layer(
+                features, orig_vector_layer, os.path.join(temp_folder, filename + ".gpkg")
             )
-
-            # Load the mask layer
-            mask_layer = QgsVectorLayer(path=mask_filepath)
-
-            # Skip any mask layers that don't overlap with the raster file
-            overlap = mask_layer.extent().intersect(orig_raster_layer.extent())
-            if overlap.isEmpty():
-                # Send some information to the user
-                feedback.pushInfo(f"{filename} has no overlap with the input raster.\n")
-                continue
+            # The clipped rasters are kept next to the generated STLs
+            clipped_raster_filepath = os.path.join(dest_folder, filename + "_raster.tif")
 
             # Send some information to the user
             feedback.pushInfo(f"Clipping the input raster layer using {filename}...")
@@ -369,18 +434,19 @@ class STLFromFeaturesTotalSize(QgsProcessingAlgorithm):
                         "INPUT": raster_filepath,
                         "MASK": mask_filepath,
                         "SOURCE_CRS": orig_raster_layer.crs(),
-                        "TARGET_CRS": mask_layer.crs(),
+                        "TARGET_CRS": orig_vector_layer.crs(),
                         "TARGET_EXTENT": f"{overlap.xMinimum()}, {overlap.xMaximum()}, {overlap.yMinimum()}, {overlap.yMaximum()}",
                         "MULTITHREADING": True,
                         "NODATA": no_data_value,
                         # "KEEP_RESOLUTION": True,
                         "OUTPUT": clipped_raster_filepath,
                     },
+                    feedback=step_feedback,
                 )["OUTPUT"]
 
             except QgsProcessingException as e:
                 feedback.pushInfo(f"Error: {e}")
-                return {self.SUCCESS: False, self.OUTPUT: []}
+                return {self.SUCCESS: False, self.OUTPUT: [], self.ARCHIVE: None}
 
             # Add the clipped raster to the list of rasters to process
             clipped_raster_layer = QgsRasterLayer(clipped_raster_filepath)
@@ -403,9 +469,14 @@ class STLFromFeaturesTotalSize(QgsProcessingAlgorithm):
         feedback.pushInfo(
             "Getting the total height and width of the clipped rasters...")
 
+        if feedback.isCanceled():
+            return {self.SUCCESS: False, self.OUTPUT: [], self.ARCHIVE: None}
+
+        step_feedback.setCurrentStep(len(feature_groups))
+
         # Merge all the relevant raster files together
         output = processing.run(
-            "gdal:merge", {"INPUT": rasters_to_process, "OUTPUT": "TEMPORARY_OUTPUT"}
+            "gdal:merge", {"INPUT": rasters_to_process, "OUTPUT": "TEMPORARY_OUTPUT"}, feedback=step_feedback
         )["OUTPUT"]
         merged_raster = QgsRasterLayer(output)
 
@@ -438,8 +509,19 @@ class STLFromFeaturesTotalSize(QgsProcessingAlgorithm):
         generated_STLs: list[str] = []
         success = True
 
+        feedback.pushInfo(
+            f"All the STLs will share the elevation range of {min_elevation} to {max_elevation}.\n"
+        )
+
         # Generates an STL from each of the clipped raster layers
-        for clipped_raster_layer in rasters_to_process:
+        for index, clipped_raster_layer in enumerate(rasters_to_process):
+            if feedback.isCanceled():
+                feedback.pushInfo("Canceled the generation of the remaining STLs.")
+                success = False
+                break
+
+            step_feedback.setCurrentStep(len(feature_groups) + 1 + index)
+
             feedback.pushInfo(f"Creating an STL for {clipped_raster_layer.source()}")
             width = (clipped_raster_layer.height() * line_width) * scale_factor
             height = (clipped_raster_layer.width() * line_width) * scale_factor
@@ -453,10 +535,14 @@ class STLFromFeaturesTotalSize(QgsProcessingAlgorithm):
                     "BED WIDTH": width,
                     "BED LENGTH": height,
                     "LINE WIDTH": line_width,
+                    "MIN ELEVATION": min_elevation,
+                    "MAX ELEVATION": max_elevation,
+                    "OUTPUT FORMAT": output_format,
+                    "COMPRESSION LEVEL": compression_level,
                     "OUTPUT": dest_folder,
                 },
                 context=context,
-                feedback=feedback,
+                feedback=step_feedback,
             )
 
             stl_filename = result["OUTPUT"]
@@ -474,5 +560,15 @@ class STLFromFeaturesTotalSize(QgsProcessingAlgorithm):
                 )
                 success = False
 
+        # Bundle the generated files into one archive
+        archive_filename = None
+        if bundle and generated_STLs and not feedback.isCanceled():
+            archive_filename = bundle_files(
+                generated_STLs,
+                os.path.join(dest_folder, group_filename(orig_vector_layer.name(), field) + ".zip"),
+                compression_level,
+            )
+            feedback.pushInfo(f"Bundled {len(generated_STLs)} file(s) into {archive_filename}")
+
         # Return the results of the algorithm
-        return {self.SUCCESS: success, self.OUTPUT: generated_STLs}
+        return {self.SUCCESS: success, self.OUTPUT: generated_STLs, self.ARCHIVE: archive_filename}
@@ -15,12 +15,15 @@ from qgis.core import (
     QgsProcessingException,
     QgsProcessingAlgorithm,
     QgsProcessingParameterRasterLayer,
+    QgsProcessingParameterBoolean,
+    QgsProcessingParameterDefinition,
+    QgsProcessingParameterEnum,
     QgsProcessingParameterNumber,
     QgsProcessingParameterFolderDestination,
 )
 from qgis import processing
 
-from ..mesh_generator import MeshGenerator, MeshGeneratorError
+from ..output_formats import OUTPUT_FORMATS
 
 import os
 
@@ -49,6 +52,13 @@ class STLFromRaster(QgsProcessingAlgorithm):
     BED_WIDTH = "BED WIDTH"
     BED_LENGTH = "BED LENGTH"
     LINE_WIDTH = "LINE WIDTH"
+    MIN_ELEVATION = "MIN ELEVATION"
+    MAX_ELEVATION = "MAX ELEVATION"
+    OUTPUT_FORMAT = "OUTPUT FORMAT"
+    COMPRESSION_LEVEL = "COMPRESSION LEVEL"
+    MERGE_FLAT_AREAS = "MERGE FLAT AREAS"
+    VALIDATE = "VALIDATE"
+    REUSE_CACHED = "REUSE CACHED"
     OUTPUT = "OUTPUT"
     SUCCESS = "SUCCESS"
 
@@ -163,6 +173,77 @@ class STLFromRaster(QgsProcessingAlgorithm):
                 minValue=0,
             )
         )
+
+        # The elevation range used to scale the model vertically.
+        # Lets several STLs share the same vertical scale when they're left empty by the user
+        for name, description in [
+            (self.MIN_ELEVATION, self.tr("Minimum Elevation (raster units)")),
+            (self.MAX_ELEVATION, self.tr("Maximum Elevation (raster units)")),
+        ]:
+            parameter = QgsProcessingParameterNumber(
+                name,
+                description,
+                type=QgsProcessingParameterNumber.Double,
+                optional=True,
+            )
+            parameter.setFlags(
+                parameter.flags() | QgsProcessingParameterDefinition.FlagAdvanced
+            )
+            self.addParameter(parameter)
+
+        # The file format of the generated model(s)
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                self.OUTPUT_FORMAT,
+                self.tr("Output Format"),
+                options=[output_format.name for output_format in OUTPUT_FORMATS.values()],
+                defaultValue=0,
+            )
+        )
+
+        # The deflate level (0 to 9) of the compressed output formats
+        compression_level = QgsProcessingParameterNumber(
+            self.COMPRESSION_LEVEL,
+            self.tr("Compression Level"),
+            type=QgsProcessingParameterNumber.Integer,
+            defaultValue=6,
+            minValue=0,
+            maxValue=9,
+        )
+        compression_level.setFlags(
+            compression_level.flags() | QgsProcessingParameterDefinition.FlagAdvanced
+        )
+        self.addParameter(compression_level)
+
+        # Meshes the flat parts of the surface (lakes, terraces), the floor and the straight walls
+        # with fewer and larger triangles
+        merge_flat_areas = QgsProcessingParameterBoolean(
+            self.MERGE_FLAT_AREAS,
+            self.tr("Merge Flat Areas"),
+            defaultValue=False,
+        )
+        merge_flat_areas.setFlags(merge_flat_areas.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(merge_flat_areas)
+
+        # Checks that the written mesh is watertight, at about the cost of writing it a second time
+        validate = QgsProcessingParameterBoolean(
+            self.VALIDATE,
+            self.tr("Validate the Mesh"),
+            defaultValue=False,
+        )
+        validate.setFlags(validate.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(validate)
+
+        # Keeps a copy of the model in the user's cache folder (at most 1 GB of them)
+        # and copies it from there when the same model is generated again
+        reuse_cached = QgsProcessingParameterBoolean(
+            self.REUSE_CACHED,
+            self.tr("Reuse Models Generated Before From the Same Inputs"),
+            defaultValue=False,
+        )
+        reuse_cached.setFlags(reuse_cached.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(reuse_cached)
+
         # The folder destination where we'll save the generated STL
         self.addParameter(
             QgsProcessingParameterFolderDestination(
@@ -192,13 +273,37 @@ class STLFromRaster(QgsProcessingAlgorithm):
         line_width = self.parameterAsDouble(parameters, self.LINE_WIDTH, context)
 
         dest_folder = self.parameterAsFile(parameters, self.OUTPUT, context)
+        output_format = self.parameterAsEnum(parameters, self.OUTPUT_FORMAT, context)
+        compression_level = self.parameterAsInt(parameters, self.COMPRESSION_LEVEL, context)
+        merge_flat_areas = self.parameterAsBoolean(parameters, self.MERGE_FLAT_AREAS, context)
+        validate = self.parameterAsBoolean(parameters, self.VALIDATE, context)
+        reuse_cached = self.parameterAsBoolean(parameters, self.REUSE_CACHED, context)
+
+        # Only use the elevation range if both ends of it were given
+        min_elevation = None
+        max_elevation = None
+        if (
+            parameters.get(self.MIN_ELEVATION) is not None
+            and parameters.get(self.MAX_ELEVATION) is not None
+        ):
+            min_elevation = self.parameterAsDouble(parameters, self.MIN_ELEVATION, context)
+            max_elevation = self.parameterAsDouble(parameters, self.MAX_ELEVATION, context)
 
         # Construct the name of the STL's output file
-        output_filename = os.path.join(dest_folder, raster_layer.name() + ".stl")
+        format_id = list(OUTPUT_FORMATS.keys())[output_format]
+        output_filename = os.path.join(
+            dest_folder, raster_layer.name() + OUTPUT_FORMATS[format_id].extension
+        )
+
+        # The meshing engine (NumPy, GDAL and the DLL) is only loaded once an STL is generated,
+        # so registering the algorithms doesn't slow down the start of QGIS
+        from ..mesh_generator import GenerationCanceledError, MeshGenerator
 
         try:
             # Init the MeshGenerator used to create the STL
             mesh_generator = MeshGenerator()
+            mesh_generator.set_cancel_callback(feedback.isCanceled)
+            mesh_generator.set_progress_callback(lambda value, stage: feedback.setProgress(value * 100))
 
             # Preprocess the raster image
             mesh_generator.generate_height_array(
@@ -209,6 +314,13 @@ class STLFromRaster(QgsProcessingAlgorithm):
                     "bedX": bed_width,
                     "bedY": bed_length,
                     "lineWidth": line_width,
+                    "outputFormat": format_id,
+                    "compressionLevel": compression_level,
+                    "mergeCoplanar": merge_flat_areas,
+                    "validateMesh": validate,
+                    "useCache": reuse_cached,
+                    "minValue": min_elevation,
+                    "maxValue": max_elevation,
                 },
                 source_dem=dem_path,
             )
@@ -216,9 +328,20 @@ class STLFromRaster(QgsProcessingAlgorithm):
             # Generate the STL
             mesh_generator.manually_generate_stl()
 
+        except GenerationCanceledError:
+            feedback.pushInfo("The generation was canceled and its partial output removed.")
+            return {self.OUTPUT: output_filename, self.SUCCESS: False}
+
         except Exception as e:
             feedback.pushWarning(f"{e}\n")
             return {self.OUTPUT: output_filename, self.SUCCESS: False}
 
+        # Report the defects found in the written meshes
+        for path, result in mesh_generator.validationResults:
+            if result.isWatertight:
+                feedback.pushInfo(f"{os.path.basename(path)}: {result}")
+            else:
+                feedback.pushWarning(f"{os.path.basename(path)}: {result}")
+
         # Return the results of the algorithm
         return {self.OUTPUT: output_filename, self.SUCCESS: True}
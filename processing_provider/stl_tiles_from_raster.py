@@ -0,0 +1,341 @@
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+from qgis.PyQt.QtCore import QCoreApplication
+from qgis.core import (
+    QgsProcessing,
+    QgsProcessingException,
+    QgsProcessingAlgorithm,
+    QgsProcessingParameterRasterLayer,
+    QgsProcessingParameterBoolean,
+    QgsProcessingParameterDefinition,
+    QgsProcessingParameterEnum,
+    QgsProcessingParameterNumber,
+    QgsProcessingParameterFolderDestination,
+)
+from qgis import processing
+
+from ..output_formats import OUTPUT_FORMATS
+
+import os
+
+
+class STLTilesFromRaster(QgsProcessingAlgorithm):
+    """
+    This is an example algorithm that takes a vector layer and
+    creates a new identical one.
+
+    It is meant to be used as an example of how to create your own
+    algorithms and explain methods and variables used to do it. An
+    algorithm like this will be available in all elements, and there
+    is not need for additional work.
+
+    All Processing algorithms should extend the QgsProcessingAlgorithm
+    class.
+    """
+
+    # Constants used to refer to parameters and outputs. They will be
+    # used when calling the algorithm from another algorithm, or when
+    # calling from the QGIS console.
+
+    INPUT = "INPUT"
+    MODEL_HEIGHT = "MODEL HEIGHT"
+    BASE_THICKNESS = "BASE THICKNESS"
+    TOTAL_WIDTH = "TOTAL WIDTH"
+    TOTAL_LENGTH = "TOTAL LENGTH"
+    BED_WIDTH = "BED WIDTH"
+    BED_LENGTH = "BED LENGTH"
+    LINE_WIDTH = "LINE WIDTH"
+    OUTPUT_FORMAT = "OUTPUT FORMAT"
+    COMPRESSION_LEVEL = "COMPRESSION LEVEL"
+    MERGE_FLAT_AREAS = "MERGE FLAT AREAS"
+    VALIDATE = "VALIDATE"
+    OUTPUT = "OUTPUT"
+    TILES = "TILES"
+    SUCCESS = "SUCCESS"
+
+    def tr(self, string):
+        """
+        Returns a translatable string with the self.tr() function.
+        """
+        return QCoreApplication.translate("Processing", string)
+
+    def createInstance(self):
+        return STLTilesFromRaster()
+
+    def name(self):
+        """
+        Returns the algorithm name, used for identifying the algorithm. This
+        string should be fixed for the algorithm, and must not be localised.
+        The name should be unique within each provider. Names should contain
+        lowercase alphanumeric characters only and no spaces or other
+        formatting characters.
+        """
+        return "stltilesfromraster"
+
+    def displayName(self):
+        """
+        Returns the translated algorithm name, which should be used for any
+        user-visible display of the algorithm name.
+        """
+        return self.tr("STL Tiles from Raster")
+
+    def group(self):
+        """
+        Returns the name of the group this algorithm belongs to. This string
+        should be localised.
+        """
+        return self.tr("Raster Processing")
+
+    def groupId(self):
+        """
+        Returns the unique ID of the group this algorithm belongs to. This
+        string should be fixed for the algorithm, and must not be localised.
+        The group id should be unique within each provider. Group id should
+        contain lowercase alphanumeric characters only and no spaces or other
+        formatting characters.
+        """
+        return "rasterprocessing"
+
+    def shortHelpString(self):
+        """
+        Returns a localised short helper string for the algorithm. This string
+        should provide a basic description about what the algorithm does and the
+        parameters and outputs associated with it..
+        """
+        return self.tr(
+            "Generates a model of the given total size from a raster file and splits it into a grid of STL tiles that each fit on the print bed. Neighbouring tiles share their edges so they can be put back together after printing."
+        )
+
+    def initAlgorithm(self, config=None):
+        """
+        Here we define the inputs and output of the algorithm, along
+        with some other properties.
+        """
+
+        # The input raster features source
+        self.addParameter(
+            QgsProcessingParameterRasterLayer(self.INPUT, self.tr("Input DEM layer"))
+        )
+
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.MODEL_HEIGHT,
+                self.tr("Model Height (mm)"),
+                type=QgsProcessingParameterNumber.Double,
+                defaultValue=10.0,
+                minValue=0,
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.BASE_THICKNESS,
+                self.tr("Base Thickness (mm)"),
+                type=QgsProcessingParameterNumber.Double,
+                defaultValue=10.0,
+                minValue=0,
+            )
+        )
+
+        # The total size of the model once all the tiles are put together
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.TOTAL_WIDTH,
+                self.tr("Total Width (mm)"),
+                type=QgsProcessingParameterNumber.Double,
+                defaultValue=600.0,
+                minValue=0,
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.TOTAL_LENGTH,
+                self.tr("Total Length (mm)"),
+                type=QgsProcessingParameterNumber.Double,
+                defaultValue=600.0,
+                minValue=0,
+            )
+        )
+
+        # The size of each tile
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.BED_WIDTH,
+                self.tr("Bed Width (mm)"),
+                type=QgsProcessingParameterNumber.Double,
+                defaultValue=200.0,
+                minValue=0,
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.BED_LENGTH,
+                self.tr("Bed Length (mm)"),
+                type=QgsProcessingParameterNumber.Double,
+                defaultValue=200.0,
+                minValue=0,
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.LINE_WIDTH,
+                self.tr("Line Width (mm)"),
+                type=QgsProcessingParameterNumber.Double,
+                defaultValue=0.4,
+                minValue=0,
+            )
+        )
+
+        # The file format of the generated model(s)
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                self.OUTPUT_FORMAT,
+                self.tr("Output Format"),
+                options=[output_format.name for output_format in OUTPUT_FORMATS.values()],
+                defaultValue=0,
+            )
+        )
+
+        # The deflate level (0 to 9) of the compressed output formats
+        compression_level = QgsProcessingParameterNumber(
+            self.COMPRESSION_LEVEL,
+            self.tr("Compression Level"),
+            type=QgsProcessingParameterNumber.Integer,
+            defaultValue=6,
+            minValue=0,
+            maxValue=9,
+        )
+        compression_level.setFlags(
+            compression_level.flags() | QgsProcessingParameterDefinition.FlagAdvanced
+        )
+        self.addParameter(compression_level)
+
+        # Meshes the flat parts of the surface (lakes, terraces), the floor and the straight walls
+        # with fewer and larger triangles
+        merge_flat_areas = QgsProcessingParameterBoolean(
+            self.MERGE_FLAT_AREAS,
+            self.tr("Merge Flat Areas"),
+            defaultValue=False,
+        )
+        merge_flat_areas.setFlags(merge_flat_areas.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(merge_flat_areas)
+
+        # Checks that the written mesh is watertight, at about the cost of writing it a second time
+        validate = QgsProcessingParameterBoolean(
+            self.VALIDATE,
+            self.tr("Validate the Mesh"),
+            defaultValue=False,
+        )
+        validate.setFlags(validate.flags() | QgsProcessingParameterDefinition.FlagAdvanced)
+        self.addParameter(validate)
+
+        # The folder destination where we'll save the generated STL
+        self.addParameter(
+            QgsProcessingParameterFolderDestination(
+                self.OUTPUT, self.tr("Output File Destination"), os.path.expanduser("~")
+            )
+        )
+
+    def processAlgorithm(self, parameters, context, feedback):
+        """
+        Here is where the processing itself takes place.
+        """
+
+        # Load all the parameters
+        raster_layer = self.parameterAsRasterLayer(parameters, self.INPUT, context)
+        dem_path = raster_layer.source()
+
+        print_height = self.parameterAsDouble(parameters, self.MODEL_HEIGHT, context)
+
+        base_thickness = self.parameterAsDouble(
+            parameters, self.BASE_THICKNESS, context
+        )
+
+        total_width = self.parameterAsDouble(parameters, self.TOTAL_WIDTH, context)
+
+        total_length = self.parameterAsDouble(parameters, self.TOTAL_LENGTH, context)
+
+        bed_width = self.parameterAsDouble(parameters, self.BED_WIDTH, context)
+
+        bed_length = self.parameterAsDouble(parameters, self.BED_LENGTH, context)
+
+        line_width = self.parameterAsDouble(parameters, self.LINE_WIDTH, context)
+
+        dest_folder = self.parameterAsFile(parameters, self.OUTPUT, context)
+        output_format = self.parameterAsEnum(parameters, self.OUTPUT_FORMAT, context)
+        compression_level = self.parameterAsInt(parameters, self.COMPRESSION_LEVEL, context)
+        merge_flat_areas = self.parameterAsBoolean(parameters, self.MERGE_FLAT_AREAS, context)
+        validate = self.parameterAsBoolean(parameters, self.VALIDATE, context)
+
+        # Construct the name of the STL's output file. Each tile gets its position in the grid appended to it
+        format_id = list(OUTPUT_FORMATS.keys())[output_format]
+        output_filename = os.path.join(
+            dest_folder, raster_layer.name() + OUTPUT_FORMATS[format_id].extension
+        )
+
+        # Loaded on first use, like in STLFromRaster
+        from ..mesh_generator import GenerationCanceledError, MeshGenerator
+
+        try:
+            # Init the MeshGenerator used to create the STL
+            mesh_generator = MeshGenerator()
+            mesh_generator.set_cancel_callback(feedback.isCanceled)
+            mesh_generator.set_progress_callback(lambda value, stage: feedback.setProgress(value * 100))
+
+            # Preprocess the raster image
+            mesh_generator.generate_height_array(
+                {
+                    "printHeight": print_height,
+                    "baseHeight": base_thickness,
+                    "saveLocation": output_filename,
+                    "bedX": bed_width,
+                    "bedY": bed_length,
+                    "lineWidth": line_width,
+                    "outputFormat": format_id,
+                    "compressionLevel": compression_level,
+                    "mergeCoplanar": merge_flat_areas,
+                    "validateMesh": validate,
+                    "totalX": total_width,
+                    "totalY": total_length,
+                },
+                source_dem=dem_path,
+            )
+
+            # Generate the STL tiles
+            mesh_generator.manually_generate_stl()
+
+        except GenerationCanceledError:
+            feedback.pushInfo("The generation was canceled and its partial output removed.")
+            return {self.OUTPUT: dest_folder, self.TILES: [], self.SUCCESS: False}
+
+        except Exception as e:
+            feedback.pushWarning(f"{e}\n")
+            return {self.OUTPUT: dest_folder, self.TILES: [], self.SUCCESS: False}
+
+        feedback.pushInfo(f"Created {len(mesh_generator.tileLocations)} STL tiles in {dest_folder}")
+
+        # Report the defects found in the written meshes
+        for path, result in mesh_generator.validationResults:
+            if result.isWatertight:
+                feedback.pushInfo(f"{os.path.basename(path)}: {result}")
+            else:
+                feedback.pushWarning(f"{os.path.basename(path)}: {result}")
+
+        # Return the results of the algorithm
+        return {
+            self.OUTPUT: dest_folder,
+            self.TILES: mesh_generator.tileLocations,
+            self.SUCCESS: True,
+        }
@@ -0,0 +1,138 @@
+"""
+***************************************************************************
+*                                                                         *
+*   This program is free software; you can redistribute it and/or modify  *
+*   it under the terms of the GNU General Public License as published by  *
+*   the Free Software Foundation; either version 2 of the License, or     *
+*   (at your option) any later version.                                   *
+*                                                                         *
+***************************************************************************
+"""
+
+from qgis.PyQt.QtCore import QCoreApplication
+from qgis.core import (
+    QgsProcessingAlgorithm,
+    QgsProcessingException,
+    QgsProcessingOutputBoolean,
+    QgsProcessingOutputNumber,
+    QgsProcessingParameterFile,
+)
+
+
+class ValidateMesh(QgsProcessingAlgorithm):
+    """
+    Checks that a binary STL file (optionally gzip compressed) is watertight and manifold.
+    The defects are counted per edge, see mesh_validator.py.
+    """
+
+    INPUT = "INPUT"
+    WATERTIGHT = "WATERTIGHT"
+    TRIANGLES = "TRIANGLES"
+    BOUNDARY_EDGES = "BOUNDARY EDGES"
+    NON_MANIFOLD_EDGES = "NON-MANIFOLD EDGES"
+    DUPLICATE_EDGES = "DUPLICATE EDGES"
+    DEGENERATE_TRIANGLES = "DEGENERATE TRIANGLES"
+
+    def tr(self, string):
+        """
+        Returns a translatable string with the self.tr() function.
+        """
+        return QCoreApplication.translate("Processing", string)
+
+    def createInstance(self):
+        return ValidateMesh()
+
+    def name(self):
+        """
+        Returns the algorithm name, used for identifying the algorithm.
+        """
+        return "validatemesh"
+
+    def displayName(self):
+        """
+        Returns the translated algorithm name.
+        """
+        return self.tr("Validate STL Mesh")
+
+    def group(self):
+        """
+        Returns the name of the group this algorithm belongs to.
+        """
+        return self.tr("Mesh Tools")
+
+    def groupId(self):
+        """
+        Returns the unique ID of the group this algorithm belongs to.
+        """
+        return "meshtools"
+
+    def shortHelpString(self):
+        """
+        Returns a localised short helper string for the algorithm.
+        """
+        return self.tr(
+            "Checks that a binary STL file is watertight. Counts the boundary edges (holes in the surface), "
+            "the non-manifold edges (shared by more than two triangles) and the duplicate edges "
+            "(flipped or duplicated triangles)."
+        )
+
+    def initAlgorithm(self, config=None):
+        """
+        Here we define the inputs and output of the algorithm, along
+        with some other properties.
+        """
+
+        # The STL to check
+        self.addParameter(
+            QgsProcessingParameterFile(
+                self.INPUT,
+                self.tr("STL File"),
+                fileFilter=self.tr("STL files (*.stl *.stl.gz *.STL)"),
+            )
+        )
+
+        self.addOutput(QgsProcessingOutputBoolean(self.WATERTIGHT, self.tr("Watertight")))
+        for name, description in [
+            (self.TRIANGLES, self.tr("Triangles")),
+            (self.BOUNDARY_EDGES, self.tr("Boundary Edges")),
+            (self.NON_MANIFOLD_EDGES, self.tr("Non-Manifold Edges")),
+            (self.DUPLICATE_EDGES, self.tr("Duplicate Edges")),
+            (self.DEGENERATE_TRIANGLES, self.tr("Degenerate Triangles")),
+        ]:
+            self.addOutput(QgsProcessingOutputNumber(name, description))
+
+    def processAlgorithm(self, parameters, context, feedback):
+        """
+        Here is where the processing itself takes place.
+        """
+        path = self.parameterAsFile(parameters, self.INPUT, context)
+
+        # Loaded on first use, like in STLFromRaster
+        from ..mesh_generator import GenerationCanceledError, MeshGeneratorError
+        from ..mesh_validator import validate_stl
+
+        def check_canceled():
+            if feedback.isCanceled():
+                raise GenerationCanceledError("The validation was canceled")
+
+        try:
+            result = validate_stl(path, check_canceled)
+        except GenerationCanceledError:
+            feedback.pushInfo("The validation was canceled.")
+            return {}
+        except MeshGeneratorError as e:
+            raise QgsProcessingException(str(e))
+
+        if result.isWatertight:
+            feedback.pushInfo(str(result))
+        else:
+            feedback.pushWarning(str(result))
+
+        return {
+            self.WATERTIGHT: result.isWatertight,
+            self.TRIANGLES: result.numTriangles,
+            self.BOUNDARY_EDGES: result.boundaryEdges,
+            self.NON_MANIFOLD_EDGES: result.nonManifoldEdges,
+            self.DUPLICATE_EDGES: result.duplicateEdges,
+            self.DEGENERATE_TRIANGLES: result.degenerateTriangles,
+        }
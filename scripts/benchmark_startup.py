@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Measures how long it takes to load the plugin, the way QGIS does when it starts.
+
+Every run imports the plugin in a fresh interpreter, so nothing is cached between the runs.
+The time it takes to import QGIS itself is measured on its own and left out of the plugin's time.
+The modules that shouldn't be loaded before the plugin is first used are reported if they were.
+
+Has to be run with the Python interpreter of QGIS (e.g. from the OSGeo4W shell or scripts/run-env-linux.sh):
+    python scripts/benchmark_startup.py [--runs 10] [--json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE = os.path.basename(PLUGIN_DIR)
+
+# Modules that are only needed once a model is generated or the dialog is opened
+DEFERRED_MODULES = [
+    "numpy",
+    "osgeo.gdal",
+    "matplotlib",
+    f"{PACKAGE}.mesh_generator",
+    f"{PACKAGE}.stl_generator_dialog",
+    f"{PACKAGE}.resources_rc",
+]
+
+BASELINE = """
+import time
+start = time.perf_counter()
+import qgis.core, qgis.gui, qgis.PyQt.QtWidgets
+print(time.perf_counter() - start)
+"""
+
+PLUGIN = """
+import json, sys, time
+sys.path.insert(0, {parent!r})
+import qgis.core, qgis.gui, qgis.PyQt.QtWidgets
+already_loaded = set(sys.modules)
+start = time.perf_counter()
+import {package}
+from {package}.stl_generator import STLGenerator
+print(json.dumps({{
+    "seconds": time.perf_counter() - start,
+    "loaded": [name for name in {deferred!r} if name in sys.modules and name not in already_loaded],
+}}))
+"""
+
+
+def run(code):
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return result.stdout.strip().splitlines()[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10, help="number of fresh interpreters to time")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args()
+
+    baseline = [float(run(BASELINE)) for _ in range(args.runs)]
+
+    plugin_code = PLUGIN.format(parent=os.path.dirname(PLUGIN_DIR), package=PACKAGE, deferred=DEFERRED_MODULES)
+    plugin_runs = [json.loads(run(plugin_code)) for _ in range(args.runs)]
+    plugin = [result["seconds"] for result in plugin_runs]
+    loaded = sorted({name for result in plugin_runs for name in result["loaded"]})
+
+    results = {
+        "runs": args.runs,
+        "qgis_import_median_s": statistics.median(baseline),
+        "plugin_import_median_s": statistics.median(plugin),
+        "plugin_import_max_s": max(plugin),
+        "deferred_modules_loaded": loaded,
+    }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"Importing QGIS:      {results['qgis_import_median_s'] * 1000:8.1f} ms (median of {args.runs})")
+        print(f"Importing the plugin: {results['plugin_import_median_s'] * 1000:7.1f} ms (median of {args.runs}), "
+              f"{results['plugin_import_max_s'] * 1000:.1f} ms at most")
+        if loaded:
+            print("Modules loaded too early: " + ", ".join(loaded))
+        else:
+            print("None of the deferred modules were loaded.")
+
+    # Fail when one of the deferred modules sneaks back into the startup path
+    return 1 if loaded else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Splits the generation of a model from a huge DEM across several machines (see mesh_shards.py).
+
+    python scripts/shard_model.py plan dem.tif parameters.json model.shards.json --shards 16
+    python scripts/shard_model.py mesh model.shards.json 0 1 2 3     (on every machine, for its shards)
+    python scripts/shard_model.py merge model.shards.json --validate
+
+The parameters are the ones of the mesh generator as a JSON object (printHeight, baseHeight, bedX, bedY, lineWidth,
+outputFormat, mergeCoplanar, ...), saveLocation being where the merged model is written. The shards are written
+next to the manifest, so a shared folder lets every machine write its shards where the merge finds them; --folder
+points the mesh and merge steps to another folder. mesh meshes every shard of the manifest if no index is given.
+
+Runs without QGIS, only NumPy and the GDAL Python bindings are needed.
+"""
+
+import argparse
+import importlib
+import json
+import os
+import sys
+import time
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE = os.path.basename(PLUGIN_DIR)
+
+
+def import_plugin_module(name):
+    # The plugin folder is imported as a package, the same way QGIS does it
+    sys.path.insert(0, os.path.dirname(PLUGIN_DIR))
+    return importlib.import_module(f"{PACKAGE}.{name}")
+
+
+def print_progress(value, stage):
+    print(f"\r{stage:<8}{value:6.1%}", end="", file=sys.stderr, flush=True)
+
+
+def plan(args, mesh_shards):
+    with open(args.parameters, "r", encoding="utf-8") as f:
+        parameters = json.load(f)
+    if args.output:
+        parameters["saveLocation"] = os.path.abspath(args.output)
+    if not parameters.get("saveLocation"):
+        raise SystemExit("The path of the merged model has to be given as the saveLocation parameter or --output")
+
+    manifest = mesh_shards.plan_shards(parameters, args.dem, args.manifest, args.shards, args.shard_rows)
+    height, width = manifest["grid"]
+    print(f"Planned {len(manifest['shards'])} shards of a {width} by {height} height grid into {args.manifest}.",
+          file=sys.stderr)
+
+
+def mesh(args, mesh_shards, mesh_generator):
+    indices = args.indices or range(len(mesh_shards.load_manifest(args.manifest)["shards"]))
+    for index in indices:
+        generator = mesh_generator.MeshGenerator()
+        generator.set_progress_callback(print_progress)
+
+        start = time.perf_counter()
+        num_triangles = mesh_shards.mesh_shard(args.manifest, index, args.dem, folder=args.folder, generator=generator)
+        print(f"\rShard {index}: {num_triangles} triangles in {time.perf_counter() - start:.1f} s.", file=sys.stderr)
+
+
+def merge(args, mesh_shards):
+    start = time.perf_counter()
+    num_triangles, validation = mesh_shards.merge_shards(args.manifest, args.output, args.folder, args.validate)
+    print(f"Merged {num_triangles} triangles in {time.perf_counter() - start:.1f} s.", file=sys.stderr)
+
+    if validation is not None:
+        print(validation, file=sys.stderr)
+        return 0 if validation.isWatertight else 1
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    plan_parser = commands.add_parser("plan", help="split the model into shards and write their manifest")
+    plan_parser.add_argument("dem", help="DEM to generate the model from")
+    plan_parser.add_argument("parameters", help="JSON file of the parameters of the mesh generator")
+    plan_parser.add_argument("manifest", help="path of the manifest to write")
+    size = plan_parser.add_mutually_exclusive_group(required=True)
+    size.add_argument("--shards", type=int, help="number of shards")
+    size.add_argument("--shard-rows", type=int, help="number of rows of the height grid in every shard")
+    plan_parser.add_argument("--output", help="path of the merged model, instead of the saveLocation parameter")
+
+    mesh_parser = commands.add_parser("mesh", help="mesh some of the shards of a manifest")
+    mesh_parser.add_argument("manifest", help="manifest written by plan")
+    mesh_parser.add_argument("indices", type=int, nargs="*", help="indices of the shards, all of them by default")
+    mesh_parser.add_argument("--dem", help="path of the DEM on this machine, if it isn't the planned one")
+    mesh_parser.add_argument("--folder", help="folder to write the shards to, instead of the manifest's")
+
+    merge_parser = commands.add_parser("merge", help="merge the meshed shards into the model")
+    merge_parser.add_argument("manifest", help="manifest written by plan")
+    merge_parser.add_argument("--output", help="path of the merged model, instead of the planned one")
+    merge_parser.add_argument("--folder", help="folder to read the shards from, instead of the manifest's")
+    merge_parser.add_argument("--validate", action="store_true", help="check that the merged model is watertight")
+
+    args = parser.parse_args(argv)
+
+    mesh_generator = import_plugin_module("mesh_generator")
+    mesh_shards = import_plugin_module("mesh_shards")
+
+    try:
+        if args.command == "plan":
+            plan(args, mesh_shards)
+        elif args.command == "mesh":
+            mesh(args, mesh_shards, mesh_generator)
+        else:
+            return merge(args, mesh_shards)
+    except mesh_generator.MeshGeneratorError as e:
+        print(f"\n{e}", file=sys.stderr)
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,592 @@
+#!/usr/bin/env python3
+"""
+Generates models from DEMs over a local HTTP API, for the tools that can't run QGIS.
+
+Only the parts of the plugin that run without QGIS are used, so NumPy and the GDAL Python bindings are all it needs.
+The jobs are queued and every one of them runs in its own worker process, at most --workers of them at once.
+The process gets the memory limit of its job, so a job that runs out of memory or crashes can't take the service
+or the other jobs down with it:
+    python service/generation_service.py --port 8765 --workers 4 --memory-limit 4096
+
+The API only speaks JSON, apart from the models themselves:
+    POST   /jobs               queues a job: {"dem": path, "parameters": {...}, "memoryLimitMb": 2048}
+    GET    /jobs               returns the status of every job
+    GET    /jobs/<id>          returns the status of a job, ?wait=<seconds> waits for it to finish first
+    GET    /jobs/<id>/result   streams the generated model, ?wait=<seconds> waits for it to finish first
+    DELETE /jobs/<id>          cancels the job and deletes its model
+    GET    /health             returns the number of workers and of the queued and running jobs
+
+The parameters are the ones the stlfromraster algorithm passes to the mesh generator (printHeight, baseHeight,
+bedX, bedY, lineWidth, outputFormat, mergeCoplanar...) or the inputs of the algorithm itself ("MODEL HEIGHT",
+"BED WIDTH", ...). The models are written to --output-dir and only the last --keep finished jobs are kept.
+Tiled models aren't supported, since a job has a single model to send back.
+"""
+
+import argparse
+import importlib
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import shutil
+import signal
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE = os.path.basename(PLUGIN_DIR)
+
+DEFAULT_PORT = 8765
+
+# Longest a request can wait for a job to finish, so a client that went away doesn't hold a thread forever
+MAX_WAIT = 300
+
+# Time a canceled job gets to stop on its own before its process is killed
+CANCEL_GRACE = 10
+
+# Inputs of the stlfromraster algorithm and the parameter of the mesh generator each of them is passed as
+ALGORITHM_PARAMETERS = {
+    "MODEL HEIGHT": "printHeight",
+    "BASE THICKNESS": "baseHeight",
+    "BED WIDTH": "bedX",
+    "BED LENGTH": "bedY",
+    "LINE WIDTH": "lineWidth",
+    "MIN ELEVATION": "minValue",
+    "MAX ELEVATION": "maxValue",
+    "OUTPUT FORMAT": "outputFormat",
+    "COMPRESSION LEVEL": "compressionLevel",
+    "MERGE FLAT AREAS": "mergeCoplanar",
+    "VALIDATE": "validateMesh",
+    "REUSE CACHED": "useCache",
+}
+
+REQUIRED_PARAMETERS = ("printHeight", "baseHeight", "bedX", "bedY", "lineWidth")
+
+# Parameters that are set by the service, since they're paths on its machine
+SERVICE_PARAMETERS = ("saveLocation", "cacheDir", "tempDir")
+
+FINISHED = ("done", "failed", "canceled")
+
+logger = logging.getLogger("generation_service")
+
+
+def import_plugin_module(name):
+    # The plugin folder is imported as a package, the same way QGIS does it
+    parent = os.path.dirname(PLUGIN_DIR)
+    if parent not in sys.path:
+        sys.path.insert(0, parent)
+    return importlib.import_module(f"{PACKAGE}.{name}")
+
+
+def limit_memory(limit):
+    """Limits the address space of this process to limit bytes. Returns False if the platform can't limit it."""
+    try:
+        import resource
+    except ImportError:
+        return False
+
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+    return True
+
+
+def run_job(dem, parameters, memory_limit, cancel_event, connection):
+    """Generates the model of a job. Runs in the job's worker process and reports back through the connection."""
+    if memory_limit:
+        # The BLAS threads reserve a lot of address space, which counts against the limit, and the mesher doesn't need them
+        os.environ.setdefault("OPENBLAS_NUM_THREADS", "1")
+        limit_memory(memory_limit)
+
+    try:
+        mesh_generator = import_plugin_module("mesh_generator")
+    except ImportError as e:
+        connection.send(("failed", f"Couldn't load the mesh generator: {e}"))
+        return
+
+    try:
+        generator = mesh_generator.MeshGenerator()
+        generator.set_cancel_callback(cancel_event.is_set)
+        generator.set_progress_callback(lambda value, stage: connection.send(("progress", value, stage)))
+
+        generator.generate_height_array(parameters, dem)
+        stage_timings = generator.manually_generate_stl()
+
+    except mesh_generator.GenerationCanceledError:
+        connection.send(("canceled", None))
+        return
+    except mesh_generator.MeshGeneratorError as e:
+        connection.send(("failed", str(e)))
+        return
+    except MemoryError:
+        connection.send(("failed", "The job ran out of its memory limit"))
+        return
+    except Exception as e:
+        connection.send(("failed", f"{type(e).__name__}: {e}"))
+        return
+
+    connection.send(("done", {
+        "triangles": generator.numTriangles,
+        "stageTimings": stage_timings,
+        "validation": [result.as_dict() for _, result in generator.validationResults],
+    }))
+
+
+class ServiceError(Exception):
+    def __init__(self, status, message):
+        self.status = status
+        self.message = message
+        super().__init__(self.message)
+
+
+class GenerationJob:
+    """A model requested over the API and the state of its generation."""
+
+    def __init__(self, job_id, dem, parameters, memory_limit):
+        self.id = job_id
+        self.dem = dem
+        self.parameters = parameters
+        # In bytes, None if the job's memory isn't limited
+        self.memoryLimit = memory_limit
+
+        self.status = "queued"
+        self.progress = 0.0
+        self.stage = None
+        self.error = None
+        self.triangles = None
+        # Seconds the read, mesh and write stages spent working and the elapsed seconds of the meshing
+        self.stageTimings = {}
+        self.validation = []
+
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+
+        # Set once the job is finished, whichever way it ended
+        self.done = threading.Event()
+        self.cancelEvent = None
+        self.cancelRequested = None
+
+    @property
+    def path(self):
+        return self.parameters["saveLocation"]
+
+    def as_dict(self):
+        return {
+            "id": self.id,
+            "status": self.status,
+            "progress": self.progress,
+            "stage": self.stage,
+            "error": self.error,
+            "triangles": self.triangles,
+            "stageTimings": self.stageTimings,
+            "validation": self.validation,
+            "dem": self.dem,
+            "outputFormat": self.parameters.get("outputFormat", "stl"),
+            "submitted": self.submitted,
+            "started": self.started,
+            "finished": self.finished,
+        }
+
+
+class GenerationService:
+    """
+    Queues the jobs and runs them on a bounded pool of worker processes.
+    Every worker thread takes the next job from the queue and runs it in a fresh process, which keeps the
+    memory of the jobs apart and lets a job be killed without losing the worker.
+    """
+
+    def __init__(self, output_dir, workers=2, max_queued=100, memory_limit_mb=None, keep=200,
+                 cache_dir=None, temp_dir=None):
+        self.outputDir = output_dir
+        self.numWorkers = workers
+        self.maxQueued = max_queued
+        self.memoryLimitMb = memory_limit_mb
+        self.keep = keep
+        self.cacheDir = cache_dir
+        self.tempDir = temp_dir
+
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+        self.queue = queue.Queue()
+        self.threads = []
+
+        # Spawned processes don't inherit the threads and locks of the server
+        self.context = multiprocessing.get_context("spawn")
+        os.makedirs(self.outputDir, exist_ok=True)
+
+    def start(self):
+        for i in range(self.numWorkers):
+            thread = threading.Thread(target=self.work, name=f"worker-{i + 1}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    # Cancels every unfinished job and waits for the workers to stop
+    def stop(self):
+        with self.lock:
+            unfinished = [job for job in self.jobs.values() if job.status not in FINISHED]
+        for job in unfinished:
+            self.cancel(job.id)
+
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    # Returns the parameters of the mesh generator for the parameters of a request
+    def job_parameters(self, job_id, parameters):
+        if not isinstance(parameters, dict):
+            raise ServiceError(400, "The parameters have to be a JSON object")
+
+        parameters = {ALGORITHM_PARAMETERS.get(key, key): value for key, value in parameters.items()}
+
+        for key in SERVICE_PARAMETERS:
+            if key in parameters:
+                raise ServiceError(400, f"The {key} parameter is set by the service")
+        if parameters.get("totalX") is not None or parameters.get("totalY") is not None:
+            raise ServiceError(400, "Tiled models aren't supported by the service")
+
+        missing = [key for key in REQUIRED_PARAMETERS if parameters.get(key) is None]
+        if missing:
+            raise ServiceError(400, f"Missing parameters: {', '.join(missing)}")
+
+        output_formats = import_plugin_module("output_formats").OUTPUT_FORMATS
+
+        # The algorithm refers to the formats by their index
+        output_format = parameters.get("outputFormat", "stl")
+        if isinstance(output_format, int) and 0 <= output_format < len(output_formats):
+            output_format = list(output_formats)[output_format]
+        if output_format not in output_formats:
+            raise ServiceError(400, f"Unknown output format: {output_format}")
+        parameters["outputFormat"] = output_format
+
+        parameters["saveLocation"] = os.path.join(self.outputDir, job_id + output_formats[output_format].extension)
+        if self.cacheDir:
+            parameters["cacheDir"] = self.cacheDir
+        if self.tempDir:
+            parameters["tempDir"] = self.tempDir
+        return parameters
+
+    def submit(self, dem, parameters, memory_limit_mb=None):
+        if not isinstance(dem, str) or not dem:
+            raise ServiceError(400, "The path of the DEM is missing")
+
+        # Jobs can ask for less memory than the service allows, but not for more
+        if memory_limit_mb is not None and (not isinstance(memory_limit_mb, (int, float)) or memory_limit_mb <= 0):
+            raise ServiceError(400, "The memory limit has to be a positive number of MB")
+        limits = [limit for limit in (memory_limit_mb, self.memoryLimitMb) if limit]
+        memory_limit = int(min(limits) * 1024 ** 2) if limits else None
+
+        job_id = uuid.uuid4().hex
+        parameters = self.job_parameters(job_id, parameters)
+
+        # Leave room for the meshing in the limit, bigger grids are kept in a temporary file (see MeshGenerator)
+        if memory_limit and "maxInMemoryBytes" not in parameters:
+            parameters["maxInMemoryBytes"] = memory_limit // 4
+
+        job = GenerationJob(job_id, dem, parameters, memory_limit)
+        with self.lock:
+            queued = sum(1 for other in self.jobs.values() if other.status == "queued")
+            if queued >= self.maxQueued:
+                raise ServiceError(503, "Too many jobs are queued, try again later")
+            self.jobs[job_id] = job
+
+        self.queue.put(job)
+        logger.info(f"Queued job {job_id} for {dem}.")
+        return job
+
+    def job(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+        if job is None:
+            raise ServiceError(404, f"There's no job {job_id}")
+        return job
+
+    def list_jobs(self):
+        with self.lock:
+            return list(self.jobs.values())
+
+    def health(self):
+        with self.lock:
+            statuses = [job.status for job in self.jobs.values()]
+        return {
+            "workers": self.numWorkers,
+            "queued": statuses.count("queued"),
+            "running": statuses.count("running"),
+            "finished": sum(1 for status in statuses if status in FINISHED),
+        }
+
+    # Stops a queued or running job. Returns the job
+    def cancel(self, job_id):
+        job = self.job(job_id)
+        with self.lock:
+            if job.status == "queued":
+                self.finish(job, "canceled")
+            elif job.status == "running" and job.cancelRequested is None:
+                job.cancelRequested = time.time()
+                job.cancelEvent.set()
+        return job
+
+    # Cancels the job and forgets it along with its model
+    def remove(self, job_id):
+        job = self.cancel(job_id)
+        job.done.wait(CANCEL_GRACE + 5)
+        with self.lock:
+            self.jobs.pop(job_id, None)
+        self.delete_result(job)
+
+    def delete_result(self, job):
+        try:
+            os.remove(job.path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Couldn't delete the model of job {job.id}: {e}")
+
+    # Marks the job as finished. Has to be called with the lock held
+    def finish(self, job, status, error=None):
+        job.status = status
+        job.error = error
+        job.finished = time.time()
+        job.done.set()
+
+        # Forget the oldest finished jobs
+        finished = [other for other in self.jobs.values() if other.status in FINISHED]
+        for old in finished[:max(0, len(finished) - self.keep)]:
+            del self.jobs[old.id]
+            self.delete_result(old)
+
+    # Runs the jobs of the queue one after the other, until it's given None
+    def work(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+
+            with self.lock:
+                if job.status != "queued":
+                    continue
+                job.status = "running"
+                job.started = time.time()
+                job.cancelEvent = self.context.Event()
+
+            try:
+                status, result = self.run(job)
+            except Exception as e:
+                logger.exception(f"Job {job.id} couldn't be run")
+                status, result = "failed", f"The job couldn't be run: {e}"
+
+            with self.lock:
+                if status == "done":
+                    job.triangles = result["triangles"]
+                    job.stageTimings = result["stageTimings"]
+                    job.validation = result["validation"]
+                    job.progress = 1.0
+                    self.finish(job, "done")
+                else:
+                    self.finish(job, status, result)
+
+            logger.info(f"Job {job.id} {status} in {job.finished - job.started:.2f} s.")
+
+    # Runs the job in a new worker process and returns how it ended
+    def run(self, job):
+        receiver, sender = self.context.Pipe(duplex=False)
+        process = self.context.Process(
+            target=run_job, args=(job.dem, job.parameters, job.memoryLimit, job.cancelEvent, sender),
+            name=f"job-{job.id}", daemon=True)
+        process.start()
+        # Only the worker holds the sending end now, so the receiver sees the end of the pipe once it exits
+        sender.close()
+
+        outcome = None
+        try:
+            while True:
+                if not receiver.poll(0.5):
+                    if job.cancelRequested is not None and time.time() - job.cancelRequested > CANCEL_GRACE:
+                        logger.warning(f"Job {job.id} didn't stop after being canceled, killing it.")
+                        process.kill()
+                    continue
+
+                try:
+                    message = receiver.recv()
+                except EOFError:
+                    break
+
+                if message[0] == "progress":
+                    job.progress, job.stage = message[1], message[2]
+                else:
+                    outcome = message
+        finally:
+            receiver.close()
+            process.join()
+
+        if outcome is not None:
+            return outcome
+        if job.cancelRequested is not None:
+            return "canceled", None
+        return "failed", f"The worker process exited with code {process.exitcode}"
+
+
+class ServiceRequestHandler(BaseHTTPRequestHandler):
+    """Maps the requests of the API onto the GenerationService of the server."""
+
+    server_version = "STLGeneratorService/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self.handle_request("GET")
+
+    def do_POST(self):
+        self.handle_request("POST")
+
+    def do_DELETE(self):
+        self.handle_request("DELETE")
+
+    def handle_request(self, method):
+        url = urlparse(self.path)
+        parts = [part for part in url.path.split("/") if part]
+        query = parse_qs(url.query)
+        service = self.server.service
+
+        try:
+            if method == "GET" and parts == ["health"]:
+                self.send_json(200, service.health())
+            elif method == "GET" and parts == ["jobs"]:
+                self.send_json(200, [job.as_dict() for job in service.list_jobs()])
+            elif method == "POST" and parts == ["jobs"]:
+                body = self.read_json()
+                job = service.submit(body.get("dem"), body.get("parameters", {}), body.get("memoryLimitMb"))
+                self.send_json(202, job.as_dict())
+            elif method == "GET" and len(parts) == 2 and parts[0] == "jobs":
+                job = service.job(parts[1])
+                self.wait_for(job, query)
+                self.send_json(200, job.as_dict())
+            elif method == "GET" and len(parts) == 3 and parts[0] == "jobs" and parts[2] == "result":
+                job = service.job(parts[1])
+                self.wait_for(job, query)
+                self.send_result(job)
+            elif method == "DELETE" and len(parts) == 2 and parts[0] == "jobs":
+                service.remove(parts[1])
+                self.send_json(200, {"id": parts[1], "status": "removed"})
+            else:
+                raise ServiceError(404, f"Unknown request: {method} {url.path}")
+
+        except ServiceError as e:
+            self.send_json(e.status, {"error": e.message})
+        except ConnectionError:
+            # The client went away while the model was being sent
+            self.close_connection = True
+        except Exception as e:
+            logger.exception(f"The request {method} {self.path} failed")
+            self.send_json(500, {"error": str(e)})
+
+    def read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError as e:
+            raise ServiceError(400, f"The body isn't valid JSON: {e}")
+        if not isinstance(body, dict):
+            raise ServiceError(400, "The body has to be a JSON object")
+        return body
+
+    # Waits for the job to finish if the request asked for it with ?wait=<seconds>
+    def wait_for(self, job, query):
+        if "wait" not in query:
+            return
+        try:
+            timeout = min(float(query["wait"][0]), MAX_WAIT)
+        except ValueError:
+            raise ServiceError(400, "wait has to be a number of seconds")
+        job.done.wait(timeout)
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_result(self, job):
+        if job.status != "done":
+            raise ServiceError(409, f"The job isn't done, it's {job.status}" + (f": {job.error}" if job.error else ""))
+
+        try:
+            model = open(job.path, "rb")
+        except OSError:
+            raise ServiceError(410, "The model of the job was deleted")
+
+        with model:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(os.fstat(model.fileno()).st_size))
+            self.send_header("Content-Disposition", f'attachment; filename="{os.path.basename(job.path)}"')
+            self.end_headers()
+            shutil.copyfileobj(model, self.wfile, 1024 * 1024)
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on, only the local machine by default")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="port to listen on, 0 picks a free one")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="number of jobs that run at once")
+    parser.add_argument("--max-queued", type=int, default=100, help="number of jobs that can wait for a worker")
+    parser.add_argument("--memory-limit", type=float, help="memory limit of every job in MB")
+    parser.add_argument("--output-dir", default=os.path.join(tempfile.gettempdir(), "stl_generator_service"),
+                        help="folder the models are written to")
+    parser.add_argument("--keep", type=int, default=200, help="number of finished jobs whose models are kept")
+    parser.add_argument("--cache-dir", help="folder of the cached models of the jobs that set useCache, "
+                                            "the mesh generator's default if not given")
+    parser.add_argument("--temp-dir", help="folder of the temporary height grids of the large DEMs")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format="%(asctime)s %(levelname)-8s %(message)s")
+
+    if args.memory_limit and sys.platform == "win32":
+        logger.warning("The memory limits can't be enforced on Windows.")
+
+    service = GenerationService(args.output_dir, args.workers, args.max_queued, args.memory_limit, args.keep,
+                                args.cache_dir, args.temp_dir)
+    server = ThreadingHTTPServer((args.host, args.port), ServiceRequestHandler)
+    server.daemon_threads = True
+    server.service = service
+
+    # Stop the same way on a SIGTERM as on a Ctrl+C, so the running jobs are canceled and cleaned up
+    def terminate(signum, frame):
+        raise KeyboardInterrupt()
+    signal.signal(signal.SIGTERM, terminate)
+
+    service.start()
+    host, port = server.server_address[:2]
+    # Printed on its own line so scripts (like load_test.py) can find the port
+    print(f"Listening on http://{host}:{port}", flush=True)
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop()
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Measures how many jobs per minute the generation service gets through.
+
+Starts the service on a free port (unless --url points to one that's already running), submits --jobs jobs with at
+most --concurrency of them waiting at once, downloads their models and deletes them again. The DEM is one of the
+synthetic DEMs of the benchmarks unless --dem is given, meshed at its full resolution.
+
+The results are printed as JSON: the jobs per minute, and the median and 95th percentile of the time the jobs
+waited for a worker, took to generate and took from their submission until their model was downloaded:
+    python service/load_test.py --jobs 40 --concurrency 8 --workers 4 --size 1024
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+SERVICE_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCHMARKS_DIR = os.path.join(os.path.dirname(SERVICE_DIR), "benchmarks")
+
+LINE_WIDTH = 0.4
+
+
+def request(url, method="GET", body=None, timeout=600):
+    """Sends a request to the service and returns the decoded JSON of the response."""
+    data = json.dumps(body).encode("utf-8") if body is not None else None
+    headers = {"Content-Type": "application/json"} if data is not None else {}
+    with urllib.request.urlopen(urllib.request.Request(url, data, headers, method=method), timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def download(url, timeout=600):
+    """Downloads the model and returns its size in bytes, without keeping it."""
+    size = 0
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        while True:
+            block = response.read(1024 * 1024)
+            if not block:
+                return size
+            size += len(block)
+
+
+def prepare_dem(args):
+    """Returns the path and the (width, height) of the DEM the jobs are generated from."""
+    sys.path.insert(0, BENCHMARKS_DIR)
+    from osgeo import gdal
+    from synthetic_dems import write_synthetic_dem
+
+    path = args.dem or write_synthetic_dem(args.data_dir, args.pattern, args.size)
+    dataset = gdal.Open(path)
+    if dataset is None:
+        raise SystemExit(f"Couldn't open the DEM {path}")
+    return path, (dataset.RasterXSize, dataset.RasterYSize)
+
+
+def start_service(args):
+    """Starts the service on a free port and returns its process and URL."""
+    command = [sys.executable, os.path.join(SERVICE_DIR, "generation_service.py"), "--port", "0",
+               "--workers", str(args.workers), "--max-queued", str(args.jobs),
+               "--output-dir", os.path.join(args.data_dir, "service")]
+    if args.memory_limit:
+        command += ["--memory-limit", str(args.memory_limit)]
+
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if not line.startswith("Listening on "):
+        process.kill()
+        raise SystemExit("The service didn't start")
+    return process, line.split()[-1]
+
+
+def run_client(url, jobs, dem, parameters, results, lock):
+    """Submits the jobs it takes from the list one by one and waits for each of them. Runs in its own thread."""
+    while True:
+        with lock:
+            if not jobs:
+                return
+            jobs.pop()
+
+        start = time.perf_counter()
+        try:
+            job = request(f"{url}/jobs", "POST", {"dem": dem, "parameters": parameters})
+            while job["status"] not in ("done", "failed", "canceled"):
+                job = request(f"{url}/jobs/{job['id']}?wait=60")
+
+            size = download(f"{url}/jobs/{job['id']}/result") if job["status"] == "done" else 0
+            request(f"{url}/jobs/{job['id']}", "DELETE")
+        except (urllib.error.URLError, OSError) as e:
+            with lock:
+                results.append({"status": "error", "error": str(e)})
+            continue
+
+        result = {
+            "status": job["status"],
+            "error": job["error"],
+            "latency_s": time.perf_counter() - start,
+            "queue_s": job["started"] - job["submitted"] if job["started"] else None,
+            "generation_s": job["finished"] - job["started"] if job["started"] else None,
+            "triangles": job["triangles"],
+            "bytes": size,
+        }
+        with lock:
+            results.append(result)
+
+
+def percentiles(values):
+    if not values:
+        return None
+    values = sorted(values)
+    return {
+        "median": statistics.median(values),
+        "p95": values[min(len(values) - 1, int(0.95 * len(values)))],
+        "max": values[-1],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="URL of a running service, one is started if not given")
+    parser.add_argument("--jobs", type=int, default=20, help="number of jobs to submit")
+    parser.add_argument("--concurrency", type=int, default=4, help="number of jobs waiting at once")
+    parser.add_argument("--workers", type=int, default=2, help="number of workers of the started service")
+    parser.add_argument("--memory-limit", type=float, help="memory limit of the jobs of the started service in MB")
+    parser.add_argument("--dem", help="DEM to generate the models from")
+    parser.add_argument("--size", type=int, default=512, help="size of the synthetic DEM in pixels")
+    parser.add_argument("--pattern", default="coastline", help="validity pattern of the synthetic DEM")
+    parser.add_argument("--format", default="stl", help="output format of the models")
+    parser.add_argument("--merge", action="store_true", help="merge the flat areas of the models")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "stl_generator_load_test"),
+                        help="folder of the synthetic DEM and of the models of the started service")
+    parser.add_argument("--output", help="file the results are written to instead of stdout")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    dem, (width, height) = prepare_dem(args)
+
+    # Size the print bed so the DEM is meshed at its full resolution
+    # The cache would turn every job after the first one into a copy, so it's left out
+    parameters = {
+        "printHeight": 20,
+        "baseHeight": 2,
+        "bedX": width * LINE_WIDTH,
+        "bedY": height * LINE_WIDTH,
+        "lineWidth": LINE_WIDTH,
+        "outputFormat": args.format,
+        "mergeCoplanar": args.merge,
+        "useCache": False,
+    }
+
+    service = None
+    url = args.url
+    if url is None:
+        service, url = start_service(args)
+    url = url.rstrip("/")
+
+    try:
+        jobs = list(range(args.jobs))
+        results = []
+        lock = threading.Lock()
+        clients = [threading.Thread(target=run_client, args=(url, jobs, dem, parameters, results, lock))
+                   for _ in range(args.concurrency)]
+
+        start = time.perf_counter()
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+        elapsed = time.perf_counter() - start
+
+    finally:
+        if service is not None:
+            service.terminate()
+            service.wait()
+
+    done = [result for result in results if result["status"] == "done"]
+    report = {
+        "url": url,
+        "dem": dem,
+        "grid": [width, height],
+        "format": args.format,
+        "jobs": args.jobs,
+        "concurrency": args.concurrency,
+        "workers": args.workers if args.url is None else None,
+        "done": len(done),
+        "failed": len(results) - len(done),
+        "errors": sorted({result["error"] for result in results if result.get("error")}),
+        "elapsed_s": elapsed,
+        "jobs_per_minute": 60 * len(done) / elapsed if elapsed > 0 else None,
+        "latency_s": percentiles([result["latency_s"] for result in done]),
+        "queue_s": percentiles([result["queue_s"] for result in done]),
+        "generation_s": percentiles([result["generation_s"] for result in done]),
+        "triangles": done[0]["triangles"] if done else None,
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    return 0 if not report["failed"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -24,18 +24,15 @@
 
 import os.path
 
-from matplotlib.style import available
 from qgis.PyQt.QtCore import QSettings, QTranslator, QCoreApplication
 from qgis.PyQt.QtGui import QIcon
 from qgis.PyQt.QtWidgets import QAction, QMessageBox
-from qgis.core import QgsProject, QgsMapLayerProxyModel, QgsApplication
+from qgis.core import QgsProject, QgsApplication
 
 from .processing_provider.provider import Provider
 
-# Initialize Qt resources from file resources.py
-from .resources_rc import *
-# Import the code for the dialog
-from .stl_generator_dialog import STLGeneratorDialog
+# Loading the plugin only registers its menu action and Processing provider
+# The dialog (with the meshing engine and the Qt resources it pulls in) is imported the first time it's opened
 
 
 class STLGenerator:
@@ -173,7 +170,8 @@ class STLGenerator:
     def initGui(self):
         """Create the menu entries and toolbar icons inside the QGIS GUI."""
 
-        icon_path = ':/plugins/stl_generator/icon.png'
+        # Load the icon from its file so the Qt resources don't have to be loaded yet
+        icon_path = os.path.join(self.plugin_dir, 'icon.png')
         self.add_action(
             icon_path,
             text=self.tr(u'Generate an STL file'),
@@ -201,6 +199,8 @@ class STLGenerator:
         # Create the dialog with elements (after translation) and keep reference
         # Only create GUI ONCE in callback, so that it will only load when the plugin is started
         if self.first_start:
+            from .stl_generator_dialog import STLGeneratorDialog
+
             self.first_start = False
             self.dlg = STLGeneratorDialog()
 
@@ -211,8 +211,7 @@ class STLGenerator:
 
         available_raster = False
 
-        self.dlg.layers_comboBox.setFilters(
-            QgsMapLayerProxyModel.RasterLayer)
+        self.dlg.populate_layers()
 
         if layers:
             for layer in layers:
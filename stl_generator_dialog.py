@@ -22,142 +22,325 @@
  ***************************************************************************/
 """
 
-from email import message
+from collections import deque
 import os
-import sys
-from threading import Thread
-from .mesh_generator import MeshGenerator, MeshGeneratorError
+from .mesh_generator import GenerationCanceledError, MeshGenerator
+from .output_formats import OUTPUT_FORMATS
+from .preview_widget import PreviewWidget
 
-from qgis.PyQt import uic
 from qgis.PyQt import QtWidgets, QtCore
-from qgis.PyQt.QtWidgets import QMessageBox
+from qgis.core import Qgis, QgsApplication, QgsMapLayer, QgsMessageLog, QgsProject, QgsTask
 
-# This loads your .ui file so that PyQt can populate your plugin with the elements from Qt Designer
-sys.path.append(os.path.dirname(__file__))
-FORM_CLASS, _ = uic.loadUiType(
-    os.path.join(os.path.dirname(__file__), "stl_generator_dialog_base.ui")
-)
+# The user interface compiled from stl_generator_dialog_base.ui, which saves parsing the .ui file
+# every time the plugin is loaded. Recompile it whenever the .ui file is changed:
+#   pyuic5 --from-imports -o stl_generator_dialog_base_ui.py stl_generator_dialog_base.ui
+from .stl_generator_dialog_base_ui import Ui_StlGeneratorDialogBase
 
 
-class STLGeneratorDialog(QtWidgets.QDialog, FORM_CLASS):
-    start_backend = QtCore.pyqtSignal(object, str)
+class STLGeneratorDialog(QtWidgets.QDialog, Ui_StlGeneratorDialogBase):
+    # Columns of the jobs table
+    LAYER_COLUMN = 0
+    STATUS_COLUMN = 1
+    PROGRESS_COLUMN = 2
+
+    # Number of cells along the longer side of the print bed in the preview
+    PREVIEW_CELLS = 96
+    # Time (in ms) to wait for the settings to stop changing before the preview is updated
+    PREVIEW_DELAY = 400
 
     def __init__(self, parent=None):
         """Constructor."""
         super(STLGeneratorDialog, self).__init__(parent)
-        # Set up the user interface from Designer through FORM_CLASS.
+        # Set up the user interface from Designer through Ui_StlGeneratorDialogBase.
         # After self.setupUi() you can access any designer object by doing
         # self.<objectname>, and you can use autoconnect slots - see
         # http://qt-project.org/doc/qt-4.8/designer-using-a-ui-file.html
         # #widgets-and-dialogs-with-auto-connect
         self.setupUi(self)
-        self.start_thread()
 
         self.saveLocation_input.setFilePath(os.path.expanduser("~"))
 
-        # Indicates if a background process is already running or not
-        self.running = False
+        # List the file formats the model can be saved as
+        for format_id, output_format in OUTPUT_FORMATS.items():
+            self.outputFormat_comboBox.addItem(output_format.name, format_id)
+
+        # Jobs waiting for a free slot, jobs handed over to the task manager and
+        # all the jobs of the current batch (used for the overall progress)
+        self.queuedJobs = deque()
+        self.runningJobs = []
+        self.batchJobs = []
+
+        # Low resolution preview of the model. It's updated once the settings stop changing for a moment
+        self.preview_view = PreviewWidget(self)
+        self.preview_layout.addWidget(self.preview_view)
+        self.previewTimer = QtCore.QTimer(self)
+        self.previewTimer.setSingleShot(True)
+        self.previewTimer.setInterval(self.PREVIEW_DELAY)
+        # The preview is meshed by a background task, only the latest one gets to show its mesh
+        self.previewTask = None
+
+        self.connect_signals()
 
     # Connects signals and slots between UI elements and background process
     def connect_signals(self):
         # UI related signals
         self.generateSTL_button.clicked.connect(self.begin_generating_STL)
+        self.cancel_button.clicked.connect(self.cancel_jobs)
         self.exit_button.clicked.connect(self.close_window)
+        self.concurrency_input.valueChanged.connect(self.start_queued_jobs)
 
-        # Background process signals
-        self.worker.progress_changed.connect(self.progress.setValue)
-        self.worker.progress_text.connect(self.progress.setFormat)
-        self.worker.finished.connect(self.finished_generating_STL)
-        self.worker.handle_generator_error.connect(self.handle_generator_error)
+        # Preview related signals
+        self.previewTimer.timeout.connect(self.update_preview)
+        self.preview_checkBox.toggled.connect(self.schedule_preview)
+        self.layers_comboBox.checkedItemsChanged.connect(self.schedule_preview)
+        for setting in (self.printHeight_input, self.baseHeight_input, self.bedWidth_input,
+                        self.bedLength_input, self.lineWidth_input):
+            setting.valueChanged.connect(self.schedule_preview)
 
-        self.start_backend.connect(self.worker.generate_STL)
+    # Lists the raster layers of the project. The visible ones are checked by default
+    def populate_layers(self):
+        self.layers_comboBox.clear()
 
-        # self.worker_thread.finished.connect(self.worker_thread.deleteLater)
+        layer_tree = QgsProject.instance().layerTreeRoot()
+        for layer in QgsProject.instance().mapLayers().values():
+            if layer.type() != QgsMapLayer.RasterLayer:
+                continue
 
-    # Starts thread for background process
-    def start_thread(self):
-        self.worker = WorkerObject()
-        self.worker_thread = QtCore.QThread()
-        self.worker.moveToThread(self.worker_thread)
-        self.worker_thread.start()
+            node = layer_tree.findLayer(layer.id())
+            visible = node is not None and node.isVisible()
+            self.layers_comboBox.addItemWithCheckState(
+                layer.name(), QtCore.Qt.Checked if visible else QtCore.Qt.Unchecked, layer.id()
+            )
 
-        self.connect_signals()
+        self.schedule_preview()
+
+    # Returns the parameters for generating the model of the layer with the current settings
+    def model_parameters(self, layer, output_format):
+        return {
+            "printHeight": self.printHeight_input.value(),
+            "baseHeight": self.baseHeight_input.value(),
+            "saveLocation": os.path.join(
+                self.saveLocation_input.filePath(),
+                layer.name() + OUTPUT_FORMATS[output_format].extension,
+            ),
+            "outputFormat": output_format,
+            "bedX": self.bedWidth_input.value(),
+            "bedY": self.bedLength_input.value(),
+            "lineWidth": self.lineWidth_input.value(),
+        }
+
+    # (Re)starts the countdown to the next preview update
+    def schedule_preview(self):
+        if self.preview_checkBox.isChecked():
+            self.previewTimer.start()
+        else:
+            self.previewTimer.stop()
+            self.cancel_preview()
+            self.preview_view.set_message(self.tr("The preview is turned off"))
+
+    # Stops the preview that's being meshed, its mesh is no longer needed
+    def cancel_preview(self):
+        if self.previewTask is not None:
+            self.previewTask.cancel()
+            self.previewTask = None
+
+    # Starts meshing a coarse version of the first checked layer in the background
+    # Nothing is written to the disk, the full resolution model is only generated once it's confirmed
+    def update_preview(self):
+        self.cancel_preview()
 
-    # Performs setup routine before starting to generate STL in background thread
+        layer_ids = self.layers_comboBox.checkedItemsData()
+        layer = QgsProject.instance().mapLayer(layer_ids[0]) if layer_ids else None
+        if layer is None:
+            self.preview_view.set_message(self.tr("Check a layer to preview it"))
+            return
+
+        task = PreviewTask(
+            layer.name(),
+            self.model_parameters(layer, self.outputFormat_comboBox.currentData()),
+            layer.source(),
+            self.PREVIEW_CELLS,
+        )
+        task.taskCompleted.connect(lambda task=task: self.preview_finished(task))
+        task.taskTerminated.connect(lambda task=task: self.preview_finished(task))
+
+        # Keep a reference to the task, the task manager only holds on to the C++ object
+        self.previewTask = task
+        self.preview_view.set_message(self.tr("Updating the preview of {}...").format(layer.name()))
+        QgsApplication.taskManager().addTask(task)
+
+    # Shows the mesh of the preview task, unless a newer preview replaced it in the meantime
+    def preview_finished(self, task):
+        if task is not self.previewTask:
+            return
+        self.previewTask = None
+
+        if task.status() == QgsTask.Complete:
+            self.preview_view.set_mesh(task.vertices, task.faces)
+        elif task.error is not None:
+            message = getattr(task.error, "message", str(task.error))
+            self.preview_view.set_message(self.tr("Couldn't preview {}: {}").format(task.layerName, message))
+
+    # Queues a job for every checked layer
     def begin_generating_STL(self):
+        # Start a new batch once all the jobs of the previous one are done
+        if not self.queuedJobs and not self.runningJobs:
+            self.batchJobs = []
 
-        if not self.running:
-            self.progress.setValue(0)
-            self.progress.setFormat("%p% Beginning to Generate STL...")
+        output_format = self.outputFormat_comboBox.currentData()
+
+        for layer_id in self.layers_comboBox.checkedItemsData():
+            layer = QgsProject.instance().mapLayer(layer_id)
+            if layer is None:
+                continue
 
             # Set the parameters for generating the STL file
-            self.running = True
-            self.start_backend.emit(
-                {
-                    "printHeight": self.printHeight_input.value(),
-                    "baseHeight": self.baseHeight_input.value(),
-                    "saveLocation": os.path.join(
-                        self.saveLocation_input.filePath(),
-                        self.layers_comboBox.currentLayer().name() + ".stl",
-                    ),
-                    "bedX": self.bedWidth_input.value(),
-                    "bedY": self.bedLength_input.value(),
-                    "lineWidth": self.lineWidth_input.value(),
-                },
-                self.layers_comboBox.currentLayer().source(),
+            parameters = self.model_parameters(layer, output_format)
+
+            task = STLGeneratorTask(layer.name(), parameters, layer.source())
+            task.row = self.add_job_row(layer.name())
+
+            self.queuedJobs.append(task)
+            self.batchJobs.append(task)
+
+        self.update_overall_progress()
+        self.start_queued_jobs()
+
+    # Adds a row for the job to the jobs table and returns its index
+    def add_job_row(self, layer_name):
+        row = self.jobs_table.rowCount()
+        self.jobs_table.insertRow(row)
+        self.jobs_table.setItem(row, self.LAYER_COLUMN, QtWidgets.QTableWidgetItem(layer_name))
+        self.jobs_table.setItem(row, self.STATUS_COLUMN, QtWidgets.QTableWidgetItem(self.tr("Queued")))
+
+        progress = QtWidgets.QProgressBar()
+        progress.setValue(0)
+        self.jobs_table.setCellWidget(row, self.PROGRESS_COLUMN, progress)
+
+        return row
+
+    def set_job_status(self, task, status, tooltip=""):
+        item = self.jobs_table.item(task.row, self.STATUS_COLUMN)
+        item.setText(status)
+        item.setToolTip(tooltip)
+
+    # Hands the queued jobs over to the task manager until the concurrency limit is reached
+    def start_queued_jobs(self):
+        while self.queuedJobs and len(self.runningJobs) < self.concurrency_input.value():
+            task = self.queuedJobs.popleft()
+
+            task.progressChanged.connect(lambda value, task=task: self.job_progress_changed(task, value))
+            task.taskCompleted.connect(lambda task=task: self.job_finished(task))
+            task.taskTerminated.connect(lambda task=task: self.job_finished(task))
+
+            # Keep a reference to the task, the task manager only holds on to the C++ object
+            self.runningJobs.append(task)
+            self.set_job_status(task, self.tr("Running"))
+            QgsApplication.taskManager().addTask(task)
+
+    # Drops the queued jobs and asks the running ones to stop. Their partial files are removed
+    def cancel_jobs(self):
+        while self.queuedJobs:
+            self.set_job_status(self.queuedJobs.popleft(), self.tr("Canceled"))
+
+        for task in self.runningJobs:
+            self.set_job_status(task, self.tr("Canceling..."))
+            task.cancel()
+
+        self.update_overall_progress()
+
+    def job_progress_changed(self, task, value):
+        self.jobs_table.cellWidget(task.row, self.PROGRESS_COLUMN).setValue(int(value))
+        self.update_overall_progress()
+
+    def job_finished(self, task):
+        if task in self.runningJobs:
+            self.runningJobs.remove(task)
+
+        if task.status() == QgsTask.Complete:
+            self.jobs_table.cellWidget(task.row, self.PROGRESS_COLUMN).setValue(100)
+            self.set_job_status(task, self.tr("Finished"), task.parameters["saveLocation"])
+        elif task.error is not None:
+            message = getattr(task.error, "message", str(task.error))
+            self.set_job_status(task, self.tr("Failed"), message)
+            QgsMessageLog.logMessage(
+                f"Failed to generate the STL of {task.layerName}: {message}", "STL_Generator", level=Qgis.Critical
             )
+        else:
+            self.set_job_status(task, self.tr("Canceled"))
 
-    def finished_generating_STL(self):
-        self.running = False
+        self.update_overall_progress()
+        self.start_queued_jobs()
 
-    def stop_thread(self):
-        self.finished_generating_STL()
+    # Shows the combined progress of all the jobs of the current batch
+    def update_overall_progress(self):
+        if not self.batchJobs:
+            self.progress.setValue(0)
+            return
 
-        if self.worker_thread.isRunning():
-            self.worker_thread.exit()
-            self.worker_thread.wait()
+        finished = [task for task in self.batchJobs if task not in self.queuedJobs and task not in self.runningJobs]
+        total = sum(100 if task in finished else task.progress() for task in self.batchJobs)
 
-    @QtCore.pyqtSlot(object)
-    def handle_generator_error(self, error: MeshGeneratorError):
-        QMessageBox.critical(self, self.tr("Error"), self.tr(error.message))
+        self.progress.setValue(int(total / len(self.batchJobs)))
+        self.progress.setFormat(f"%p% {len(finished)} of {len(self.batchJobs)} jobs done")
 
     # Closes dialog window
+    # The jobs that were already started keep running in the QGIS task manager, only the preview is stopped
     def close_window(self):
-        self.stop_thread()
+        self.previewTimer.stop()
+        self.cancel_preview()
         self.close()
 
 
-# Worker that contains all the work done in the background thread
-class WorkerObject(QtCore.QObject):
-    progress_changed = QtCore.pyqtSignal(int)
-    progress_text = QtCore.pyqtSignal(str)
-    handle_generator_error = QtCore.pyqtSignal(object)
-    finished = QtCore.pyqtSignal()
+# Meshes the low resolution preview of a layer as a background task, so large DEMs don't block the dialog
+class PreviewTask(QgsTask):
+    def __init__(self, layer_name, parameters, path, max_cells):
+        super().__init__(f"Previewing {layer_name}", QgsTask.CanCancel)
+        self.layerName = layer_name
+        self.parameters = parameters
+        self.path = path
+        self.maxCells = max_cells
+        self.vertices = None
+        self.faces = None
+        self.error = None
 
-    def __init__(self) -> None:
-        super().__init__()
-        self.mesh_generator = MeshGenerator()
-        self.running = False
-
-    # Generates STL file on button press
-    @QtCore.pyqtSlot(object, str)
-    def generate_STL(self, parameters, path):
+    def run(self):
         try:
-            self.progress_changed.emit(10)
-            self.progress_text.emit("%p% Reading Raster Data...")
-            self.mesh_generator.generate_height_array(
-                parameters, source_dem=path
-            )
+            mesh_generator = MeshGenerator()
+            mesh_generator.set_cancel_callback(self.isCanceled)
+            self.vertices, self.faces = mesh_generator.generate_preview(self.parameters, self.path, self.maxCells)
+        except GenerationCanceledError:
+            return False
+        except Exception as e:
+            # Any error (e.g. a bed size of zero while it's being typed) is shown in place of the preview
+            self.error = e
+            return False
+
+        return True
+
 
-            self.progress_changed.emit(60)
-            self.progress_text.emit("%p% Putting Together STL File...")
-            self.mesh_generator.manually_generate_stl()
+# Generates the STL of a single layer as a background task of the QGIS task manager
+class STLGeneratorTask(QgsTask):
+    def __init__(self, layer_name, parameters, path):
+        super().__init__(f"Generating an STL for {layer_name}", QgsTask.CanCancel)
+        self.layerName = layer_name
+        self.parameters = parameters
+        self.path = path
+        self.error = None
+        self.row = None
+
+    def run(self):
+        try:
+            mesh_generator = MeshGenerator()
+            mesh_generator.set_cancel_callback(self.isCanceled)
+            mesh_generator.set_progress_callback(lambda value, stage: self.setProgress(value * 100))
 
-            self.progress_changed.emit(100)
-            self.progress_text.emit("%p% Finished Generating STL File!")
+            mesh_generator.generate_height_array(self.parameters, source_dem=self.path)
+            mesh_generator.manually_generate_stl()
+        except GenerationCanceledError:
+            return False
         except Exception as e:
-            self.handle_generator_error.emit(e)
-            self.progress_text.emit("Failed to Generate STL : " + str(e))
-            self.finished.emit()
+            self.error = e
+            return False
 
-        self.finished.emit()
+        return True
@@ -1,207 +1,202 @@
 # -*- coding: utf-8 -*-
 
-################################################################################
-## Form generated from reading UI file 'stl_generator_dialog_base.ui'
-##
-## Created by: Qt User Interface Compiler version 5.15.2
-##
-## WARNING! All changes made in this file will be lost when recompiling UI file!
-################################################################################
+# Form implementation generated from reading ui file 'stl_generator_dialog_base.ui'
+#
+# Created by: PyQt5 UI code generator 5.15.2
+#
+# WARNING: Any manual changes made to this file will be lost when pyuic5 is
+# run again.  Do not edit this file unless you know what you are doing.
 
-from PySide2.QtCore import *
-from PySide2.QtGui import *
-from PySide2.QtWidgets import *
 
-from qgsfilewidget import QgsFileWidget
-from qgsmaplayercombobox import QgsMapLayerComboBox
+from qgis.PyQt import QtCore, QtGui, QtWidgets
 
-import resources_rc
 
 class Ui_StlGeneratorDialogBase(object):
     def setupUi(self, StlGeneratorDialogBase):
-        if not StlGeneratorDialogBase.objectName():
-            StlGeneratorDialogBase.setObjectName(u"StlGeneratorDialogBase")
-        StlGeneratorDialogBase.resize(377, 480)
-        icon = QIcon()
-        icon.addFile(u":/plugins/stl_generator/icon.png", QSize(), QIcon.Normal, QIcon.Off)
+        StlGeneratorDialogBase.setObjectName("StlGeneratorDialogBase")
+        StlGeneratorDialogBase.resize(377, 900)
+        icon = QtGui.QIcon()
+        icon.addFile(":/plugins/stl_generator/icon.png", QtCore.QSize(), QtGui.QIcon.Normal, QtGui.QIcon.Off)
         StlGeneratorDialogBase.setWindowIcon(icon)
-        self.verticalLayout_3 = QVBoxLayout(StlGeneratorDialogBase)
-        self.verticalLayout_3.setObjectName(u"verticalLayout_3")
-        self.groupBox = QGroupBox(StlGeneratorDialogBase)
-        self.groupBox.setObjectName(u"groupBox")
+        self.verticalLayout_3 = QtWidgets.QVBoxLayout(StlGeneratorDialogBase)
+        self.verticalLayout_3.setObjectName("verticalLayout_3")
+        self.groupBox = QtWidgets.QGroupBox(StlGeneratorDialogBase)
+        self.groupBox.setObjectName("groupBox")
         self.groupBox.setFlat(False)
-        self.verticalLayout = QVBoxLayout(self.groupBox)
-        self.verticalLayout.setObjectName(u"verticalLayout")
-        self.layers_comboBox = QgsMapLayerComboBox(self.groupBox)
-        self.layers_comboBox.setObjectName(u"layers_comboBox")
-        self.layers_comboBox.setShowCrs(True)
-
+        self.verticalLayout = QtWidgets.QVBoxLayout(self.groupBox)
+        self.verticalLayout.setObjectName("verticalLayout")
+        self.layers_comboBox = QgsCheckableComboBox(self.groupBox)
+        self.layers_comboBox.setObjectName("layers_comboBox")
         self.verticalLayout.addWidget(self.layers_comboBox)
-
-
         self.verticalLayout_3.addWidget(self.groupBox)
-
-        self.groupBox_2 = QGroupBox(StlGeneratorDialogBase)
-        self.groupBox_2.setObjectName(u"groupBox_2")
-        self.verticalLayout_2 = QVBoxLayout(self.groupBox_2)
-        self.verticalLayout_2.setObjectName(u"verticalLayout_2")
-        self.formLayout = QFormLayout()
-        self.formLayout.setObjectName(u"formLayout")
-        self.formLayout.setSizeConstraint(QLayout.SetFixedSize)
-        self.formLayout.setFieldGrowthPolicy(QFormLayout.AllNonFixedFieldsGrow)
-        self.verticalSpacer = QSpacerItem(20, 40, QSizePolicy.Minimum, QSizePolicy.Expanding)
-
-        self.formLayout.setItem(0, QFormLayout.LabelRole, self.verticalSpacer)
-
-        self.printHeight_input = QDoubleSpinBox(self.groupBox_2)
-        self.printHeight_input.setObjectName(u"printHeight_input")
+        self.groupBox_2 = QtWidgets.QGroupBox(StlGeneratorDialogBase)
+        self.groupBox_2.setObjectName("groupBox_2")
+        self.verticalLayout_2 = QtWidgets.QVBoxLayout(self.groupBox_2)
+        self.verticalLayout_2.setObjectName("verticalLayout_2")
+        self.formLayout = QtWidgets.QFormLayout()
+        self.formLayout.setObjectName("formLayout")
+        self.formLayout.setSizeConstraint(QtWidgets.QLayout.SetFixedSize)
+        self.formLayout.setFieldGrowthPolicy(QtWidgets.QFormLayout.AllNonFixedFieldsGrow)
+        self.verticalSpacer = QtWidgets.QSpacerItem(20, 40, QtWidgets.QSizePolicy.Minimum, QtWidgets.QSizePolicy.Expanding)
+        self.formLayout.setItem(0, QtWidgets.QFormLayout.LabelRole, self.verticalSpacer)
+        self.printHeight_input = QtWidgets.QDoubleSpinBox(self.groupBox_2)
+        self.printHeight_input.setObjectName("printHeight_input")
         self.printHeight_input.setValue(10.000000000000000)
-
-        self.formLayout.setWidget(2, QFormLayout.LabelRole, self.printHeight_input)
-
-        self.printHeight_label = QLabel(self.groupBox_2)
-        self.printHeight_label.setObjectName(u"printHeight_label")
-
-        self.formLayout.setWidget(2, QFormLayout.FieldRole, self.printHeight_label)
-
-        self.baseHeight_input = QDoubleSpinBox(self.groupBox_2)
-        self.baseHeight_input.setObjectName(u"baseHeight_input")
+        self.formLayout.setWidget(2, QtWidgets.QFormLayout.LabelRole, self.printHeight_input)
+        self.printHeight_label = QtWidgets.QLabel(self.groupBox_2)
+        self.printHeight_label.setObjectName("printHeight_label")
+        self.formLayout.setWidget(2, QtWidgets.QFormLayout.FieldRole, self.printHeight_label)
+        self.baseHeight_input = QtWidgets.QDoubleSpinBox(self.groupBox_2)
+        self.baseHeight_input.setObjectName("baseHeight_input")
         self.baseHeight_input.setValue(10.000000000000000)
-
-        self.formLayout.setWidget(3, QFormLayout.LabelRole, self.baseHeight_input)
-
-        self.base_label = QLabel(self.groupBox_2)
-        self.base_label.setObjectName(u"base_label")
-
-        self.formLayout.setWidget(3, QFormLayout.FieldRole, self.base_label)
-
-        self.verticalSpacer_2 = QSpacerItem(20, 40, QSizePolicy.Minimum, QSizePolicy.Expanding)
-
-        self.formLayout.setItem(4, QFormLayout.LabelRole, self.verticalSpacer_2)
-
-
+        self.formLayout.setWidget(3, QtWidgets.QFormLayout.LabelRole, self.baseHeight_input)
+        self.base_label = QtWidgets.QLabel(self.groupBox_2)
+        self.base_label.setObjectName("base_label")
+        self.formLayout.setWidget(3, QtWidgets.QFormLayout.FieldRole, self.base_label)
+        self.verticalSpacer_2 = QtWidgets.QSpacerItem(20, 40, QtWidgets.QSizePolicy.Minimum, QtWidgets.QSizePolicy.Expanding)
+        self.formLayout.setItem(4, QtWidgets.QFormLayout.LabelRole, self.verticalSpacer_2)
         self.verticalLayout_2.addLayout(self.formLayout)
-
-
         self.verticalLayout_3.addWidget(self.groupBox_2)
-
-        self.groupBox_3 = QGroupBox(StlGeneratorDialogBase)
-        self.groupBox_3.setObjectName(u"groupBox_3")
-        self.verticalLayout_4 = QVBoxLayout(self.groupBox_3)
-        self.verticalLayout_4.setObjectName(u"verticalLayout_4")
-        self.formLayout_2 = QFormLayout()
-        self.formLayout_2.setObjectName(u"formLayout_2")
-        self.formLayout_2.setSizeConstraint(QLayout.SetFixedSize)
-        self.formLayout_2.setFieldGrowthPolicy(QFormLayout.AllNonFixedFieldsGrow)
-        self.verticalSpacer_5 = QSpacerItem(20, 40, QSizePolicy.Minimum, QSizePolicy.Expanding)
-
-        self.formLayout_2.setItem(0, QFormLayout.LabelRole, self.verticalSpacer_5)
-
-        self.label_6 = QLabel(self.groupBox_3)
-        self.label_6.setObjectName(u"label_6")
-
-        self.formLayout_2.setWidget(1, QFormLayout.FieldRole, self.label_6)
-
-        self.label_7 = QLabel(self.groupBox_3)
-        self.label_7.setObjectName(u"label_7")
-
-        self.formLayout_2.setWidget(2, QFormLayout.FieldRole, self.label_7)
-
-        self.label_8 = QLabel(self.groupBox_3)
-        self.label_8.setObjectName(u"label_8")
-
-        self.formLayout_2.setWidget(3, QFormLayout.FieldRole, self.label_8)
-
-        self.verticalSpacer_4 = QSpacerItem(20, 40, QSizePolicy.Minimum, QSizePolicy.Expanding)
-
-        self.formLayout_2.setItem(4, QFormLayout.LabelRole, self.verticalSpacer_4)
-
-        self.bedWidth_input = QDoubleSpinBox(self.groupBox_3)
-        self.bedWidth_input.setObjectName(u"bedWidth_input")
+        self.groupBox_3 = QtWidgets.QGroupBox(StlGeneratorDialogBase)
+        self.groupBox_3.setObjectName("groupBox_3")
+        self.verticalLayout_4 = QtWidgets.QVBoxLayout(self.groupBox_3)
+        self.verticalLayout_4.setObjectName("verticalLayout_4")
+        self.formLayout_2 = QtWidgets.QFormLayout()
+        self.formLayout_2.setObjectName("formLayout_2")
+        self.formLayout_2.setSizeConstraint(QtWidgets.QLayout.SetFixedSize)
+        self.formLayout_2.setFieldGrowthPolicy(QtWidgets.QFormLayout.AllNonFixedFieldsGrow)
+        self.verticalSpacer_5 = QtWidgets.QSpacerItem(20, 40, QtWidgets.QSizePolicy.Minimum, QtWidgets.QSizePolicy.Expanding)
+        self.formLayout_2.setItem(0, QtWidgets.QFormLayout.LabelRole, self.verticalSpacer_5)
+        self.label_6 = QtWidgets.QLabel(self.groupBox_3)
+        self.label_6.setObjectName("label_6")
+        self.formLayout_2.setWidget(1, QtWidgets.QFormLayout.FieldRole, self.label_6)
+        self.label_7 = QtWidgets.QLabel(self.groupBox_3)
+        self.label_7.setObjectName("label_7")
+        self.formLayout_2.setWidget(2, QtWidgets.QFormLayout.FieldRole, self.label_7)
+        self.label_8 = QtWidgets.QLabel(self.groupBox_3)
+        self.label_8.setObjectName("label_8")
+        self.formLayout_2.setWidget(3, QtWidgets.QFormLayout.FieldRole, self.label_8)
+        self.verticalSpacer_4 = QtWidgets.QSpacerItem(20, 40, QtWidgets.QSizePolicy.Minimum, QtWidgets.QSizePolicy.Expanding)
+        self.formLayout_2.setItem(4, QtWidgets.QFormLayout.LabelRole, self.verticalSpacer_4)
+        self.bedWidth_input = QtWidgets.QDoubleSpinBox(self.groupBox_3)
+        self.bedWidth_input.setObjectName("bedWidth_input")
         self.bedWidth_input.setMaximum(10000.000000000000000)
         self.bedWidth_input.setValue(200.000000000000000)
-
-        self.formLayout_2.setWidget(1, QFormLayout.LabelRole, self.bedWidth_input)
-
-        self.bedLength_input = QDoubleSpinBox(self.groupBox_3)
-        self.bedLength_input.setObjectName(u"bedLength_input")
+        self.formLayout_2.setWidget(1, QtWidgets.QFormLayout.LabelRole, self.bedWidth_input)
+        self.bedLength_input = QtWidgets.QDoubleSpinBox(self.groupBox_3)
+        self.bedLength_input.setObjectName("bedLength_input")
         self.bedLength_input.setMaximum(10000.000000000000000)
         self.bedLength_input.setValue(200.000000000000000)
-
-        self.formLayout_2.setWidget(2, QFormLayout.LabelRole, self.bedLength_input)
-
-        self.lineWidth_input = QDoubleSpinBox(self.groupBox_3)
-        self.lineWidth_input.setObjectName(u"lineWidth_input")
+        self.formLayout_2.setWidget(2, QtWidgets.QFormLayout.LabelRole, self.bedLength_input)
+        self.lineWidth_input = QtWidgets.QDoubleSpinBox(self.groupBox_3)
+        self.lineWidth_input.setObjectName("lineWidth_input")
         self.lineWidth_input.setSingleStep(0.100000000000000)
         self.lineWidth_input.setValue(0.400000000000000)
-
-        self.formLayout_2.setWidget(3, QFormLayout.LabelRole, self.lineWidth_input)
-
-
+        self.formLayout_2.setWidget(3, QtWidgets.QFormLayout.LabelRole, self.lineWidth_input)
         self.verticalLayout_4.addLayout(self.formLayout_2)
-
-
         self.verticalLayout_3.addWidget(self.groupBox_3)
-
-        self.groupBox_4 = QGroupBox(StlGeneratorDialogBase)
-        self.groupBox_4.setObjectName(u"groupBox_4")
-        self.verticalLayout_5 = QVBoxLayout(self.groupBox_4)
-        self.verticalLayout_5.setObjectName(u"verticalLayout_5")
+        self.groupBox_4 = QtWidgets.QGroupBox(StlGeneratorDialogBase)
+        self.groupBox_4.setObjectName("groupBox_4")
+        self.verticalLayout_5 = QtWidgets.QVBoxLayout(self.groupBox_4)
+        self.verticalLayout_5.setObjectName("verticalLayout_5")
         self.saveLocation_input = QgsFileWidget(self.groupBox_4)
-        self.saveLocation_input.setObjectName(u"saveLocation_input")
+        self.saveLocation_input.setObjectName("saveLocation_input")
         self.saveLocation_input.setStorageMode(QgsFileWidget.GetDirectory)
-        self.saveLocation_input.setOptions(QFileDialog.ShowDirsOnly)
-
+        self.saveLocation_input.setOptions(QtWidgets.QFileDialog.ShowDirsOnly)
         self.verticalLayout_5.addWidget(self.saveLocation_input)
-
-
+        self.outputFormat_comboBox = QtWidgets.QComboBox(self.groupBox_4)
+        self.outputFormat_comboBox.setObjectName("outputFormat_comboBox")
+        self.verticalLayout_5.addWidget(self.outputFormat_comboBox)
         self.verticalLayout_3.addWidget(self.groupBox_4)
-
-        self.progress = QProgressBar(StlGeneratorDialogBase)
-        self.progress.setObjectName(u"progress")
+        self.groupBox_6 = QtWidgets.QGroupBox(StlGeneratorDialogBase)
+        self.groupBox_6.setObjectName("groupBox_6")
+        self.preview_layout = QtWidgets.QVBoxLayout(self.groupBox_6)
+        self.preview_layout.setObjectName("preview_layout")
+        self.preview_checkBox = QtWidgets.QCheckBox(self.groupBox_6)
+        self.preview_checkBox.setObjectName("preview_checkBox")
+        self.preview_checkBox.setChecked(True)
+        self.preview_layout.addWidget(self.preview_checkBox)
+        self.verticalLayout_3.addWidget(self.groupBox_6)
+        self.groupBox_5 = QtWidgets.QGroupBox(StlGeneratorDialogBase)
+        self.groupBox_5.setObjectName("groupBox_5")
+        self.verticalLayout_6 = QtWidgets.QVBoxLayout(self.groupBox_5)
+        self.verticalLayout_6.setObjectName("verticalLayout_6")
+        self.formLayout_3 = QtWidgets.QFormLayout()
+        self.formLayout_3.setObjectName("formLayout_3")
+        self.concurrency_label = QtWidgets.QLabel(self.groupBox_5)
+        self.concurrency_label.setObjectName("concurrency_label")
+        self.formLayout_3.setWidget(0, QtWidgets.QFormLayout.LabelRole, self.concurrency_label)
+        self.concurrency_input = QtWidgets.QSpinBox(self.groupBox_5)
+        self.concurrency_input.setObjectName("concurrency_input")
+        self.concurrency_input.setMinimum(1)
+        self.concurrency_input.setMaximum(16)
+        self.concurrency_input.setValue(2)
+        self.formLayout_3.setWidget(0, QtWidgets.QFormLayout.FieldRole, self.concurrency_input)
+        self.verticalLayout_6.addLayout(self.formLayout_3)
+        self.jobs_table = QtWidgets.QTableWidget(self.groupBox_5)
+        self.jobs_table.setColumnCount(3)
+        self.jobs_table.setRowCount(0)
+        item = QtWidgets.QTableWidgetItem()
+        self.jobs_table.setHorizontalHeaderItem(0, item)
+        item = QtWidgets.QTableWidgetItem()
+        self.jobs_table.setHorizontalHeaderItem(1, item)
+        item = QtWidgets.QTableWidgetItem()
+        self.jobs_table.setHorizontalHeaderItem(2, item)
+        self.jobs_table.setObjectName("jobs_table")
+        self.jobs_table.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.jobs_table.setSelectionMode(QtWidgets.QAbstractItemView.NoSelection)
+        self.jobs_table.horizontalHeader().setStretchLastSection(True)
+        self.jobs_table.verticalHeader().setVisible(False)
+        self.verticalLayout_6.addWidget(self.jobs_table)
+        self.verticalLayout_3.addWidget(self.groupBox_5)
+        self.progress = QtWidgets.QProgressBar(StlGeneratorDialogBase)
+        self.progress.setObjectName("progress")
         self.progress.setValue(0)
-
         self.verticalLayout_3.addWidget(self.progress)
-
-        self.horizontalLayout = QHBoxLayout()
-        self.horizontalLayout.setObjectName(u"horizontalLayout")
-        self.generateSTL_button = QPushButton(StlGeneratorDialogBase)
-        self.generateSTL_button.setObjectName(u"generateSTL_button")
-
+        self.horizontalLayout = QtWidgets.QHBoxLayout()
+        self.horizontalLayout.setObjectName("horizontalLayout")
+        self.generateSTL_button = QtWidgets.QPushButton(StlGeneratorDialogBase)
+        self.generateSTL_button.setObjectName("generateSTL_button")
         self.horizontalLayout.addWidget(self.generateSTL_button)
-
-        self.exit_button = QPushButton(StlGeneratorDialogBase)
-        self.exit_button.setObjectName(u"exit_button")
+        self.cancel_button = QtWidgets.QPushButton(StlGeneratorDialogBase)
+        self.cancel_button.setObjectName("cancel_button")
+        self.horizontalLayout.addWidget(self.cancel_button)
+        self.exit_button = QtWidgets.QPushButton(StlGeneratorDialogBase)
+        self.exit_button.setObjectName("exit_button")
         self.exit_button.setFlat(False)
-
         self.horizontalLayout.addWidget(self.exit_button)
-
         self.horizontalLayout.setStretch(0, 12)
-        self.horizontalLayout.setStretch(1, 2)
-
+        self.horizontalLayout.setStretch(1, 4)
+        self.horizontalLayout.setStretch(2, 2)
         self.verticalLayout_3.addLayout(self.horizontalLayout)
-
-
         self.retranslateUi(StlGeneratorDialogBase)
-
         self.exit_button.setDefault(False)
-
-
-        QMetaObject.connectSlotsByName(StlGeneratorDialogBase)
-    # setupUi
+        QtCore.QMetaObject.connectSlotsByName(StlGeneratorDialogBase)
 
     def retranslateUi(self, StlGeneratorDialogBase):
-        StlGeneratorDialogBase.setWindowTitle(QCoreApplication.translate("StlGeneratorDialogBase", u"STLGenerator", None))
-        self.groupBox.setTitle(QCoreApplication.translate("StlGeneratorDialogBase", u"Layer to Print", None))
-        self.groupBox_2.setTitle(QCoreApplication.translate("StlGeneratorDialogBase", u"Model Settings", None))
-        self.printHeight_label.setText(QCoreApplication.translate("StlGeneratorDialogBase", u"Model Height (mm)", None))
-        self.base_label.setText(QCoreApplication.translate("StlGeneratorDialogBase", u"Base Thickness (mm)", None))
-        self.groupBox_3.setTitle(QCoreApplication.translate("StlGeneratorDialogBase", u"Printer Settings", None))
-        self.label_6.setText(QCoreApplication.translate("StlGeneratorDialogBase", u"Bed Width (mm)", None))
-        self.label_7.setText(QCoreApplication.translate("StlGeneratorDialogBase", u"Bed Length (mm)", None))
-        self.label_8.setText(QCoreApplication.translate("StlGeneratorDialogBase", u"Line Width (mm)", None))
-        self.groupBox_4.setTitle(QCoreApplication.translate("StlGeneratorDialogBase", u"File Location", None))
-        self.generateSTL_button.setText(QCoreApplication.translate("StlGeneratorDialogBase", u"Generate STL", None))
-        self.exit_button.setText(QCoreApplication.translate("StlGeneratorDialogBase", u"Exit", None))
-    # retranslateUi
-
+        _translate = QtCore.QCoreApplication.translate
+        StlGeneratorDialogBase.setWindowTitle(_translate("StlGeneratorDialogBase", "STLGenerator"))
+        self.groupBox.setTitle(_translate("StlGeneratorDialogBase", "Layers to Print"))
+        self.groupBox_2.setTitle(_translate("StlGeneratorDialogBase", "Model Settings"))
+        self.printHeight_label.setText(_translate("StlGeneratorDialogBase", "Model Height (mm)"))
+        self.base_label.setText(_translate("StlGeneratorDialogBase", "Base Thickness (mm)"))
+        self.groupBox_3.setTitle(_translate("StlGeneratorDialogBase", "Printer Settings"))
+        self.label_6.setText(_translate("StlGeneratorDialogBase", "Bed Width (mm)"))
+        self.label_7.setText(_translate("StlGeneratorDialogBase", "Bed Length (mm)"))
+        self.label_8.setText(_translate("StlGeneratorDialogBase", "Line Width (mm)"))
+        self.groupBox_4.setTitle(_translate("StlGeneratorDialogBase", "File Location"))
+        self.groupBox_6.setTitle(_translate("StlGeneratorDialogBase", "Preview"))
+        self.preview_checkBox.setText(_translate("StlGeneratorDialogBase", "Show a low resolution preview of the first layer"))
+        self.groupBox_5.setTitle(_translate("StlGeneratorDialogBase", "Jobs"))
+        self.concurrency_label.setText(_translate("StlGeneratorDialogBase", "Concurrent Jobs"))
+        item = self.jobs_table.horizontalHeaderItem(0)
+        item.setText(_translate("StlGeneratorDialogBase", "Layer"))
+        item = self.jobs_table.horizontalHeaderItem(1)
+        item.setText(_translate("StlGeneratorDialogBase", "Status"))
+        item = self.jobs_table.horizontalHeaderItem(2)
+        item.setText(_translate("StlGeneratorDialogBase", "Progress"))
+        self.generateSTL_button.setText(_translate("StlGeneratorDialogBase", "Generate STL"))
+        self.cancel_button.setText(_translate("StlGeneratorDialogBase", "Cancel Jobs"))
+        self.exit_button.setText(_translate("StlGeneratorDialogBase", "Exit"))
+from qgis.gui import QgsCheckableComboBox, QgsFileWidget
+from . import resources_rc
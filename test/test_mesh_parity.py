@@ -0,0 +1,517 @@
+# coding=utf-8
+"""Parity tests of the meshing engines.
+
+Every engine (the serial and pipelined modes, small bands meshed by several threads, small blocks,
+memory mapped height grids and each output format) has to produce the same mesh for the same DEM,
+and so do the models merged from shards. The C++ library is compared on the DEMs it already meshes the same way, and is expected to fail on the others. The engines that merge the flat cells and the straight walls are compared
+with each other, and have to cover the same surface, floor and walls as the others without folding any triangle over. The DEMs are random
+validity masks and heights, together with the patterns that are the hardest on the wall logic:
+single pixel islands, pixels that only touch diagonally and one pixel wide strips.
+
+.. note:: This program is free software; you can redistribute it and/or modify
+     it under the terms of the GNU General Public License as published by
+     the Free Software Foundation; either version 2 of the License, or
+     (at your option) any later version.
+
+"""
+
+__author__ = 'suheyb1@gmail.com'
+__date__ = '2026-10-19'
+__copyright__ = 'Copyright 2022, Suheyb Aden'
+
+import gzip
+import json
+import os
+import re
+import shutil
+import struct
+import tempfile
+import unittest
+import zipfile
+from collections import Counter
+
+import numpy as np
+from osgeo import gdal
+
+from ..mesh_generator import MeshGenerator, MissingDLLError
+from ..mesh_shards import merge_shards, mesh_shard, plan_shards
+from ..mesh_validator import EdgeValidator, read_stl_triangles, validate_stl
+from ..output_formats import OUTPUT_FORMATS
+
+NO_DATA_VALUE = -9999.0
+
+PLY_HEADER_SIZE = 512
+
+# Seed of the random DEMs. A failing case prints its seed and index so it can be reproduced
+SEED = 20221
+RANDOM_CASES = 40
+
+# Pathological DEMs the C++ engine doesn't mesh like the Python engine yet. It puts a wall along
+# every triangle edge whose ends both touch no data, including the diagonals of the cells on the
+# rim of the model, so these meshes get duplicate and non manifold edges
+DLL_DIVERGENT_DEMS = {"full", "diagonal blocks", "strips", "one pixel hole"}
+
+# Parameters every engine is run with on top of the model settings
+# The reference engine comes first, the others are compared against it
+ENGINES = {
+    "pipelined": {"outputFormat": "stl", "pipelined": True},
+    "serial": {"outputFormat": "stl"},
+    "banded": {"outputFormat": "stl", "bandSize": 8},
+    "banded-threads": {"outputFormat": "stl", "bandSize": 8, "meshWorkers": 3, "pipelined": True},
+    # Blocks of two rows, so the full blocks are meshed from the templates and the empty ones are skipped
+    "blocks": {"outputFormat": "stl", "blockSize": 2},
+    "blocks-ply": {"outputFormat": "ply", "bandSize": 8, "blockSize": 2, "pipelined": True},
+    # Height grids read into a temporary file and mapped into memory, in one band and in bands of a few rows
+    "out-of-core": {"outputFormat": "stl", "outOfCore": True, "pipelined": True},
+    "out-of-core-banded": {"outputFormat": "stl", "outOfCore": True, "bandSize": 8, "pipelined": True},
+    "stl.gz": {"outputFormat": "stl.gz", "meshWorkers": 2, "pipelined": True},
+    "ply": {"outputFormat": "ply", "bandSize": 8, "pipelined": True},
+    "obj": {"outputFormat": "obj", "bandSize": 8, "pipelined": True},
+    "3mf": {"outputFormat": "3mf", "bandSize": 8, "pipelined": True},
+    "glb": {"outputFormat": "glb", "bandSize": 8, "pipelined": True},
+}
+
+# The same engines with the flat cells and the straight walls merged, compared against the first one of them
+# The rectangles and the wall strips end at the edges of the bands, so all of them use the same (narrow) bands
+MERGED_ENGINES = {
+    "merged": {"outputFormat": "stl", "bandSize": 40, "mergeCoplanar": True, "pipelined": True},
+    "merged serial": {"outputFormat": "stl", "bandSize": 40, "mergeCoplanar": True},
+    "merged threads": {"outputFormat": "stl", "bandSize": 40, "mergeCoplanar": True, "meshWorkers": 3,
+                       "pipelined": True},
+    "merged blocks": {"outputFormat": "stl", "bandSize": 40, "mergeCoplanar": True, "blockSize": 1, "pipelined": True},
+    "merged stl.gz": {"outputFormat": "stl.gz", "bandSize": 40, "mergeCoplanar": True, "pipelined": True},
+    "merged ply": {"outputFormat": "ply", "bandSize": 40, "mergeCoplanar": True, "pipelined": True},
+    "merged obj": {"outputFormat": "obj", "bandSize": 40, "mergeCoplanar": True, "pipelined": True},
+    "merged 3mf": {"outputFormat": "3mf", "bandSize": 40, "mergeCoplanar": True, "pipelined": True},
+    "merged glb": {"outputFormat": "glb", "bandSize": 40, "mergeCoplanar": True, "pipelined": True},
+}
+
+# Engines the shards of a model are meshed with, the merged model has to be the same as the model meshed in one go
+# The STL shards are concatenated and the other formats welded along the seams
+SHARDED_ENGINES = {
+    "shards": {"outputFormat": "stl"},
+    "shards stl.gz": {"outputFormat": "stl.gz", "bandSize": 8},
+    "shards ply": {"outputFormat": "ply", "bandSize": 8},
+    "shards merged": {"outputFormat": "stl", "bandSize": 40, "mergeCoplanar": True},
+    "shards merged obj": {"outputFormat": "obj", "bandSize": 40, "mergeCoplanar": True},
+}
+
+# Engines that write the triangles in the same order as their reference, so their STLs hold the same bytes
+# after the header. The others mesh in narrower bands or blocks, which changes the order of the triangles
+BYTE_IDENTICAL = {"serial", "out-of-core", "stl.gz", "merged serial", "merged threads", "merged stl.gz"}
+
+
+def random_dem(rng):
+    """Returns random heights with a random share of no data pixels."""
+    rows, columns = rng.integers(2, 14, 2)
+    heights = rng.random((rows, columns)) * rng.choice([1, 100, 5000])
+    # Some DEMs only have a few distinct heights, like quantized integer DEMs
+    if rng.random() < 0.3:
+        heights = np.round(heights / heights.max() * 3)
+    heights[rng.random((rows, columns)) < rng.random() * 0.7] = NO_DATA_VALUE
+
+    # Keep two valid pixels of different heights, so the elevation range isn't empty
+    heights.flat[0] = 0
+    heights.flat[-1] = 4
+    return heights
+
+
+def pathological_dems():
+    """Returns the validity patterns the wall logic has special cases for, as (name, heights)."""
+    rng = np.random.default_rng(SEED)
+
+    def with_mask(mask):
+        heights = rng.random(mask.shape) * 50 + 1
+        heights[~mask] = NO_DATA_VALUE
+        return heights
+
+    rows, columns = np.indices((9, 11))
+    dems = {
+        "full": with_mask(np.ones((9, 11), dtype=bool)),
+        # Every valid pixel only touches its neighbours diagonally
+        "checkerboard": with_mask((rows + columns) % 2 == 0),
+        # Islands of a single pixel, which have no cells of their own
+        "single pixels": with_mask((rows % 3 == 1) & (columns % 3 == 1)),
+        # Blocks of 2x2 pixels that only share a corner
+        "diagonal blocks": with_mask(((rows // 2) + (columns // 2)) % 2 == 0),
+        # One pixel wide strips and a one pixel wide hole
+        "strips": with_mask(columns % 3 != 1),
+        "one pixel hole": with_mask((rows != 4) | (columns != 5)),
+        # Diagonal lines of pixels, one of each orientation
+        "diagonals": with_mask((rows == columns) | (rows + columns == 10)),
+        "single row": with_mask(np.ones((1, 12), dtype=bool)),
+        "single column": with_mask(np.ones((12, 1), dtype=bool)),
+    }
+    return list(dems.items())
+
+
+def write_dem(path, heights):
+    dataset = gdal.GetDriverByName("GTiff").Create(path, heights.shape[1], heights.shape[0], 1, gdal.GDT_Float64)
+    dataset.SetGeoTransform((0, 1, 0, 0, 0, -1))
+    band = dataset.GetRasterBand(1)
+    band.SetNoDataValue(NO_DATA_VALUE)
+    band.WriteArray(heights)
+    dataset = None
+
+
+def read_triangles(path, output_format):
+    """Returns the corners of the triangles of a model file as a (n, 3, 3) array in millimetres."""
+    if output_format in ("stl", "stl.gz"):
+        return np.array(read_stl_triangles(path)["vertices"], dtype=np.float64)
+
+    if output_format == "ply":
+        with open(path, "rb") as f:
+            data = f.read()
+        header_end = data.index(b"end_header\n") + len(b"end_header\n")
+        header = data[:header_end].decode("ascii")
+        num_vertices = int(re.search(r"element vertex (\d+)", header).group(1))
+        num_faces = int(re.search(r"element face (\d+)", header).group(1))
+        vertices = np.frombuffer(data, dtype="<f4", count=num_vertices * 3, offset=header_end).reshape(-1, 3)
+        faces = np.frombuffer(data, dtype=np.dtype([("count", "u1"), ("ids", "<i4", (3,))]), count=num_faces,
+                              offset=header_end + vertices.nbytes)
+        return vertices.astype(np.float64)[faces["ids"]]
+
+    if output_format == "obj":
+        with open(path, "r", encoding="ascii") as f:
+            text = f.read()
+        vertices = np.array(re.findall(r"^v (\S+) (\S+) (\S+)$", text, re.M), dtype=np.float64).reshape(-1, 3)
+        faces = np.array(re.findall(r"^f (\d+) (\d+) (\d+)$", text, re.M), dtype=np.int64).reshape(-1, 3)
+        return vertices[faces - 1]
+
+    if output_format == "3mf":
+        with zipfile.ZipFile(path) as archive:
+            model = archive.read("3D/3dmodel.model").decode("ascii")
+        vertices = np.array(re.findall(r'<vertex x="(\S+)" y="(\S+)" z="(\S+)"/>', model),
+                            dtype=np.float64).reshape(-1, 3)
+        faces = np.array(re.findall(r'<triangle v1="(\d+)" v2="(\d+)" v3="(\d+)"/>', model),
+                         dtype=np.int64).reshape(-1, 3)
+        return vertices[faces]
+
+    if output_format == "glb":
+        with open(path, "rb") as f:
+            data = f.read()
+        json_length = struct.unpack_from("<I", data, 12)[0]
+        gltf = json.loads(data[20:20 + json_length])
+        if "meshes" not in gltf:
+            return np.empty((0, 3, 3))
+
+        binary = data[20 + json_length + 8:]
+        positions_view, indices_view = gltf["bufferViews"]
+        positions = np.frombuffer(binary, dtype="<u2", count=positions_view["byteLength"] // 2).reshape(-1, 4)[:, :3]
+        index_type = "<u2" if gltf["accessors"][1]["componentType"] == 5123 else "<u4"
+        indices = np.frombuffer(binary, dtype=index_type, count=gltf["accessors"][1]["count"],
+                                offset=indices_view["byteOffset"])
+
+        # Undo the quantization, leaving out the rotation into glTF's y up space and the scaling into metres
+        node = gltf["nodes"][0]
+        steps = np.array(node["scale"]) / 0.001
+        translation = node["translation"]
+        minimum = np.array([translation[0], -translation[2], translation[1]]) / 0.001
+        return (positions * steps + minimum)[indices.reshape(-1, 3)]
+
+    raise ValueError(f"Can't read {output_format} files")
+
+
+def count_vertices(path, output_format):
+    """Returns the number of vertices of a PLY or OBJ file, which is only the number of corners if they're welded."""
+    if output_format == "ply":
+        with open(path, "rb") as f:
+            header = f.read(PLY_HEADER_SIZE).decode("ascii", "replace")
+        return int(re.search(r"element vertex (\d+)", header).group(1))
+
+    with open(path, "r", encoding="ascii") as f:
+        return sum(1 for line in f if line.startswith("v "))
+
+
+def grid_triangles(triangles, line_width, bottom_level, base_height):
+    """
+    Turns the corners of the triangles into their grid positions and whether they're on the top surface.
+    Returns the (n, 3, 3) integer corners and the heights of the top corners by their grid position.
+    """
+    grid = np.empty(triangles.shape, dtype=np.int64)
+    grid[..., :2] = np.rint(triangles[..., :2] / line_width)
+    grid[..., 2] = triangles[..., 2] > bottom_level + base_height / 2
+
+    top = grid[..., 2].astype(bool)
+    heights = {}
+    for (x, y, _), z in zip(grid[top].tolist(), triangles[top][:, 2].tolist()):
+        heights.setdefault((x, y), z)
+    return grid, heights
+
+
+def triangle_multiset(grid):
+    """Counts the triangles, each one rotated to start at its smallest corner so the winding is kept."""
+    triangles = Counter()
+    for triangle in map(tuple, grid.reshape(-1, 3, 3).tolist()):
+        first = min(range(3), key=lambda i: triangle[i])
+        triangles[tuple(map(tuple, triangle[first:] + triangle[:first]))] += 1
+    return triangles
+
+
+def level_areas(grid):
+    """Returns twice the area of the surface triangles and of the floor triangles, with the sign of their winding."""
+    x, y, top = grid[..., 0], grid[..., 1], grid[..., 2]
+    doubled = (x[:, 1] - x[:, 0]) * (y[:, 2] - y[:, 0]) - (y[:, 1] - y[:, 0]) * (x[:, 2] - x[:, 0])
+    return int(doubled[top.all(axis=1)].sum()), int(doubled[~top.any(axis=1)].sum())
+
+
+def wall_areas(triangles, grid):
+    """
+    Returns twice the vector area of the triangles with corners on both the surface and the floor, and twice the sum
+    of their areas. The sum is only the same for two meshes of the same walls if none of the triangles fold over.
+    """
+    top = grid[..., 2]
+    walls = triangles[top.any(axis=1) & ~top.all(axis=1)].astype(np.float64)
+    doubled = np.cross(walls[:, 1] - walls[:, 0], walls[:, 2] - walls[:, 0])
+    return np.r_[doubled.sum(axis=0), np.linalg.norm(doubled, axis=1).sum()]
+
+
+def grid_validation(grid):
+    """Validates the mesh after welding the corners by their grid position."""
+    corners = grid.reshape(-1, 3)
+    _, ids = np.unique(corners, axis=0, return_inverse=True)
+    validator = EdgeValidator()
+    validator.add(ids.reshape(-1, 3))
+    return validator.finish().as_dict()
+
+
+class MeshParityTest(unittest.TestCase):
+    """Test all of the meshing engines generate the same mesh."""
+
+    def setUp(self):
+        """Runs before each test."""
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        """Runs after each test."""
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def model_parameters(self, heights, line_width, output_format):
+        rows, columns = heights.shape
+        return {
+            "printHeight": 10,
+            "baseHeight": 2,
+            "saveLocation": os.path.join(self.folder, "model" + OUTPUT_FORMATS[output_format].extension),
+            # Size the print bed so the DEM is meshed at its full resolution
+            "bedX": columns * line_width,
+            "bedY": rows * line_width,
+            "lineWidth": line_width,
+            "useCache": False,
+        }
+
+    def generate(self, dem, heights, line_width, settings, validate=False):
+        """Generates the model with the engine's settings and returns the MeshGenerator and the path of the file."""
+        parameters = self.model_parameters(heights, line_width, settings["outputFormat"])
+        parameters.update(settings)
+        parameters["validateMesh"] = validate
+
+        mesh_generator = MeshGenerator()
+        mesh_generator.generate_height_array(parameters, dem)
+        mesh_generator.manually_generate_stl()
+        return mesh_generator, parameters["saveLocation"]
+
+    def assert_engines_agree(self, name, dem, heights, line_width, engines):
+        """
+        Checks every engine generates the same mesh as the first one.
+        Returns the triangles of the reference engine, their grid corners and their validation results.
+        """
+        reference_engine = next(iter(engines))
+        reference, reference_path = self.generate(dem, heights, line_width, engines[reference_engine], validate=True)
+        with open(reference_path, "rb") as f:
+            header = f.read(80)
+            reference_bytes = f.read()
+        # The header carries the whole fingerprint of the inputs
+        self.assertIn(reference.fingerprint.encode("ascii"), header, name)
+        reference_triangles = read_triangles(reference_path, "stl")
+        reference_grid, reference_heights = grid_triangles(
+            reference_triangles, line_width, reference.bottomLevel, reference.baseHeight)
+        reference_multiset = triangle_multiset(reference_grid)
+        reference_validation = grid_validation(reference_grid)
+
+        # The validation done while writing, the one of the written file and the one of the grid have to agree
+        self.assertEqual(reference.validationResults[0][1].as_dict(), reference_validation, name)
+        self.assertEqual(validate_stl(reference_path).as_dict(), reference_validation, name)
+
+        for engine, settings in engines.items():
+            if engine == reference_engine:
+                continue
+
+            with self.subTest(case=name, engine=engine):
+                mesh_generator, path = self.generate(dem, heights, line_width, settings)
+                output_format = settings["outputFormat"]
+
+                if engine in BYTE_IDENTICAL:
+                    opener = gzip.open if output_format == "stl.gz" else open
+                    with opener(path, "rb") as f:
+                        self.assertEqual(f.read()[80:], reference_bytes)
+
+                triangles = read_triangles(path, output_format)
+                self.assertEqual(mesh_generator.numTriangles, len(triangles))
+
+                grid, heights_by_position = grid_triangles(
+                    triangles, line_width, mesh_generator.bottomLevel, mesh_generator.baseHeight)
+                self.assertEqual(triangle_multiset(grid), reference_multiset)
+                self.assertEqual(grid_validation(grid), reference_validation)
+
+                # The text and quantized formats round the coordinates
+                tolerance = 1e-3
+                if output_format == "glb":
+                    tolerance += (reference.printHeight + reference.baseHeight) / 65535
+                for position, z in heights_by_position.items():
+                    self.assertAlmostEqual(z, reference_heights[position], delta=tolerance)
+
+                os.remove(path)
+
+        return reference_triangles, reference_grid, reference_validation
+
+    def assert_parity(self, name, heights, line_width):
+        dem = os.path.join(self.folder, "dem.tif")
+        write_dem(dem, heights)
+
+        triangles, grid, validation = self.assert_engines_agree(name, dem, heights, line_width, ENGINES)
+        merged_triangles, merged_grid, merged_validation = self.assert_engines_agree(
+            name, dem, heights, line_width, MERGED_ENGINES)
+
+        # Merging has to cover exactly the same surface, floor and walls and not add or remove any defects
+        with self.subTest(case=name, engine="merged against unmerged"):
+            self.assertEqual(level_areas(merged_grid), level_areas(grid))
+            np.testing.assert_allclose(wall_areas(merged_triangles, merged_grid), wall_areas(triangles, grid),
+                                       rtol=1e-5, atol=1e-3)
+            self.assertLessEqual(len(merged_grid), len(grid))
+            for key in ("triangles", "edges"):
+                del validation[key], merged_validation[key]
+            self.assertEqual(merged_validation, validation)
+
+    def assert_shards_agree(self, name, heights, line_width, num_shards):
+        """Checks the models merged from shards are the same as the ones meshed in one go."""
+        dem = os.path.join(self.folder, "dem.tif")
+        write_dem(dem, heights)
+        manifest_path = os.path.join(self.folder, "model.shards.json")
+
+        references = {}
+        for merged, settings in ((False, ENGINES["pipelined"]), (True, MERGED_ENGINES["merged"])):
+            reference, reference_path = self.generate(dem, heights, line_width, settings)
+            triangles = read_triangles(reference_path, "stl")
+            grid, _ = grid_triangles(triangles, line_width, reference.bottomLevel, reference.baseHeight)
+            references[merged] = (triangles, grid, grid_validation(grid))
+
+        for engine, settings in SHARDED_ENGINES.items():
+            with self.subTest(case=name, engine=engine, shards=num_shards):
+                output_format = settings["outputFormat"]
+                parameters = self.model_parameters(heights, line_width, output_format)
+                parameters.update(settings)
+
+                manifest = plan_shards(parameters, dem, manifest_path, num_shards)
+                for index in range(len(manifest["shards"])):
+                    mesh_shard(manifest_path, index)
+                num_triangles, validation = merge_shards(manifest_path, validate=True)
+
+                triangles = read_triangles(parameters["saveLocation"], output_format)
+                self.assertEqual(num_triangles, len(triangles))
+                grid, _ = grid_triangles(triangles, line_width, manifest["bottomLevel"], parameters["baseHeight"])
+
+                reference_triangles, reference_grid, reference_validation = references[settings.get("mergeCoplanar", False)]
+                self.assertEqual(validation.as_dict(), grid_validation(grid))
+                self.assertEqual(grid_validation(grid), reference_validation)
+
+                # The vertices along the seams have to be welded too
+                if output_format in ("ply", "obj"):
+                    self.assertEqual(count_vertices(parameters["saveLocation"], output_format),
+                                     len(np.unique(grid.reshape(-1, 3), axis=0)))
+
+                # The rectangles and wall strips of the merged models end at the seams, like at the edges of the bands
+                if settings.get("mergeCoplanar"):
+                    self.assertEqual(level_areas(grid), level_areas(reference_grid))
+                    np.testing.assert_allclose(wall_areas(triangles, grid),
+                                               wall_areas(reference_triangles, reference_grid), rtol=1e-5, atol=1e-3)
+                else:
+                    self.assertEqual(triangle_multiset(grid), triangle_multiset(reference_grid))
+
+    def test_shards(self):
+        """Test the models merged from shards are the same as the ones meshed in one go."""
+        for name, heights in pathological_dems():
+            self.assert_shards_agree(name, heights, 0.4, 3)
+
+        rng = np.random.default_rng(SEED)
+        for index in range(RANDOM_CASES // 4):
+            heights = random_dem(rng)
+            self.assert_shards_agree(f"seed {SEED} case {index}", heights, 0.4, int(rng.integers(2, 6)))
+
+    def test_pathological_dems(self):
+        """Test the engines agree on the special cases of the wall logic."""
+        for name, heights in pathological_dems():
+            self.assert_parity(name, heights, 0.4)
+
+    def test_random_dems(self):
+        """Test the engines agree on random DEMs."""
+        rng = np.random.default_rng(SEED)
+        for index in range(RANDOM_CASES):
+            heights = random_dem(rng)
+            line_width = float(rng.choice([0.4, 1.0]))
+            self.assert_parity(f"seed {SEED} case {index}", heights, line_width)
+
+    def test_full_dem_is_watertight(self):
+        """Test a DEM without any no data generates a closed mesh."""
+        heights = pathological_dems()[0][1]
+        dem = os.path.join(self.folder, "dem.tif")
+        write_dem(dem, heights)
+
+        for settings in (ENGINES["pipelined"], MERGED_ENGINES["merged"]):
+            mesh_generator, _ = self.generate(dem, heights, 0.4, settings, validate=True)
+            self.assertTrue(mesh_generator.validationResults[0][1].isWatertight)
+
+    def assert_dll_agrees(self, names):
+        """Assert the C++ engine generates the same triangles as the Python engine on the named DEMs."""
+        for name, heights in pathological_dems():
+            if name not in names:
+                continue
+            dem = os.path.join(self.folder, "dem.tif")
+            write_dem(dem, heights)
+            reference, reference_path = self.generate(dem, heights, 0.4, ENGINES["pipelined"])
+            reference_grid, _ = grid_triangles(
+                read_triangles(reference_path, "stl"), 0.4, reference.bottomLevel, reference.baseHeight)
+
+            mesh_generator = MeshGenerator()
+            mesh_generator.generate_height_array(
+                self.model_parameters(heights, 0.4, "stl"), dem)
+            try:
+                mesh_generator.dll_write_stl()
+            except MissingDLLError:
+                self.skipTest("The MeshGenerator library isn't built for this platform")
+
+            grid, _ = grid_triangles(read_triangles(mesh_generator.saveLocation, "stl"), 0.4,
+                                     mesh_generator.bottomLevel, mesh_generator.baseHeight)
+            self.assertEqual(triangle_multiset(grid), triangle_multiset(reference_grid), name)
+            self.assertEqual(grid_validation(grid), grid_validation(reference_grid), name)
+
+    def test_dll_engine(self):
+        """Test the C++ engine generates the same triangles as the Python engine."""
+        self.assert_dll_agrees({name for name, _ in pathological_dems()} - DLL_DIVERGENT_DEMS)
+
+    # One test per DEM the C++ engine doesn't agree on yet, so fixing any of them shows up as an
+    # unexpected success. Move the DEM out of DLL_DIVERGENT_DEMS and drop its test once it passes
+    @unittest.expectedFailure
+    def test_dll_engine_full(self):
+        """Test the C++ engine generates the same triangles as the Python engine without no data."""
+        self.assert_dll_agrees({"full"})
+
+    @unittest.expectedFailure
+    def test_dll_engine_diagonal_blocks(self):
+        """Test the C++ engine generates the same triangles as the Python engine on diagonal blocks."""
+        self.assert_dll_agrees({"diagonal blocks"})
+
+    @unittest.expectedFailure
+    def test_dll_engine_strips(self):
+        """Test the C++ engine generates the same triangles as the Python engine on strips."""
+        self.assert_dll_agrees({"strips"})
+
+    @unittest.expectedFailure
+    def test_dll_engine_one_pixel_hole(self):
+        """Test the C++ engine generates the same triangles as the Python engine around a hole."""
+        self.assert_dll_agrees({"one pixel hole"})
+
+
+if __name__ == "__main__":
+    suite = unittest.makeSuite(MeshParityTest)
+    runner = unittest.TextTestRunner(verbosity=2)
+    runner.run(suite)